@@ -0,0 +1,347 @@
+"""
+Approximate nearest-neighbour index over workout embeddings (IVF, pure NumPy).
+
+The index clusters normalized embeddings with spherical k-means into n_lists inverted lists.
+A query is compared with the cluster centroids first and only the workouts of the n_probe
+closest clusters are scored, so a search touches about n_probe / n_lists of the library.
+Workouts carry metadata facets (category, fitness_level, duration_band) that searches can be
+filtered on; when the probed clusters hold fewer than k matching workouts, more clusters are probed.
+
+Build an index from the workout_embeddings_generator outputs of all pipelines:
+    python ann_index.py build --input ../workout_classifier_youtube/workouts_analyzed_w_embeddings.csv \
+        ../workout_classifier_hydrow/workouts_analyzed_w_embeddings.csv --output workouts_ivf.npz
+Add new workouts to an existing index:
+    python ann_index.py add --index workouts_ivf.npz --input new_workouts_w_embeddings.csv
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+# Facets stored for every workout
+FACETS = ("category", "fitness_level", "duration_band")
+
+# Upper bounds (minutes) of the duration bands
+DURATION_BANDS = ((15, "0-15"), (30, "15-30"), (45, "30-45"), (60, "45-60"))
+
+
+def duration_band(duration_minutes):
+    """Duration band of a workout, e.g. '15-30', or '' if the duration is unknown."""
+    try:
+        minutes = float(duration_minutes)
+    except (ValueError, TypeError):
+        return ""
+    if minutes != minutes:  # NaN
+        return ""
+    for upper, band in DURATION_BANDS:
+        if minutes < upper:
+            return band
+    return "60+"
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _spherical_kmeans(vectors, n_lists, iterations=20, seed=0, sample_size=256):
+    """Cluster normalized vectors by cosine similarity, training on at most sample_size points per list."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > n_lists * sample_size:
+        vectors = vectors[rng.choice(len(vectors), n_lists * sample_size, replace=False)]
+
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_lists)
+
+        # Re-seed empty clusters with random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index with cosine similarity and facet filters."""
+
+    def __init__(self, centroids, n_probe=8):
+        """
+        Args:
+            centroids (np.ndarray): (n_lists x dim) normalized cluster centroids, see IVFIndex.train
+            n_probe (int): Number of clusters scanned per search
+        """
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.n_probe = n_probe
+        self.dim = self.centroids.shape[1]
+
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.ids = []
+        self.facets = {name: (np.zeros(0, dtype=np.int32), []) for name in FACETS}
+        self._id_rows = {}
+        self._lists = None
+
+    @classmethod
+    def train(cls, vectors, n_lists=None, n_probe=8, iterations=20, seed=0):
+        """
+        Train the cluster centroids on a sample of embeddings.
+
+        Args:
+            vectors (np.ndarray): (n x dim) embeddings
+            n_lists (int, optional): Number of clusters, about sqrt(n) by default
+
+        Returns:
+            IVFIndex: Empty index with trained centroids
+        """
+        vectors = _normalize(vectors)
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+        return cls(_spherical_kmeans(vectors, n_lists, iterations, seed), n_probe)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, ids, vectors, facets=None, chunk_size=4096):
+        """
+        Insert workouts. Workouts whose id is already indexed are skipped.
+
+        Args:
+            ids (list): Workout ids
+            vectors (np.ndarray): (n x dim) embeddings
+            facets (list, optional): Facet values per workout, dicts with FACETS keys
+
+        Returns:
+            int: Number of inserted workouts
+        """
+        vectors = np.asarray(vectors)
+        facets = facets if facets is not None else [{}] * len(ids)
+        keep = []
+        seen = set()
+        for i, workout_id in enumerate(ids):
+            workout_id = str(workout_id)
+            if workout_id not in self._id_rows and workout_id not in seen:
+                seen.add(workout_id)
+                keep.append(i)
+        if not keep:
+            return 0
+
+        new_vectors = _normalize(vectors[keep])
+        new_assign = np.concatenate([
+            np.argmax(new_vectors[start:start + chunk_size] @ self.centroids.T, axis=1)
+            for start in range(0, len(new_vectors), chunk_size)
+        ]).astype(np.int32)
+
+        for i in keep:
+            self._id_rows[str(ids[i])] = len(self.ids)
+            self.ids.append(str(ids[i]))
+        self.vectors = np.concatenate([self.vectors, new_vectors])
+        self.assign = np.concatenate([self.assign, new_assign])
+
+        for name in FACETS:
+            codes, vocab = self.facets[name]
+            lookup = {value: code for code, value in enumerate(vocab)}
+            new_codes = []
+            for i in keep:
+                value = str(facets[i].get(name, "") or "").lower()
+                if value not in lookup:
+                    lookup[value] = len(vocab)
+                    vocab.append(value)
+                new_codes.append(lookup[value])
+            self.facets[name] = (np.concatenate([codes, np.asarray(new_codes, dtype=np.int32)]), vocab)
+
+        self._lists = None
+        return len(keep)
+
+    def _inverted_lists(self):
+        """Row indices of every cluster, rebuilt after inserts."""
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            counts = np.bincount(self.assign, minlength=self.n_lists)
+            self._lists = np.split(order, np.cumsum(counts)[:-1])
+        return self._lists
+
+    def _filter_mask(self, rows, filters):
+        """Boolean mask of the rows matching all facet filters."""
+        mask = np.ones(len(rows), dtype=bool)
+        for name, values in (filters or {}).items():
+            codes, vocab = self.facets[name]
+            if isinstance(values, str):
+                values = [values]
+            wanted = [vocab.index(str(v).lower()) for v in values if str(v).lower() in vocab]
+            mask &= np.isin(codes[rows], wanted)
+        return mask
+
+    def search(self, query, k=10, n_probe=None, filters=None):
+        """
+        Find the k workouts most similar to a query embedding.
+
+        Args:
+            query (np.ndarray): Query embedding
+            k (int): Number of results
+            n_probe (int, optional): Clusters to scan, defaults to the index setting
+            filters (dict, optional): Facet -> value or list of values, e.g. {"fitness_level": "beginner"}
+
+        Returns:
+            tuple: (ids, scores) of the results, most similar first
+        """
+        if not len(self):
+            return [], np.zeros(0, dtype=np.float32)
+
+        query = _normalize(query).reshape(-1)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        cluster_order = np.argsort(-(self.centroids @ query), kind="stable")
+        lists = self._inverted_lists()
+
+        # Probe more clusters until there are enough matching candidates
+        probed = 0
+        candidates = []
+        num_candidates = 0
+        while probed < self.n_lists and (probed < n_probe or num_candidates < k):
+            rows = lists[cluster_order[probed]]
+            if filters:
+                rows = rows[self._filter_mask(rows, filters)]
+            candidates.append(rows)
+            num_candidates += len(rows)
+            probed += 1
+
+        rows = np.concatenate(candidates) if candidates else np.zeros(0, dtype=np.int64)
+        if not len(rows):
+            return [], np.zeros(0, dtype=np.float32)
+
+        scores = self.vectors[rows] @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((rows[top], -scores[top]))]
+        return [self.ids[row] for row in rows[top]], scores[top]
+
+    def rows_of(self, ids):
+        """Row positions of indexed workout ids."""
+        return [self._id_rows[str(workout_id)] for workout_id in ids]
+
+    def save(self, path):
+        """Save the index to a .npz file."""
+        arrays = {
+            "centroids": self.centroids,
+            "vectors": self.vectors,
+            "assign": self.assign,
+            "ids": np.asarray(self.ids, dtype=str),
+            "meta": np.asarray(json.dumps({
+                "n_probe": self.n_probe,
+                "facets": {name: vocab for name, (_, vocab) in self.facets.items()}
+            }))
+        }
+        for name, (codes, _) in self.facets.items():
+            arrays[f"facet_{name}"] = codes
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with IVFIndex.save."""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            index = cls(data["centroids"], meta["n_probe"])
+            index.vectors = data["vectors"]
+            index.assign = data["assign"]
+            index.ids = [str(workout_id) for workout_id in data["ids"]]
+            index.facets = {name: (data[f"facet_{name}"], vocab) for name, vocab in meta["facets"].items()}
+        index._id_rows = {workout_id: row for row, workout_id in enumerate(index.ids)}
+        return index
+
+
+def workout_facets(workout):
+    """Facet values of a workout row (dict or pandas Series)."""
+    return {
+        "category": workout.get("category", ""),
+        "fitness_level": workout.get("fitness_level", ""),
+        "duration_band": duration_band(workout.get("duration_minutes")),
+    }
+
+
+def load_embedding_outputs(csv_path):
+    """
+    Read a workouts_analyzed_w_embeddings.csv output of workout_embeddings_generator.
+
+    The embeddings come from the .npy matrix next to the CSV if there is one,
+    otherwise from the CSV embedding column.
+
+    Returns:
+        tuple: (ids, vectors, facets) of the workouts that have an embedding
+    """
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        workouts = {row.get('video_id'): row for row in csv.DictReader(f) if row.get('video_id')}
+
+    ids = []
+    vectors = []
+    matrix_path = os.path.splitext(csv_path)[0] + ".npy"
+    index_path = os.path.splitext(csv_path)[0] + ".ids.json"
+    if os.path.exists(matrix_path) and os.path.exists(index_path):
+        matrix = np.load(matrix_path, mmap_mode='r')
+        with open(index_path, 'r', encoding='utf-8') as f:
+            matrix_ids = json.load(f)
+        for row, workout_id in enumerate(matrix_ids):
+            if workout_id in workouts:
+                ids.append(workout_id)
+                vectors.append(matrix[row])
+    else:
+        for workout_id, workout in workouts.items():
+            if workout.get('embedding'):
+                ids.append(workout_id)
+                vectors.append(json.loads(workout['embedding']))
+
+    facets = [workout_facets(workouts[workout_id]) for workout_id in ids]
+    return ids, np.asarray(vectors, dtype=np.float32), facets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or extend the workout ANN index')
+    parser.add_argument('command', choices=['build', 'add'],
+                        help='build: train a new index; add: insert workouts into an existing index')
+    parser.add_argument('--input', type=str, nargs='+', required=True,
+                        help='workouts_analyzed_w_embeddings.csv files')
+    parser.add_argument('--index', type=str, default='workouts_ivf.npz',
+                        help='Index file to extend (add)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Index file to write (defaults to --index)')
+    parser.add_argument('--lists', type=int, default=None,
+                        help='Number of clusters (build), about sqrt(number of workouts) by default')
+    parser.add_argument('--probe', type=int, default=8,
+                        help='Number of clusters scanned per search (build)')
+    args = parser.parse_args()
+
+    ids, vectors, facets = [], [], []
+    for path in args.input:
+        file_ids, file_vectors, file_facets = load_embedding_outputs(path)
+        print(f"Loaded {len(file_ids)} workouts with embeddings from {path}")
+        ids += file_ids
+        vectors.append(file_vectors)
+        facets += file_facets
+    vectors = np.concatenate(vectors)
+
+    if args.command == 'build':
+        index = IVFIndex.train(vectors, n_lists=args.lists, n_probe=args.probe)
+    else:
+        index = IVFIndex.load(args.index)
+    added = index.add(ids, vectors, facets)
+
+    output = args.output or args.index
+    index.save(output)
+    print(f"Index with {len(index)} workouts in {index.n_lists} clusters saved to {output} ({added} added)")
+
+
+if __name__ == "__main__":
+    main()
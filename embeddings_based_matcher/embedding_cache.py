@@ -0,0 +1,156 @@
+"""
+Content-addressed cache of text embeddings.
+
+Embeddings are keyed by (model, sha256 of the text), so a workout or plan text is embedded
+once no matter where it comes from, and editing a text naturally misses the cache.
+Recently used embeddings are kept in an in-memory LRU; all embeddings are persisted as
+float32 blobs in a SQLite file, so repeated runs over an unchanged library need no API calls.
+A cache can be shared by the threads of one process (e.g. matcher_service.py).
+
+Usage:
+    cache = EmbeddingCache("embedding_cache.sqlite3")
+    embedding = cache.get("text-embedding-3-small", text)
+    if embedding is None:
+        cache.put("text-embedding-3-small", text, get_embedding_from_api(text))
+"""
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Default location of the persistent cache, next to the matcher inputs
+EMBEDDING_CACHE_FILE = "embedding_cache.sqlite3"
+
+# Default number of embeddings kept in memory
+DEFAULT_MEMORY_ITEMS = 20000
+
+
+def compute_hash(text):
+    """SHA-256 hex digest of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Embedding cache with an in-memory LRU in front of a SQLite file."""
+
+    def __init__(self, db_path=EMBEDDING_CACHE_FILE, max_memory_items=DEFAULT_MEMORY_ITEMS):
+        """
+        Args:
+            db_path (str): SQLite file, or None for a memory-only cache
+            max_memory_items (int): Number of embeddings kept in the in-memory LRU
+        """
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+        self.conn = None
+        if db_path:
+            self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                ) WITHOUT ROWID
+            """)
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _remember(self, key, embedding):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, model, text):
+        """
+        Look up the embedding of a text.
+
+        Returns:
+            np.ndarray or None: float32 embedding, or None if it was never cached
+        """
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model, texts):
+        """
+        Look up the embeddings of several texts.
+
+        Returns:
+            list: float32 embedding or None per text, in input order
+        """
+        with self._lock:
+            return self._get_many(model, texts)
+
+    def _get_many(self, model, texts):
+        keys = [(model, compute_hash(text)) for text in texts]
+        embeddings = [None] * len(texts)
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                embeddings[i] = self._memory[key]
+            else:
+                missing.setdefault(key[1], []).append(i)
+
+        if missing and self.conn is not None:
+            hashes = list(missing)
+            # Stay below SQLite's limit on query parameters
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT text_hash, embedding FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({', '.join('?' * len(chunk))})",
+                    [model] + chunk
+                ).fetchall()
+                for text_hash, blob in rows:
+                    embedding = np.frombuffer(blob, dtype=np.float32)
+                    self._remember((model, text_hash), embedding)
+                    for i in missing[text_hash]:
+                        embeddings[i] = embedding
+
+        found = sum(1 for embedding in embeddings if embedding is not None)
+        self.hits += found
+        self.misses += len(texts) - found
+        return embeddings
+
+    def put(self, model, text, embedding):
+        """Cache the embedding of a text."""
+        self.put_many(model, [(text, embedding)])
+
+    def put_many(self, model, items):
+        """
+        Cache several embeddings in one transaction.
+
+        Args:
+            model (str): Embedding model
+            items: Iterable of (text, embedding)
+        """
+        with self._lock:
+            self._put_many(model, items)
+
+    def _put_many(self, model, items):
+        rows = []
+        for text, embedding in items:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            text_hash = compute_hash(text)
+            self._remember((model, text_hash), embedding)
+            rows.append((model, text_hash, embedding.tobytes()))
+
+        if rows and self.conn is not None:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, embedding) VALUES (?, ?, ?)",
+                    rows
+                )
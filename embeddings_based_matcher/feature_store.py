@@ -0,0 +1,204 @@
+"""
+Precompiled workout features for the rule-based scoring.
+
+calculate_match_score lower-cases and str()-converts the workout fields on every comparison and
+parses durations again on every failure. This module compiles a workout library once into typed
+columns that WorkoutScoringEngine scores against:
+- integer codes plus the distinct lower-cased values of category, subcategory, vibes and fitness levels
+- float durations in minutes (same fallbacks as calculate_match_score)
+- fitness level ordinals (beginner 1, intermediate 2, advanced 3, 0 when unknown)
+
+The compiled features are saved as an .npz bundle next to the library CSV and reused while the
+CSV is unchanged (same size and modification time); otherwise they are compiled again.
+
+Compile ahead of a matching run:
+    python feature_store.py --input workouts_analyzed.csv
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Workout columns compiled to integer codes
+FEATURE_COLUMNS = ('category', 'subcategory', 'secondary_subcategory',
+                   'primary_vibe', 'secondary_vibe',
+                   'fitness_level', 'secondary_fitness_level', 'tertiary_fitness_level')
+
+# Fitness level columns that also get ordinals
+FITNESS_LEVEL_COLUMNS = ('fitness_level', 'secondary_fitness_level', 'tertiary_fitness_level')
+
+# Beginner < Intermediate < Advanced
+FITNESS_LEVELS = {'beginner': 1, 'intermediate': 2, 'advanced': 3}
+
+# Bumped when the compiled layout changes, so older bundles are compiled again
+FEATURE_STORE_VERSION = 1
+
+
+def parse_workout_duration(workout_row):
+    """Workout duration in minutes, with the same fallbacks as calculate_match_score."""
+    workout_duration = 30  # Default
+    try:
+        workout_duration = float(workout_row.get('duration_minutes', 30))
+    except (ValueError, TypeError):
+        # Try extracting from time format
+        duration_str = str(workout_row.get('duration', ''))
+        if ':' in duration_str:
+            try:
+                hours, minutes = duration_str.split(':')[:2]
+                workout_duration = int(hours) * 60 + int(minutes)
+                workout_duration /= 60  # Convert back to minutes
+            except (ValueError, IndexError):
+                pass
+    return workout_duration
+
+
+def _column_strings(df, column):
+    """Lowercased string values of a column, '' for every row if the column is missing."""
+    if column not in df.columns:
+        return [''] * len(df)
+    return [str(value).lower() for value in df[column]]
+
+
+def _factorize(strings):
+    """Return (codes, uniques) of a list of strings."""
+    codes, uniques = pd.factorize(pd.Series(strings, dtype=object), sort=False)
+    return codes.astype(np.int64), list(uniques)
+
+
+def fitness_level_ordinals(values):
+    """Ordinal of every lower-cased fitness level string, 0 when it is not a known level."""
+    return np.array([FITNESS_LEVELS.get(value, 0) for value in values], dtype=np.int8)
+
+
+class WorkoutFeatures:
+    """Typed columns of a workout library, one row per library row."""
+
+    def __init__(self, fields, durations, fitness_ordinals):
+        """
+        Args:
+            fields (dict): Column -> (codes, uniques): int codes per workout and the distinct lower-cased values
+            durations (np.ndarray): Duration in minutes per workout
+            fitness_ordinals (dict): Fitness level column -> ordinal per workout
+        """
+        self.fields = fields
+        self.durations = durations
+        self.fitness_ordinals = fitness_ordinals
+
+    def __len__(self):
+        return len(self.durations)
+
+    @classmethod
+    def compile(cls, workout_library):
+        """Compile the features of a workout library DataFrame."""
+        fields = {column: _factorize(_column_strings(workout_library, column)) for column in FEATURE_COLUMNS}
+        durations = np.array(
+            [parse_workout_duration(row) for _, row in workout_library.iterrows()],
+            dtype=np.float64
+        )
+        fitness_ordinals = {}
+        for column in FITNESS_LEVEL_COLUMNS:
+            codes, uniques = fields[column]
+            fitness_ordinals[column] = fitness_level_ordinals(uniques)[codes]
+        return cls(fields, durations, fitness_ordinals)
+
+    def save(self, path, source=None):
+        """
+        Save the features to an .npz bundle.
+
+        Args:
+            path (str): Destination .npz file
+            source (dict, optional): Size and modification time of the CSV the features were compiled from
+        """
+        arrays = {
+            "durations": self.durations,
+            "meta": np.asarray(json.dumps({
+                "version": FEATURE_STORE_VERSION,
+                "source": source,
+                "values": {column: uniques for column, (_, uniques) in self.fields.items()}
+            }))
+        }
+        for column, (codes, _) in self.fields.items():
+            arrays[f"codes_{column}"] = codes.astype(np.int32)
+        for column, ordinals in self.fitness_ordinals.items():
+            arrays[f"ordinals_{column}"] = ordinals
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load features saved with WorkoutFeatures.save.
+
+        Returns:
+            tuple: (features, source) - source as passed to save
+        """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != FEATURE_STORE_VERSION:
+                raise ValueError(f"{path} has feature store version {meta.get('version')}, "
+                                 f"expected {FEATURE_STORE_VERSION}")
+            fields = {column: (data[f"codes_{column}"].astype(np.int64), uniques)
+                      for column, uniques in meta["values"].items()}
+            fitness_ordinals = {column: data[f"ordinals_{column}"] for column in FITNESS_LEVEL_COLUMNS}
+            features = cls(fields, data["durations"], fitness_ordinals)
+        return features, meta.get("source")
+
+
+def feature_store_path(csv_path):
+    """Path of the compiled features that belong to a library CSV."""
+    return os.path.splitext(csv_path)[0] + "_features.npz"
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_workout_features(csv_path, workout_library=None, store_path=None):
+    """
+    Compiled features of a workout library CSV, compiled and saved when missing or outdated.
+
+    Args:
+        csv_path (str): Library CSV, e.g. workouts_analyzed.csv
+        workout_library (pd.DataFrame, optional): The CSV already loaded, saves reading it again
+        store_path (str, optional): .npz bundle, next to the CSV by default
+
+    Returns:
+        WorkoutFeatures: Features in library row order
+    """
+    store_path = store_path or feature_store_path(csv_path)
+    source = _source_signature(csv_path)
+
+    if os.path.exists(store_path):
+        try:
+            features, stored_source = WorkoutFeatures.load(store_path)
+            if stored_source == source and (workout_library is None or len(features) == len(workout_library)):
+                return features
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Ignoring feature store {store_path}: {e}")
+
+    if workout_library is None:
+        workout_library = pd.read_csv(csv_path)
+    print(f"Compiling features of {len(workout_library)} workouts to {store_path}")
+    features = WorkoutFeatures.compile(workout_library)
+    features.save(store_path, source)
+    return features
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile a workout library CSV into matcher features')
+    parser.add_argument('--input', type=str, default='workouts_analyzed.csv',
+                        help='Workout library CSV')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Feature bundle to write (defaults to <input>_features.npz)')
+    args = parser.parse_args()
+
+    output = args.output or feature_store_path(args.input)
+    features = WorkoutFeatures.compile(pd.read_csv(args.input))
+    features.save(output, _source_signature(args.input))
+    print(f"Features of {len(features)} workouts saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
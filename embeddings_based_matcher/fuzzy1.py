@@ -4,11 +4,19 @@ import json
 from datetime import datetime
 import re
 
+from scoring_engine import WorkoutScoringEngine, FUZZY1_WEIGHTS
+from feature_store import load_workout_features
+from plan_assignment import assign_plan, channel_codes, PLAN_CANDIDATES, NO_REPEAT_DAYS
+
+
+# Workout library the plan is matched against
+WORKOUT_LIBRARY_CSV = 'workouts_analyzed.csv'
+
 
 def load_data():
     """Load workout plan specifications and workout library data"""
     workout_plan = pd.read_csv('WorkoutPlanDaySpec.csv')
-    workout_library = pd.read_csv('workouts_analyzed.csv')
+    workout_library = pd.read_csv(WORKOUT_LIBRARY_CSV)
     return workout_plan, workout_library
 
 
@@ -178,29 +186,44 @@ def get_workout_essence(workout_row):
     return essence
 
 
-def match_workouts():
-    """Main function to match workouts with plan specifications"""
+def match_workouts(no_repeat_days=NO_REPEAT_DAYS, max_per_channel=None, diversity_penalty=0.0):
+    """
+    Main function to match workouts with plan specifications
+
+    Args:
+        no_repeat_days (int): Days before the same workout may be matched again, 0 to allow repeats
+        max_per_channel (int, optional): Most days of the plan matched to workouts of one channel
+        diversity_penalty (float): Points lost per pair of days within no_repeat_days sharing a channel
+    """
     # Load data
     workout_plan, workout_library = load_data()
 
     # Process plan data
     plan_data = extract_plan_info(workout_plan)
 
+    # Score all days against all workouts at once, keeping each day's best candidates
+    engine = WorkoutScoringEngine(workout_library, weights=FUZZY1_WEIGHTS,
+                                  features=load_workout_features(WORKOUT_LIBRARY_CSV, workout_library))
+    candidate_indices, candidate_scores = engine.top_k(plan_data, k=PLAN_CANDIDATES)
+
+    # Choose the workouts of the whole plan together (see plan_assignment.py)
+    best_rows, best_scores = assign_plan(candidate_indices, candidate_scores,
+                                         channels=channel_codes(workout_library),
+                                         no_repeat_days=no_repeat_days,
+                                         max_per_channel=max_per_channel,
+                                         diversity_penalty=diversity_penalty)
+
     # Match each day's plan with the best workout
     matched_workouts = []
 
-    for _, plan_row in plan_data.iterrows():
-        best_score = -1
+    for idx, plan_row in plan_data.iterrows():
         best_match = None
-        best_reasons = []
-
-        for _, workout_row in workout_library.iterrows():
-            score, reasons = calculate_match_score(plan_row, workout_row)
 
-            if score > best_score:
-                best_score = score
-                best_match = workout_row
-                best_reasons = reasons
+        if best_rows[idx] >= 0:
+            # All fuzzy1 points are integers
+            best_score = int(best_scores[idx])
+            best_match = workout_library.iloc[best_rows[idx]]
+            _, best_reasons = calculate_match_score(plan_row, best_match)
 
         if best_match is not None:
             workout_essence = get_workout_essence(best_match)
@@ -6,16 +6,38 @@ import re
 from openai import OpenAI
 from sklearn.metrics.pairwise import cosine_similarity
 from env_utils import load_api_keys
+from scoring_engine import WorkoutScoringEngine, FUZZY2_WEIGHTS
+from feature_store import load_workout_features
+from embedding_cache import EmbeddingCache, EMBEDDING_CACHE_FILE
+from ann_index import IVFIndex
+from plan_assignment import assign_plan, channel_codes, PLAN_CANDIDATES, NO_REPEAT_DAYS
 
 # Load API keys
 api_keys = load_api_keys()
 client = OpenAI(api_key=api_keys['OPENAI_API_KEY'])
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_SIZE = 1536  # Default embedding size for text-embedding-3-small
+# Texts per embeddings request
+EMBEDDING_BATCH_SIZE = 256
+
+# Libraries of at least this many workouts retrieve candidates from an ANN index before scoring
+ANN_MIN_WORKOUTS = 20000
+# Candidates per plan day retrieved from the ANN index
+ANN_CANDIDATES = 200
+
+# Embeddings of workout and plan texts, persisted between runs
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_FILE)
+
+
+# Workout library the plan is matched against
+WORKOUT_LIBRARY_CSV = 'workouts_analyzed.csv'
+
 
 def load_data():
     """Load workout plan specifications and workout library data"""
     workout_plan = pd.read_csv('WorkoutPlanDaySpec.csv')
-    workout_library = pd.read_csv('workouts_analyzed.csv')
+    workout_library = pd.read_csv(WORKOUT_LIBRARY_CSV)
     return workout_plan, workout_library
 
 
@@ -68,15 +90,32 @@ def extract_workout_details(workout_row):
     return title, description
 
 
-def get_embedding(text, model="text-embedding-3-small"):
+def get_embedding(text, model=EMBEDDING_MODEL):
     """Get OpenAI embedding for a given text"""
-    text = text.replace("\n", " ")
-    try:
-        response = client.embeddings.create(input=[text], model=model)
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Error getting embedding: {e}")
-        return None
+    return get_embeddings([text], model)[0]
+
+
+def get_embeddings(texts, model=EMBEDDING_MODEL):
+    """Get OpenAI embeddings for several texts, only sending the texts that are not cached yet"""
+    texts = [text.replace("\n", " ") for text in texts]
+    embeddings = embedding_cache.get_many(model, texts)
+
+    # Embed every distinct uncached text once, in batches
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    fresh = {}
+    for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+        batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+        try:
+            response = client.embeddings.create(input=batch, model=model)
+            for item in response.data:
+                fresh[batch[item.index]] = item.embedding
+        except Exception as e:
+            print(f"Error getting embeddings: {e}")
+    embedding_cache.put_many(model, fresh.items())
+
+    return [embedding if embedding is not None else
+            (np.asarray(fresh[text], dtype=np.float32) if text in fresh else None)
+            for text, embedding in zip(texts, embeddings)]
 
 
 def create_plan_text(plan_row):
@@ -137,13 +176,13 @@ def precompute_workout_embeddings(workout_library):
         text = create_workout_text(workout_row)
         texts.append(text)
         print('workout text', text)
-        embedding = get_embedding(text)
 
-        if embedding:
+    for embedding in get_embeddings(texts):
+        if embedding is not None:
             embeddings.append(embedding)
         else:
             # If embedding fails, use a zero vector
-            embeddings.append([0] * 1536)  # Default embedding size for text-embedding-3-small
+            embeddings.append(np.zeros(EMBEDDING_SIZE))
 
     return np.array(embeddings), texts
 
@@ -254,6 +293,44 @@ def calculate_match_score(plan_row, workout_row, plan_embedding, workout_embeddi
     return score, match_reasons
 
 
+def build_ann_index(workout_embeddings):
+    """
+    ANN index over the workout embeddings, or None for libraries small enough to score in full.
+
+    Returns:
+        IVFIndex or None: Index whose ids are library row positions
+    """
+    if len(workout_embeddings) < ANN_MIN_WORKOUTS:
+        return None
+    print(f"Building ANN index over {len(workout_embeddings)} workouts...")
+    index = IVFIndex.train(workout_embeddings)
+    index.add([str(i) for i in range(len(workout_embeddings))], workout_embeddings)
+    return index
+
+
+def top_k_workouts(engine, plan_data, plan_embeddings, k=1, index=None):
+    """
+    The k best workouts of every plan day.
+
+    With an index, only the most similar workouts per day are retrieved and scored;
+    otherwise all days are scored against all workouts at once.
+
+    Returns:
+        tuple: (indices, scores) per day, best match first; indices are library row positions
+    """
+    if index is None:
+        return engine.top_k(plan_data, k=k, plan_embeddings=plan_embeddings)
+
+    candidates = []
+    for plan_embedding in plan_embeddings:
+        if plan_embedding is None:
+            candidates.append(None)
+            continue
+        ids, _ = index.search(plan_embedding, k=max(k, ANN_CANDIDATES))
+        candidates.append([int(workout_id) for workout_id in ids])
+    return engine.top_k_candidates(plan_data, candidates, k=k, plan_embeddings=plan_embeddings)
+
+
 def get_workout_essence(workout_row):
     """Extract essence information from a workout"""
     title, description = extract_workout_details(workout_row)
@@ -272,8 +349,15 @@ def get_workout_essence(workout_row):
     return essence
 
 
-def match_workouts():
-    """Main function to match workouts with plan specifications"""
+def match_workouts(no_repeat_days=NO_REPEAT_DAYS, max_per_channel=None, diversity_penalty=0.0):
+    """
+    Main function to match workouts with plan specifications
+
+    Args:
+        no_repeat_days (int): Days before the same workout may be matched again, 0 to allow repeats
+        max_per_channel (int, optional): Most days of the plan matched to workouts of one channel
+        diversity_penalty (float): Points lost per pair of days within no_repeat_days sharing a channel
+    """
     # Load data
     workout_plan, workout_library = load_data()
 
@@ -284,31 +368,45 @@ def match_workouts():
     print("Computing workout embeddings...")
     workout_embeddings, workout_texts = precompute_workout_embeddings(workout_library)
 
-    # Match each day's plan with the best workout
-    matched_workouts = []
-
+    # Get embeddings for all plan days
+    plan_texts = []
     for idx, plan_row in plan_data.iterrows():
         print(f"Matching workout for day {idx + 1}/{len(plan_data)}...")
 
         # Get embedding for plan
         plan_text = create_plan_text(plan_row)
         print('plan_text', plan_text)
-        plan_embedding = get_embedding(plan_text)
+        plan_texts.append(plan_text)
+    plan_embeddings = get_embeddings(plan_texts)
+    print(f"Embedding cache: {embedding_cache.hits} hits, {embedding_cache.misses} misses")
+
+    engine = WorkoutScoringEngine(workout_library, workout_embeddings, weights=FUZZY2_WEIGHTS,
+                                  features=load_workout_features(WORKOUT_LIBRARY_CSV, workout_library))
+    index = build_ann_index(workout_embeddings)
+    candidate_indices, candidate_scores = top_k_workouts(engine, plan_data, plan_embeddings,
+                                                         k=PLAN_CANDIDATES, index=index)
+
+    # Choose the workouts of the whole plan together (see plan_assignment.py)
+    best_rows, best_scores = assign_plan(candidate_indices, candidate_scores,
+                                         channels=channel_codes(workout_library),
+                                         no_repeat_days=no_repeat_days,
+                                         max_per_channel=max_per_channel,
+                                         diversity_penalty=diversity_penalty)
 
-        best_score = -1
+    # Match each day's plan with the best workout
+    matched_workouts = []
+
+    for idx, plan_row in plan_data.iterrows():
+        plan_text = plan_texts[idx]
+        best_score = best_scores[idx]
         best_match = None
-        best_reasons = []
-        best_workout_text = ""
-
-        for workout_idx, workout_row in workout_library.iterrows():
-            workout_embedding = workout_embeddings[workout_idx]
-            score, reasons = calculate_match_score(plan_row, workout_row, plan_embedding, workout_embedding)
-
-            if score > best_score:
-                best_score = score
-                best_match = workout_row
-                best_reasons = reasons
-                best_workout_text = workout_texts[workout_idx]
+
+        if best_rows[idx] >= 0:
+            workout_idx = best_rows[idx]
+            best_match = workout_library.iloc[workout_idx]
+            _, best_reasons = calculate_match_score(plan_row, best_match, plan_embeddings[idx],
+                                                    workout_embeddings[workout_idx])
+            best_workout_text = workout_texts[workout_idx]
 
         if best_match is not None:
             workout_essence = get_workout_essence(best_match)
@@ -0,0 +1,331 @@
+"""
+Long-running matcher service with a warm workout library.
+
+fuzzy1.py / fuzzy2.py load the library, compile its features and embed it on every run. The
+service does that once, keeps the library in memory and answers plan match requests over HTTP:
+    python matcher_service.py --library workouts_analyzed.csv --matcher fuzzy2 --port 8780
+
+    POST /match   {"plan": [{"day": "2025-06-02", "category": "Yoga", "subcategory": "Vinyasa",
+                             "primary_vibe": "The Zen Flow", "secondary_vibe": "",
+                             "fitness_level": "Beginner", "duration": 30}, ...],
+                   "k": 5, "assign": false}
+                  -> {"matches": [{"day", "plan", "results": [top-k matches with match_reasons]}], ...}
+                  With "assign": true every day also gets "assigned", the plan-level choice of
+                  plan_assignment.py ("no_repeat_days" and "max_per_channel" are passed through).
+    GET  /health  -> library size, matcher and load time
+    POST /reload  -> reload the library now
+
+Plan days take the fields of WorkoutPlanDaySpec.csv ("day" or "date"); missing fields get the
+same defaults as extract_plan_info. The library CSV is checked every --reload-interval seconds
+and reloaded in the background when it changed; requests keep using the previous library until
+the new one is ready. With fuzzy2, library and plan texts are embedded through the embedding
+cache, so a reload only embeds changed workouts.
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+from scoring_engine import WorkoutScoringEngine, FUZZY1_WEIGHTS, FUZZY2_WEIGHTS
+from feature_store import load_workout_features
+from plan_assignment import assign_plan, channel_codes, PLAN_CANDIDATES, NO_REPEAT_DAYS
+
+# Rule points per matcher module
+MATCHER_WEIGHTS = {'fuzzy1': FUZZY1_WEIGHTS, 'fuzzy2': FUZZY2_WEIGHTS}
+
+# Matches per plan day when the request does not ask for k
+DEFAULT_K = 5
+# Most matches per plan day a request may ask for
+MAX_K = 100
+
+# Plan day fields, as in WorkoutPlanDaySpec.csv
+PLAN_COLUMNS = ('date', 'duration', 'category', 'subcategory', 'primary_vibe', 'secondary_vibe', 'fitness_level')
+
+
+def _json_value(value):
+    """Plain JSON value of a library cell: NumPy scalars unwrapped, NaN as None."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def library_signature(csv_path):
+    """Size and modification time of the library CSV, to notice when it changes."""
+    stat = os.stat(csv_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class WarmLibrary:
+    """Everything a match request needs that only depends on the library: loaded once per CSV version."""
+
+    def __init__(self, csv_path, matcher):
+        """
+        Args:
+            csv_path (str): Workout library CSV
+            matcher (module): fuzzy1 or fuzzy2
+        """
+        start = time.monotonic()
+        self.signature = library_signature(csv_path)
+        self.matcher = matcher
+        self.workout_library = pd.read_csv(csv_path)
+        features = load_workout_features(csv_path, self.workout_library)
+
+        self.workout_embeddings = None
+        self.index = None
+        if matcher.__name__ == 'fuzzy2':
+            self.workout_embeddings, _ = matcher.precompute_workout_embeddings(self.workout_library)
+            self.index = matcher.build_ann_index(self.workout_embeddings)
+
+        self.engine = WorkoutScoringEngine(self.workout_library, self.workout_embeddings,
+                                           weights=MATCHER_WEIGHTS[matcher.__name__], features=features)
+        self.channels = channel_codes(self.workout_library)
+        self.loaded_at = time.time()
+        self.load_seconds = round(time.monotonic() - start, 3)
+
+    def __len__(self):
+        return len(self.workout_library)
+
+    def plan_frame(self, plan_days):
+        """Plan days of a request as extract_plan_info returns them."""
+        rows = []
+        for day in plan_days:
+            row = {column: day.get(column) for column in PLAN_COLUMNS}
+            if row['date'] is None:
+                row['date'] = day.get('day', '')
+            rows.append(row)
+        workout_plan = pd.DataFrame(rows, columns=list(PLAN_COLUMNS)).astype(object)
+        return self.matcher.extract_plan_info(workout_plan.where(pd.notna(workout_plan), None))
+
+    def describe(self, plan_row, row, score, plan_embedding=None):
+        """One match of a plan day, with the match reasons of calculate_match_score."""
+        workout_row = self.workout_library.iloc[row]
+        if self.workout_embeddings is not None:
+            _, reasons = self.matcher.calculate_match_score(plan_row, workout_row, plan_embedding,
+                                                            self.workout_embeddings[row])
+        else:
+            _, reasons = self.matcher.calculate_match_score(plan_row, workout_row)
+        score = float(score)
+        return {
+            'workout': {
+                'id': _json_value(workout_row.get('video_id', '')),
+                'title': _json_value(workout_row.get('video_title', '')),
+                'url': _json_value(workout_row.get('video_url', '')),
+                'category': _json_value(workout_row.get('category', '')),
+                'subcategory': _json_value(workout_row.get('subcategory', '')),
+                'duration': _json_value(workout_row.get('duration', ''))
+            },
+            'match_score': round(score, 2),
+            'match_quality': 'Excellent' if score >= 80 else 'Good' if score >= 60 else 'Fair',
+            'match_reasons': reasons,
+            'workout_essence': {key: _json_value(value)
+                                for key, value in self.matcher.get_workout_essence(workout_row).items()}
+        }
+
+    def match(self, plan_days, k=DEFAULT_K, assign=False, no_repeat_days=NO_REPEAT_DAYS, max_per_channel=None):
+        """
+        Match the days of one plan.
+
+        Args:
+            plan_days (list): Plan day dicts
+            k (int): Matches per day
+            assign (bool): Whether to add the plan-level assignment of every day
+            no_repeat_days (int): No-repeat window of the assignment
+            max_per_channel (int, optional): Channel cap of the assignment
+
+        Returns:
+            list: Per day: day, plan fields, top-k results and, if assign, the assigned match
+        """
+        plan_data = self.plan_frame(plan_days)
+        if not len(plan_data) or not len(self):
+            return [{'day': _json_value(plan_row.get('day', '')), 'results': []} for _, plan_row in plan_data.iterrows()]
+
+        plan_embeddings = None
+        if self.workout_embeddings is not None:
+            plan_embeddings = self.matcher.get_embeddings(
+                [self.matcher.create_plan_text(plan_row) for _, plan_row in plan_data.iterrows()])
+
+        search_k = max(k, PLAN_CANDIDATES) if assign else k
+        if self.index is not None:
+            indices, scores = self.matcher.top_k_workouts(self.engine, plan_data, plan_embeddings,
+                                                          k=search_k, index=self.index)
+        else:
+            indices, scores = self.engine.top_k(plan_data, k=search_k, plan_embeddings=plan_embeddings)
+
+        assigned_rows = assigned_scores = None
+        if assign:
+            assigned_rows, assigned_scores = assign_plan(indices, scores, channels=self.channels,
+                                                         no_repeat_days=no_repeat_days,
+                                                         max_per_channel=max_per_channel)
+
+        matches = []
+        for day, (_, plan_row) in enumerate(plan_data.iterrows()):
+            plan_embedding = plan_embeddings[day] if plan_embeddings is not None else None
+            match = {
+                'day': _json_value(plan_row.get('day', '')),
+                'plan': {key: _json_value(plan_row.get(key, '')) for key in
+                         ('category', 'subcategory', 'primary_vibe', 'secondary_vibe', 'fitness_level', 'duration')},
+                'results': [self.describe(plan_row, row, score, plan_embedding)
+                            for row, score in zip(indices[day][:k], scores[day][:k])]
+            }
+            if assign:
+                match['assigned'] = (self.describe(plan_row, assigned_rows[day], assigned_scores[day], plan_embedding)
+                                     if assigned_rows[day] >= 0 else None)
+            matches.append(match)
+        return matches
+
+
+class MatcherService:
+    """Holds the current WarmLibrary and swaps in a new one when the library CSV changes."""
+
+    def __init__(self, csv_path, matcher_name='fuzzy2'):
+        self.csv_path = csv_path
+        self.matcher_name = matcher_name
+        # Imported here: fuzzy2 creates its OpenAI client on import
+        self.matcher = importlib.import_module(matcher_name)
+        self._reload_lock = threading.Lock()
+        self.library = WarmLibrary(csv_path, self.matcher)
+        print(f"Loaded {len(self.library)} workouts from {csv_path} in {self.library.load_seconds}s")
+
+    def reload(self, force=False):
+        """
+        Load the library again if the CSV changed (or always, with force).
+
+        Returns:
+            bool: Whether a new library was swapped in
+        """
+        with self._reload_lock:
+            try:
+                if not force and library_signature(self.csv_path) == self.library.signature:
+                    return False
+                library = WarmLibrary(self.csv_path, self.matcher)
+            except Exception as e:
+                print(f"Reloading {self.csv_path} failed, keeping the loaded library: {e}")
+                return False
+            # Requests in flight keep the library they started with
+            self.library = library
+            print(f"Reloaded {len(library)} workouts from {self.csv_path} in {library.load_seconds}s")
+            return True
+
+    def watch(self, interval):
+        """Check the library CSV for changes every interval seconds, in a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.reload()
+        threading.Thread(target=run, daemon=True).start()
+
+    def health(self):
+        library = self.library
+        return {
+            'status': 'ok',
+            'matcher': self.matcher_name,
+            'library': self.csv_path,
+            'workouts': len(library),
+            'loaded_at': library.loaded_at,
+            'load_seconds': library.load_seconds
+        }
+
+    def handle_match(self, body):
+        """Answer a /match request body; raises ValueError for invalid requests."""
+        plan_days = body.get('plan')
+        if not isinstance(plan_days, list) or not all(isinstance(day, dict) for day in plan_days):
+            raise ValueError("'plan' must be a list of plan day objects")
+        k = body.get('k', DEFAULT_K)
+        if not isinstance(k, int) or not 1 <= k <= MAX_K:
+            raise ValueError(f"'k' must be an integer between 1 and {MAX_K}")
+        no_repeat_days = body.get('no_repeat_days', NO_REPEAT_DAYS)
+        max_per_channel = body.get('max_per_channel')
+        if not isinstance(no_repeat_days, int) or (max_per_channel is not None and not isinstance(max_per_channel, int)):
+            raise ValueError("'no_repeat_days' and 'max_per_channel' must be integers")
+
+        start = time.monotonic()
+        library = self.library
+        matches = library.match(plan_days, k=k, assign=bool(body.get('assign', False)),
+                                no_repeat_days=no_repeat_days, max_per_channel=max_per_channel)
+        return {
+            'matches': matches,
+            'workouts': len(library),
+            'loaded_at': library.loaded_at,
+            'seconds': round(time.monotonic() - start, 4)
+        }
+
+
+def make_handler(service):
+    class MatcherHandler(BaseHTTPRequestHandler):
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, service.health())
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path == "/reload":
+                self._send(200, {"reloaded": service.reload(force=True), **service.health()})
+                return
+            if self.path != "/match":
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError("Request body must be a JSON object")
+                self._send(200, service.handle_match(body))
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                print(f"Error matching plan: {e}")
+                self._send(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return MatcherHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve workout plan matching over HTTP with a warm library')
+    parser.add_argument('--library', type=str, default='workouts_analyzed.csv',
+                        help='Workout library CSV')
+    parser.add_argument('--matcher', type=str, choices=sorted(MATCHER_WEIGHTS), default='fuzzy2',
+                        help='fuzzy1: rule-based scores; fuzzy2: rules plus embedding similarity')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--reload-interval', type=float, default=5.0,
+                        help='Seconds between checks of the library CSV for changes, 0 to disable')
+    args = parser.parse_args()
+
+    service = MatcherService(args.library, args.matcher)
+    if args.reload_interval > 0:
+        service.watch(args.reload_interval)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Matcher service on http://{args.host}:{args.port} (POST /match, GET /health, POST /reload)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
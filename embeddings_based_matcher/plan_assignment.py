@@ -0,0 +1,178 @@
+"""
+Plan-level assignment of workouts to plan days.
+
+Picking the best workout for every day on its own can give the same workout to every matching
+day. assign_plan chooses the workouts of all days together, from each day's scored candidates
+(WorkoutScoringEngine.top_k / top_k_candidates, so scores keep the calculate_match_score semantics):
+- no-repeat window: a workout is not used on two days fewer than no_repeat_days apart
+- per-channel cap: at most max_per_channel days of the plan get a workout of the same channel
+- diversity: every pair of days within the window that share a channel costs diversity_penalty points
+
+Exact assignment (Hungarian / min-cost flow) cannot express windows or caps, so the solver is a
+greedy heuristic: (day, candidate) pairs are taken best first, re-scoring a pair lazily when the
+penalty of its channel has grown. It then improves single days within time_limit seconds. Without
+constraints every day gets its top candidate, as the per-day argmax did.
+
+Usage:
+    indices, scores = engine.top_k(plan_data, k=PLAN_CANDIDATES)
+    assignment = assign_plan(indices, scores, channels=channel_codes, no_repeat_days=7)
+"""
+import bisect
+import heapq
+import time
+
+import numpy as np
+import pandas as pd
+
+# Candidates per plan day the solver chooses from
+PLAN_CANDIDATES = 50
+# Days before the same workout may be used again
+NO_REPEAT_DAYS = 7
+# Seconds spent improving the greedy assignment
+ASSIGNMENT_TIME_LIMIT = 1.0
+
+
+def channel_codes(workout_library, column='channel_title'):
+    """
+    Channel of every library workout as an integer code, -1 where it is unknown.
+
+    Returns:
+        np.ndarray or None: Codes in library row order, None if the library has no channel column
+    """
+    if column not in workout_library.columns:
+        return None
+    values = workout_library[column].where(workout_library[column].astype(str).str.strip() != '')
+    codes, _ = pd.factorize(values, sort=False)
+    return codes.astype(np.int64)
+
+
+class _PlanState:
+    """Days assigned so far, indexed by workout and by channel for the constraint checks."""
+
+    def __init__(self, channels, no_repeat_days, max_per_channel, diversity_penalty):
+        self.channels = channels
+        self.no_repeat_days = no_repeat_days
+        self.max_per_channel = max_per_channel
+        self.diversity_penalty = diversity_penalty
+        self.workout_days = {}
+        self.channel_days = {}
+
+    def channel(self, row):
+        if self.channels is None:
+            return -1
+        return int(self.channels[row])
+
+    @staticmethod
+    def _near(days, day, window):
+        """Number of days in the sorted list that are fewer than window days away from day."""
+        if window <= 0:
+            return 0
+        return bisect.bisect_left(days, day + window) - bisect.bisect_right(days, day - window)
+
+    def feasible(self, day, row):
+        if self._near(self.workout_days.get(row, []), day, self.no_repeat_days):
+            return False
+        channel = self.channel(row)
+        if self.max_per_channel is not None and channel >= 0:
+            return len(self.channel_days.get(channel, [])) < self.max_per_channel
+        return True
+
+    def penalty(self, day, row):
+        """Diversity points lost by assigning row to day, given the other assigned days."""
+        channel = self.channel(row)
+        if not self.diversity_penalty or channel < 0:
+            return 0.0
+        return self.diversity_penalty * self._near(self.channel_days.get(channel, []), day, self.no_repeat_days)
+
+    def add(self, day, row):
+        bisect.insort(self.workout_days.setdefault(row, []), day)
+        channel = self.channel(row)
+        if channel >= 0:
+            bisect.insort(self.channel_days.setdefault(channel, []), day)
+
+    def remove(self, day, row):
+        self.workout_days[row].remove(day)
+        channel = self.channel(row)
+        if channel >= 0:
+            self.channel_days[channel].remove(day)
+
+
+def assign_plan(candidate_indices, candidate_scores, channels=None, no_repeat_days=NO_REPEAT_DAYS,
+                max_per_channel=None, diversity_penalty=0.0, time_limit=ASSIGNMENT_TIME_LIMIT):
+    """
+    Choose one workout per plan day under the plan constraints.
+
+    Args:
+        candidate_indices: Library row positions per day, best first ((days x k) array or list of arrays)
+        candidate_scores: Match score of every candidate, same shape
+        channels (np.ndarray, optional): Channel code per library row, -1 for unknown (see channel_codes)
+        no_repeat_days (int): Days apart in plan order before a workout may be used again, 0 to allow repeats
+        max_per_channel (int, optional): Most days of the plan with a workout of the same channel
+        diversity_penalty (float): Points lost per pair of days within no_repeat_days that share a channel
+        time_limit (float): Seconds spent improving the greedy assignment
+
+    Returns:
+        tuple: (rows, scores) per day; rows[day] is the library row position or -1 if every candidate
+        of that day broke a constraint, scores[day] its match score (without penalties)
+    """
+    num_days = len(candidate_indices)
+    candidate_indices = [np.asarray(rows, dtype=np.int64) for rows in candidate_indices]
+    candidate_scores = [np.asarray(scores, dtype=np.float64) for scores in candidate_scores]
+    state = _PlanState(channels, no_repeat_days, max_per_channel, diversity_penalty)
+    chosen = np.full(num_days, -1, dtype=np.int64)
+
+    # Greedy: best (day, candidate) pair first; ties go to the earlier day and the better-ranked candidate
+    heap = [(-candidate_scores[day][rank], day, rank)
+            for day in range(num_days) for rank in range(len(candidate_indices[day]))]
+    heapq.heapify(heap)
+    while heap:
+        neg_score, day, rank = heapq.heappop(heap)
+        if chosen[day] >= 0:
+            continue
+        row = candidate_indices[day][rank]
+        if not state.feasible(day, row):
+            continue
+        # Penalties only grow, so a pair whose penalty grew goes back with its new value
+        adjusted = candidate_scores[day][rank] - state.penalty(day, row)
+        if adjusted < -neg_score:
+            heapq.heappush(heap, (-adjusted, day, rank))
+            continue
+        chosen[day] = rank
+        state.add(day, row)
+
+    # Improve: move single days to a better candidate while the constraints allow it
+    deadline = time.monotonic() + time_limit
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for day in range(num_days):
+            current = chosen[day]
+            if current >= 0:
+                row = candidate_indices[day][current]
+                state.remove(day, row)
+                best_rank, best_value = current, candidate_scores[day][current] - state.penalty(day, row)
+            else:
+                best_rank, best_value = -1, -np.inf
+
+            for rank in range(len(candidate_indices[day])):
+                if rank == current or candidate_scores[day][rank] <= best_value:
+                    continue
+                row = candidate_indices[day][rank]
+                if state.feasible(day, row):
+                    value = candidate_scores[day][rank] - state.penalty(day, row)
+                    if value > best_value:
+                        best_rank, best_value = rank, value
+
+            if best_rank >= 0:
+                state.add(day, candidate_indices[day][best_rank])
+            if best_rank != current:
+                chosen[day] = best_rank
+                improved = True
+            if time.monotonic() >= deadline:
+                break
+
+    rows = np.array([candidate_indices[day][chosen[day]] if chosen[day] >= 0 else -1
+                     for day in range(num_days)], dtype=np.int64)
+    scores = np.array([candidate_scores[day][chosen[day]] if chosen[day] >= 0 else -1.0
+                       for day in range(num_days)], dtype=np.float64)
+    return rows, scores
@@ -0,0 +1,290 @@
+"""
+Vectorized scoring of plan days against the whole workout library.
+
+calculate_match_score in fuzzy1.py / fuzzy2.py scores one (plan day, workout) pair at a time.
+WorkoutScoringEngine computes the same scores for all days and all workouts at once:
+- the workout embedding matrix is normalized once, so embedding similarity is one matrix product
+- workouts are scored against precompiled integer codes (see feature_store.py): string rules
+  (category, subcategory, vibe, fitness level) are evaluated once per pair of distinct strings and
+  then gathered into (days x workouts) NumPy masks, fitness level proximity compares ordinals
+- duration rules are evaluated on the (days x workouts) duration difference matrix
+Points are added in the same order as calculate_match_score, so scores are the same.
+
+Usage:
+    engine = WorkoutScoringEngine(workout_library, workout_embeddings, weights=FUZZY2_WEIGHTS)
+    indices, scores = engine.top_k(plan_data, k=5, plan_embeddings=plan_embeddings)
+For large libraries, top_k_candidates re-scores only the candidates an ANN index retrieved.
+"""
+import numpy as np
+
+from feature_store import WorkoutFeatures, fitness_level_ordinals, _column_strings, _factorize
+
+# Points of every rule in fuzzy1.calculate_match_score
+FUZZY1_WEIGHTS = {
+    'embedding': None,
+    'category': {'exact': 20, 'related': 10},
+    'subcategory': {'exact': 20, 'secondary': 15, 'related': 10},
+    'vibe': {'primary_exact': 10, 'primary_secondary': 7,
+             'secondary_exact': 10, 'secondary_primary': 7, 'secondary_related': 5},
+    'fitness_level': {'exact': 20, 'secondary': 15, 'tertiary': 10, 'close': 10, 'same': 20},
+    'duration': {'within_10': 20, 'within_20': 15, 'within_30': 10},
+}
+
+# Points of every rule in fuzzy2.calculate_match_score
+FUZZY2_WEIGHTS = {
+    'embedding': 40,
+    'category': {'exact': 15, 'related': 8},
+    'subcategory': {'exact': 15, 'secondary': 10, 'related': 5},
+    'vibe': None,
+    'fitness_level': {'exact': 15, 'secondary': 10, 'tertiary': 7, 'close': 5, 'same': 0},
+    'duration': {'within_10': 15, 'within_20': 10, 'within_30': 5},
+}
+
+
+def normalize_rows(matrix):
+    """L2-normalize rows, leaving all-zero rows at zero (as sklearn's cosine_similarity does)."""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+    norms[norms == 0.0] = 1.0
+    return matrix / norms[:, np.newaxis]
+
+
+def _rule_mask(plan_field, workout_field, rule):
+    """
+    Evaluate a string rule for every (plan day, workout) pair.
+
+    The rule runs once per pair of distinct strings; the (days x workouts) mask is gathered from that table.
+
+    Args:
+        plan_field (tuple): (codes, uniques) of the plan strings
+        workout_field (tuple): (codes, uniques) of the workout strings
+        rule (callable): rule(plan_string, workout_string) -> bool
+
+    Returns:
+        np.ndarray: Boolean (days x workouts) mask
+    """
+    plan_codes, plan_uniques = plan_field
+    workout_codes, workout_uniques = workout_field
+    table = np.array([[rule(p, w) for w in workout_uniques] for p in plan_uniques], dtype=bool)
+    table = table.reshape(len(plan_uniques), len(workout_uniques))
+    return table[plan_codes][:, workout_codes]
+
+
+def _equal(p, w):
+    return p == w
+
+
+def _related(p, w):
+    return p in w or w in p
+
+
+def _both_set(p, w):
+    return bool(p) and bool(w)
+
+
+class WorkoutScoringEngine:
+    """Scores plan days against a workout library with NumPy instead of one pair at a time."""
+
+    def __init__(self, workout_library, workout_embeddings=None, weights=FUZZY2_WEIGHTS, features=None):
+        """
+        Args:
+            workout_library (pd.DataFrame): Workout library, as loaded by load_data
+            workout_embeddings (np.ndarray, optional): (workouts x dim) embeddings, row i for library row i
+            weights (dict): Rule points, FUZZY1_WEIGHTS or FUZZY2_WEIGHTS
+            features (WorkoutFeatures, optional): Compiled features of the library (see load_workout_features),
+                compiled from workout_library if not given
+        """
+        self.weights = weights
+        self.num_workouts = len(workout_library)
+
+        self.workout_embeddings = None
+        if weights.get('embedding') and workout_embeddings is not None:
+            self.workout_embeddings = normalize_rows(workout_embeddings)
+
+        if features is None:
+            features = WorkoutFeatures.compile(workout_library)
+        elif len(features) != self.num_workouts:
+            raise ValueError(f"Features have {len(features)} rows but the library has {self.num_workouts} workouts")
+        self.fields = features.fields
+        self.durations = features.durations
+        self.fitness_ordinals = features.fitness_ordinals['fitness_level']
+
+    def score(self, plan_data, plan_embeddings=None, workout_rows=None):
+        """
+        Score every plan day against every workout.
+
+        Args:
+            plan_data (pd.DataFrame): Plan days, as returned by extract_plan_info
+            plan_embeddings (list, optional): Embedding per plan day, None where it could not be computed
+            workout_rows (np.ndarray, optional): Library row positions to score instead of the whole library
+
+        Returns:
+            np.ndarray: (days x workouts) match scores, workouts in workout_rows order if given
+        """
+        weights = self.weights
+        num_days = len(plan_data)
+        fields = self.fields
+        durations = self.durations
+        fitness_ordinals = self.fitness_ordinals
+        workout_embeddings = self.workout_embeddings
+        if workout_rows is not None:
+            fields = {column: (codes[workout_rows], uniques) for column, (codes, uniques) in fields.items()}
+            durations = durations[workout_rows]
+            fitness_ordinals = fitness_ordinals[workout_rows]
+            if workout_embeddings is not None:
+                workout_embeddings = workout_embeddings[workout_rows]
+        scores = np.zeros((num_days, len(durations)), dtype=np.float64)
+
+        # 1. Embedding similarity
+        if workout_embeddings is not None and plan_embeddings is not None:
+            has_embedding = np.array([e is not None for e in plan_embeddings], dtype=bool)
+            if has_embedding.any():
+                plan_matrix = normalize_rows([plan_embeddings[i] for i in np.flatnonzero(has_embedding)])
+                similarity = plan_matrix @ workout_embeddings.T
+                scores[has_embedding] += similarity * weights['embedding']
+
+        plan = {column: _factorize(_column_strings(plan_data, column))
+                for column in ['category', 'subcategory', 'primary_vibe', 'secondary_vibe', 'fitness_level']}
+
+        # 2. Category match
+        points = weights['category']
+        exact = _rule_mask(plan['category'], fields['category'], _equal)
+        related = _rule_mask(plan['category'], fields['category'], _related)
+        scores += np.where(exact, points['exact'], np.where(related, points['related'], 0))
+
+        # 3. Subcategory match
+        points = weights['subcategory']
+        exact = _rule_mask(plan['subcategory'], fields['subcategory'], _equal)
+        secondary = _rule_mask(plan['subcategory'], fields['secondary_subcategory'], _equal)
+        related = _rule_mask(plan['subcategory'], fields['subcategory'], _related)
+        scores += np.where(exact, points['exact'],
+                           np.where(secondary, points['secondary'],
+                                    np.where(related, points['related'], 0)))
+
+        # 4. Vibe match
+        points = weights.get('vibe')
+        if points:
+            primary_set = _rule_mask(plan['primary_vibe'], fields['primary_vibe'], _both_set)
+            primary_exact = _rule_mask(plan['primary_vibe'], fields['primary_vibe'], _equal)
+            primary_secondary = _rule_mask(plan['primary_vibe'], fields['secondary_vibe'], _equal)
+            vibe_score = np.where(primary_set,
+                                  np.where(primary_exact, points['primary_exact'],
+                                           np.where(primary_secondary, points['primary_secondary'], 0)),
+                                  0)
+
+            secondary_set = _rule_mask(plan['secondary_vibe'], fields['secondary_vibe'], _both_set)
+            secondary_exact = _rule_mask(plan['secondary_vibe'], fields['secondary_vibe'], _equal)
+            secondary_primary = _rule_mask(plan['secondary_vibe'], fields['primary_vibe'], _equal)
+            secondary_related = _rule_mask(plan['secondary_vibe'], fields['secondary_vibe'], _related)
+            vibe_score = vibe_score + np.where(
+                secondary_set,
+                np.where(secondary_exact, points['secondary_exact'],
+                         np.where(secondary_primary, points['secondary_primary'],
+                                  np.where(secondary_related, points['secondary_related'], 0))),
+                0)
+            scores += vibe_score
+
+        # 5. Fitness level match
+        points = weights['fitness_level']
+        exact = _rule_mask(plan['fitness_level'], fields['fitness_level'], _equal)
+        secondary = _rule_mask(plan['fitness_level'], fields['secondary_fitness_level'], _equal)
+        tertiary = _rule_mask(plan['fitness_level'], fields['tertiary_fitness_level'], _equal)
+        plan_codes, plan_uniques = plan['fitness_level']
+        plan_ordinals = fitness_level_ordinals(plan_uniques)[plan_codes][:, np.newaxis]
+        known = (plan_ordinals > 0) & (fitness_ordinals[np.newaxis, :] > 0)
+        level_diff = np.abs(plan_ordinals.astype(np.int64) - fitness_ordinals[np.newaxis, :])
+        close = known & (level_diff == 1)
+        same = known & (level_diff == 0)
+        scores += np.where(exact, points['exact'],
+                           np.where(secondary, points['secondary'],
+                                    np.where(tertiary, points['tertiary'],
+                                             np.where(close, points['close'],
+                                                      np.where(same, points['same'], 0)))))
+
+        # 6. Duration match
+        points = weights['duration']
+        plan_durations = np.array([row.get('duration', 30) for _, row in plan_data.iterrows()],
+                                  dtype=np.float64)[:, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            duration_diff_pct = np.abs(plan_durations - durations[np.newaxis, :]) / plan_durations
+        scores += np.where(duration_diff_pct <= 0.1, points['within_10'],
+                           np.where(duration_diff_pct <= 0.2, points['within_20'],
+                                    np.where(duration_diff_pct <= 0.3, points['within_30'], 0)))
+
+        return scores
+
+    def top_k(self, plan_data, k=1, plan_embeddings=None, chunk_size=512):
+        """
+        Find the k best workouts of every plan day.
+
+        Ties are broken by library order, so the first workout is the one the
+        per-pair loop in match_workouts would pick.
+
+        Args:
+            plan_data (pd.DataFrame): Plan days, as returned by extract_plan_info
+            k (int): Number of workouts per day
+            plan_embeddings (list, optional): Embedding per plan day, None where it could not be computed
+            chunk_size (int): Number of days scored at once, bounds the (days x workouts) matrices in memory
+
+        Returns:
+            tuple: (indices, scores), both (days x k), best match first; indices are library row positions
+        """
+        num_days = len(plan_data)
+        k = max(0, min(k, self.num_workouts))
+        indices = np.zeros((num_days, k), dtype=np.int64)
+        top_scores = np.zeros((num_days, k), dtype=np.float64)
+        if k == 0:
+            return indices, top_scores
+
+        for start in range(0, num_days, chunk_size):
+            end = min(start + chunk_size, num_days)
+            chunk_embeddings = plan_embeddings[start:end] if plan_embeddings is not None else None
+            scores = self.score(plan_data.iloc[start:end], chunk_embeddings)
+
+            # Unordered k best per day, then the k-th best score as threshold
+            partition = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            thresholds = np.take_along_axis(scores, partition, axis=1).min(axis=1)
+
+            for row in range(end - start):
+                # Every workout at or above the threshold, ordered by score and then library order
+                candidates = np.flatnonzero(scores[row] >= thresholds[row])
+                order = np.lexsort((candidates, -scores[row, candidates]))[:k]
+                indices[start + row] = candidates[order]
+                top_scores[start + row] = scores[row, candidates[order]]
+
+        return indices, top_scores
+
+    def top_k_candidates(self, plan_data, candidates, k=1, plan_embeddings=None):
+        """
+        Find the k best workouts of every plan day among that day's candidate workouts.
+
+        Used to re-score the candidates an ANN index retrieved (see ann_index.py) instead of the whole library.
+
+        Args:
+            plan_data (pd.DataFrame): Plan days, as returned by extract_plan_info
+            candidates (list): Library row positions per plan day, None to score the whole library
+            k (int): Number of workouts per day
+            plan_embeddings (list, optional): Embedding per plan day, None where it could not be computed
+
+        Returns:
+            tuple: (indices, scores), lists with one array per day, best match first;
+            indices are library row positions
+        """
+        indices = []
+        top_scores = []
+        for day, rows in enumerate(candidates):
+            day_plan = plan_data.iloc[day:day + 1]
+            day_embeddings = plan_embeddings[day:day + 1] if plan_embeddings is not None else None
+            if rows is None:
+                day_indices, day_scores = self.top_k(day_plan, k, day_embeddings)
+                indices.append(day_indices[0])
+                top_scores.append(day_scores[0])
+                continue
+
+            rows = np.unique(np.asarray(rows, dtype=np.int64))
+            scores = self.score(day_plan, day_embeddings, workout_rows=rows)[0]
+            order = np.lexsort((rows, -scores))[:k]
+            indices.append(rows[order])
+            top_scores.append(scores[order])
+
+        return indices, top_scores
@@ -1,8 +1,20 @@
+import argparse
 import json
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional, Tuple
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
 from env_utils import load_api_keys
+from rate_limiter import RateLimiter, estimate_message_tokens
+
+# Users analyzed at the same time (each runs the hashtag and location analyses)
+DEFAULT_CONCURRENCY = 8
+# Waits per request after rate limit errors
+MAX_RATE_LIMIT_RETRIES = 5
+# Base of the exponential backoff after rate limit errors, in seconds
+RETRY_DELAY = 2
 
 # Define the classifier prompts
 HASHTAG_PROMPT = """You are a specialized AI fitness analyst. Your task is to analyze questionnaire data from a user and generate 1-10 personalized Instagram hashtags related to fitness that would interest this specific person.
@@ -140,9 +152,10 @@ def analyze_with_openai(
         client: OpenAI,
         user_data_formatted: str,
         system_prompt: str,
-        response_format: Dict[str, Any]
+        response_format: Dict[str, Any],
+        rate_limiter: Optional[RateLimiter] = None
 ) -> Dict[str, Any]:
-    """Send data to OpenAI for analysis."""
+    """Send data to OpenAI for analysis, within the budget of rate_limiter if given."""
     try:
         messages = [
             {"role": "system", "content": system_prompt},
@@ -150,11 +163,28 @@ def analyze_with_openai(
              "content": f"Analyze this user data and provide appropriate recommendations:\n\n{user_data_formatted}"}
         ]
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            response_format=response_format
-        )
+        for retry_attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            # Wait for the shared requests/tokens per minute budget, if a limit is set
+            if rate_limiter is not None:
+                rate_limiter.acquire(estimate_message_tokens(messages))
+            try:
+                response = client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    response_format=response_format
+                )
+                break
+            except RateLimitError:
+                if retry_attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                wait_time = RETRY_DELAY * (2 ** retry_attempt) + random.uniform(0, 1)
+                print(f"Rate limit reached. Waiting for {wait_time:.2f} seconds before retry "
+                      f"({retry_attempt + 1}/{MAX_RATE_LIMIT_RETRIES})...")
+                # With a limiter all threads pause together; the next acquire waits out the pause
+                if rate_limiter is not None:
+                    rate_limiter.pause(wait_time)
+                else:
+                    time.sleep(wait_time)
 
         response_content = response.choices[0].message.content
         return json.loads(response_content)
@@ -167,63 +197,90 @@ def analyze_with_openai(
             return {"locations": [], "locationsExplanation": f"Error analyzing data: {str(e)}"}
 
 
-def process_questionnaire_data(input_file: str, output_file: str, api_key: str) -> None:
-    """Process questionnaire data and generate hashtags and locations."""
+def analyze_user(client: OpenAI, user_data: Dict[str, Any], executor: ThreadPoolExecutor,
+                 rate_limiter: Optional[RateLimiter] = None) -> Dict[str, Any]:
+    """Run the hashtag and location analyses of one user at the same time and combine them."""
+    # Format user data for analysis
+    user_data_formatted = format_user_data_for_analysis(user_data)
+
+    # Analyze for locations in the background while this thread analyzes hashtags
+    locations_future = executor.submit(
+        analyze_with_openai,
+        client,
+        user_data_formatted,
+        LOCATION_PROMPT,
+        LOCATION_RESPONSE_FORMAT,
+        rate_limiter
+    )
+    hashtags_analysis = analyze_with_openai(
+        client,
+        user_data_formatted,
+        HASHTAG_PROMPT,
+        HASHTAG_RESPONSE_FORMAT,
+        rate_limiter
+    )
+    locations_analysis = locations_future.result()
+
+    # Combine results with original data
+    return {
+        "instagramHashtags": hashtags_analysis.get("hashtags", []),
+        "instagramHashtagsExplanation": hashtags_analysis.get("hashtagsExplanation", ""),
+        "Locations": locations_analysis.get("locations", []),
+        "LocationsExplanation": locations_analysis.get("locationsExplanation", "")
+    }
+
+
+def process_questionnaire_data(input_file: str, output_file: str, api_key: str,
+                               concurrency: int = DEFAULT_CONCURRENCY,
+                               requests_per_minute: Optional[int] = None,
+                               tokens_per_minute: Optional[int] = None) -> None:
+    """
+    Process questionnaire data and generate hashtags and locations.
+
+    Up to `concurrency` users are analyzed at the same time; results are written in input order.
+
+    Args:
+        input_file: JSONL file with one user's questionnaire answers per line
+        output_file: JSONL file the results are written to
+        api_key: OpenAI API key
+        concurrency: Number of users analyzed at the same time
+        requests_per_minute: OpenAI requests per minute shared by all threads, None for no limit
+        tokens_per_minute: OpenAI tokens per minute shared by all threads, None for no limit
+    """
     try:
-        # Initialize OpenAI client
+        # Initialize OpenAI client, shared by all threads
         client = OpenAI(api_key=api_key)
+        rate_limiter = None
+        if requests_per_minute or tokens_per_minute:
+            rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
 
         # Read input data
         with open(input_file, 'r') as f:
             lines = f.readlines()
 
-        # Process each user's data
-        results = []
-        for i, line in enumerate(lines):
-            try:
-                print(f"Processing user {i + 1}/{len(lines)}...")
-                user_data = json.loads(line.strip())
-
-                # Format user data for analysis
-                user_data_formatted = format_user_data_for_analysis(user_data)
-
-                # Analyze for hashtags
-                hashtags_analysis = analyze_with_openai(
-                    client,
-                    user_data_formatted,
-                    HASHTAG_PROMPT,
-                    HASHTAG_RESPONSE_FORMAT
-                )
-
-                # Analyze for locations
-                locations_analysis = analyze_with_openai(
-                    client,
-                    user_data_formatted,
-                    LOCATION_PROMPT,
-                    LOCATION_RESPONSE_FORMAT
-                )
-
-                # Combine results with original data
-                result = {
-                    "instagramHashtags": hashtags_analysis.get("hashtags", []),
-                    "instagramHashtagsExplanation": hashtags_analysis.get("hashtagsExplanation", ""),
-                    "Locations": locations_analysis.get("locations", []),
-                    "LocationsExplanation": locations_analysis.get("locationsExplanation", "")
-                }
-
-                results.append(result)
-
-            except json.JSONDecodeError:
-                print(f"Error parsing JSON for user {i + 1}")
-                continue
-            except Exception as e:
-                print(f"Error processing user {i + 1}: {str(e)}")
-                continue
-
-        # Write results to output file
-        with open(output_file, 'w') as f:
-            for result in results:
-                f.write(json.dumps(result) + '\n')
+        # One thread per user and one per location analysis in flight
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as user_executor, \
+                ThreadPoolExecutor(max_workers=max(1, concurrency)) as analysis_executor, \
+                open(output_file, 'w') as out:
+            futures = []
+            for i, line in enumerate(lines):
+                try:
+                    user_data = json.loads(line.strip())
+                except json.JSONDecodeError:
+                    print(f"Error parsing JSON for user {i + 1}")
+                    continue
+                futures.append((i, user_executor.submit(analyze_user, client, user_data, analysis_executor,
+                                                            rate_limiter)))
+
+            # Write each result as soon as it and all results before it are done
+            for i, future in futures:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error processing user {i + 1}: {str(e)}")
+                    continue
+                out.write(json.dumps(result) + '\n')
+                print(f"Processed user {i + 1}/{len(lines)}")
 
         print(f"Processing complete. Results saved to {output_file}")
 
@@ -233,6 +290,19 @@ def process_questionnaire_data(input_file: str, output_file: str, api_key: str)
 
 def main():
     """Main function."""
+    parser = argparse.ArgumentParser(description='Generate Instagram hashtags and locations from onboarding answers')
+    parser.add_argument('--input', type=str, default='onboarding_anwers.jsonl',
+                        help='JSONL file with one user per line')
+    parser.add_argument('--output', type=str, default='user_recommendations.jsonl',
+                        help='JSONL file for the results, in input order')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Number of users analyzed at the same time')
+    parser.add_argument('--rpm', type=int, default=None,
+                        help='OpenAI requests per minute shared by all threads')
+    parser.add_argument('--tpm', type=int, default=None,
+                        help='OpenAI tokens per minute shared by all threads')
+    args = parser.parse_args()
+
     # Load API keys
     api_keys = load_api_keys()
     openai_api_key = api_keys.get('OPENAI_API_KEY')
@@ -241,12 +311,11 @@ def main():
         print("Error: OpenAI API key not found in environment variables.")
         return
 
-    # Define input and output files
-    input_file = "onboarding_anwers.jsonl"
-    output_file = "user_recommendations.jsonl"
-
     # Process data
-    process_questionnaire_data(input_file, output_file, openai_api_key)
+    process_questionnaire_data(args.input, args.output, openai_api_key,
+                               concurrency=args.concurrency,
+                               requests_per_minute=args.rpm,
+                               tokens_per_minute=args.tpm)
 
 
 if __name__ == "__main__":
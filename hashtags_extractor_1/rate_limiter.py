@@ -0,0 +1,83 @@
+"""
+Requests-per-minute and tokens-per-minute limiter shared by the threads of main.py.
+
+Each OpenAI call reserves one request and its estimated prompt + completion tokens before it
+is sent. When the API still answers with a rate limit error, the limiter is paused, so all
+threads back off together instead of each sleeping on its own schedule.
+
+Usage:
+    limiter = RateLimiter(requests_per_minute=500, tokens_per_minute=30000)
+    limiter.acquire(estimate_message_tokens(messages))
+"""
+import threading
+import time
+
+# Rough number of characters per token for English prompts
+CHARS_PER_TOKEN = 4
+# Tokens counted for every message on top of its content
+TOKENS_PER_MESSAGE = 4
+# Completion tokens reserved for every request (the API counts them against the limit too)
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+class RateLimiter:
+    """
+    Token bucket limiter for requests and tokens per minute, shared between threads.
+    A limit of None disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        # Buckets start full, so the first requests go out immediately
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+
+    def acquire(self, tokens=0):
+        """Block until one request and the given number of tokens are reserved."""
+        # A single request can never need more than a full bucket
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait_time = self._blocked_until - now
+                if wait_time <= 0:
+                    elapsed = max(0.0, now - self._last_refill)
+                    self._last_refill = now
+                    if self.requests_per_minute:
+                        self._requests = min(self.requests_per_minute,
+                                             self._requests + elapsed * self.requests_per_minute / 60)
+                        if self._requests < 1:
+                            wait_time = (1 - self._requests) * 60 / self.requests_per_minute
+                    if self.tokens_per_minute:
+                        self._tokens = min(self.tokens_per_minute,
+                                           self._tokens + elapsed * self.tokens_per_minute / 60)
+                        if self._tokens < tokens:
+                            wait_time = max(wait_time, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                    if wait_time <= 0:
+                        if self.requests_per_minute:
+                            self._requests -= 1
+                        if self.tokens_per_minute:
+                            self._tokens -= tokens
+                        return
+            time.sleep(wait_time)
+
+    def pause(self, seconds):
+        """Stop all threads from sending requests for the given number of seconds."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            # The API says the budget is spent: start refilling only once the pause is over
+            self._requests = 0.0
+            self._tokens = 0.0
+            self._last_refill = self._blocked_until
+
+
+def estimate_message_tokens(messages, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+    """Estimate the prompt + completion tokens a chat request with text messages counts against the limit."""
+    chars = sum(len(message.get("content", "")) for message in messages)
+    return chars // CHARS_PER_TOKEN + TOKENS_PER_MESSAGE * len(messages) + completion_tokens
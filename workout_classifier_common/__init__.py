@@ -0,0 +1,7 @@
+"""
+Modules shared by the Hydrow, Spotify and YouTube workout classifier pipelines.
+
+The pipelines are run from their own directories and put the repository root on sys.path
+before importing from this package, e.g.:
+    from workout_classifier_common.classifier_engine import ClassifierEngine
+"""
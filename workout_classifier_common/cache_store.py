@@ -0,0 +1,325 @@
+"""
+Storage backends for cached classifier results.
+
+Results are keyed by (video_id, classifier, prompt_version), where prompt_version is the
+classifier_fingerprint of the prompts, response schema and model that produced the result:
+- JsonDirCacheStore keeps the original layout, one {video_id}_{classifier}_analysis.json file per result.
+- SqliteCacheStore keeps all results in one SQLite file in WAL mode, so lookups go through the
+  primary key index and many Pool workers can write to it at the same time.
+
+The existing JSON directory can be imported into the SQLite file, and the SQLite file can be
+exported as JSON lines:
+    python ../workout_classifier_common/cache_store.py import --cache-dir cache
+    python ../workout_classifier_common/cache_store.py export --cache-dir cache --output cache_export.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+# Prompt version of results cached before prompt versions were tracked
+LEGACY_PROMPT_VERSION = ""
+
+# File name of the SQLite store inside the cache directory
+SQLITE_CACHE_FILE = "classifier_cache.sqlite3"
+
+# Classifier names known to the pipelines, used to split cache file names
+CLASSIFIER_NAMES = ["category", "fitness_level", "equipment", "spirit", "vibe", "tracks", "track"]
+
+ANALYSIS_FILE_PATTERN = re.compile(
+    r"^(?P<video_id>.+)_(?P<classifier>" + "|".join(CLASSIFIER_NAMES) + r")_analysis\.json$"
+)
+
+# Stores opened by the current process, see open_cache_store
+_OPEN_STORES = {}
+
+
+class JsonDirCacheStore:
+    """Cache store with one JSON file per (video_id, classifier)."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, video_id, classifier):
+        return os.path.join(self.cache_dir, f"{video_id}_{classifier}_analysis.json")
+
+    def get(self, video_id, classifier, prompt_version=LEGACY_PROMPT_VERSION):
+        """
+        Load a cached result.
+
+        Returns:
+            dict or None: The cached result, or None if missing, unreadable or cached for another prompt version
+        """
+        cache_path = self.path(video_id, classifier)
+        if not os.path.exists(cache_path):
+            return None
+
+        try:
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+        except Exception as e:
+            print(f"Error loading cached {classifier} analysis: {str(e)}. Running fresh analysis.")
+            return None
+
+        cached_version, result = unpack_cached_result(cached)
+        if cached_version != prompt_version:
+            if cached_version != LEGACY_PROMPT_VERSION or is_error_result(result):
+                return None
+            # Results cached before fingerprints were tracked are assumed to match the current prompts
+            self.put(video_id, classifier, result, prompt_version)
+
+        print(f"Loaded {classifier} analysis from cache: {cache_path}")
+        return result
+
+    def put(self, video_id, classifier, result, prompt_version=LEGACY_PROMPT_VERSION):
+        """Cache a result, replacing whatever was cached for (video_id, classifier)."""
+        cache_path = self.path(video_id, classifier)
+        try:
+            with open(cache_path, 'w') as f:
+                json.dump(pack_cached_result(result, prompt_version), f, indent=2)
+            print(f"Cached data to: {cache_path}")
+        except Exception as e:
+            print(f"Error caching data: {str(e)}")
+
+    def items(self):
+        """Yield (video_id, classifier, prompt_version, result) for every cached result."""
+        for file_name in sorted(os.listdir(self.cache_dir)):
+            match = ANALYSIS_FILE_PATTERN.match(file_name)
+            if not match:
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, file_name), 'r') as f:
+                    cached = json.load(f)
+            except Exception as e:
+                print(f"Skipping unreadable cache file {file_name}: {str(e)}")
+                continue
+            prompt_version, result = unpack_cached_result(cached)
+            yield match.group("video_id"), match.group("classifier"), prompt_version, result
+
+
+class SqliteCacheStore:
+    """Cache store keeping every result in a single SQLite file."""
+
+    def __init__(self, db_path, timeout=60):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout)
+        # WAL lets readers run while one writer commits; concurrent writers wait on busy_timeout
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS classifier_results (
+                video_id TEXT NOT NULL,
+                classifier TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (video_id, classifier, prompt_version)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, video_id, classifier, prompt_version=LEGACY_PROMPT_VERSION):
+        """
+        Load a cached result.
+
+        Returns:
+            dict or None: The cached result, or None if nothing is cached for this key
+        """
+        try:
+            row = self.conn.execute(
+                "SELECT result FROM classifier_results WHERE video_id = ? AND classifier = ? AND prompt_version = ?",
+                (str(video_id), classifier, prompt_version)
+            ).fetchone()
+            if row is None and prompt_version != LEGACY_PROMPT_VERSION:
+                row = self._adopt_legacy_result(str(video_id), classifier, prompt_version)
+        except sqlite3.Error as e:
+            print(f"Error loading cached {classifier} analysis: {str(e)}. Running fresh analysis.")
+            return None
+
+        if row is None:
+            return None
+
+        print(f"Loaded {classifier} analysis for {video_id} from cache: {self.db_path}")
+        return json.loads(row[0])
+
+    def _adopt_legacy_result(self, video_id, classifier, prompt_version):
+        """Move a result cached before fingerprints were tracked to the given prompt version; errors are dropped."""
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT result FROM classifier_results WHERE video_id = ? AND classifier = ? AND prompt_version = ?",
+                (video_id, classifier, LEGACY_PROMPT_VERSION)
+            ).fetchone()
+            if row is not None and is_error_result(json.loads(row[0])):
+                self.conn.execute(
+                    "DELETE FROM classifier_results WHERE video_id = ? AND classifier = ? AND prompt_version = ?",
+                    (video_id, classifier, LEGACY_PROMPT_VERSION)
+                )
+                return None
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE OR REPLACE classifier_results SET prompt_version = ? "
+                    "WHERE video_id = ? AND classifier = ? AND prompt_version = ?",
+                    (prompt_version, video_id, classifier, LEGACY_PROMPT_VERSION)
+                )
+        return row
+
+    def put(self, video_id, classifier, result, prompt_version=LEGACY_PROMPT_VERSION):
+        """Cache a result, replacing whatever was cached for the same key."""
+        self.put_many([(video_id, classifier, prompt_version, result)])
+        print(f"Cached {classifier} analysis for {video_id} to: {self.db_path}")
+
+    def put_many(self, entries):
+        """
+        Cache several results in one transaction.
+
+        Args:
+            entries: Iterable of (video_id, classifier, prompt_version, result)
+        """
+        now = time.time()
+        rows = [(str(video_id), classifier, prompt_version, json.dumps(result), now)
+                for video_id, classifier, prompt_version, result in entries]
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO classifier_results "
+                    "(video_id, classifier, prompt_version, result, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            print(f"Error caching data: {str(e)}")
+
+    def items(self):
+        """Yield (video_id, classifier, prompt_version, result) for every cached result."""
+        cursor = self.conn.execute(
+            "SELECT video_id, classifier, prompt_version, result FROM classifier_results "
+            "ORDER BY video_id, classifier, prompt_version"
+        )
+        for video_id, classifier, prompt_version, result in cursor:
+            yield video_id, classifier, prompt_version, json.loads(result)
+
+    def import_json_dir(self, cache_dir, batch_size=500):
+        """
+        Import every {video_id}_{classifier}_analysis.json file of a JSON cache directory.
+
+        Returns:
+            int: Number of imported results
+        """
+        imported = 0
+        batch = []
+        for entry in JsonDirCacheStore(cache_dir).items():
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                self.put_many(batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            self.put_many(batch)
+            imported += len(batch)
+        return imported
+
+    def export_jsonl(self, output_path):
+        """
+        Write every cached result as one JSON line.
+
+        Returns:
+            int: Number of exported results
+        """
+        exported = 0
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for video_id, classifier, prompt_version, result in self.items():
+                f.write(json.dumps({
+                    "video_id": video_id,
+                    "classifier": classifier,
+                    "prompt_version": prompt_version,
+                    "result": result
+                }, ensure_ascii=False) + "\n")
+                exported += 1
+        return exported
+
+
+def classifier_fingerprint(system_prompt, user_prompt, response_format, model):
+    """
+    Fingerprint everything that shapes a classifier's output.
+    Editing the prompts, the response schema or the model changes the fingerprint,
+    so only the results of that classifier are computed again.
+
+    Returns:
+        str: Hex digest used as prompt_version of cached results
+    """
+    payload = json.dumps({
+        "system_prompt": system_prompt,
+        "user_prompt": user_prompt,
+        "response_format": response_format,
+        "model": model
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def is_error_result(result):
+    """True for error results, which older versions cached and which must be classified again."""
+    return isinstance(result, dict) and "error" in result
+
+
+def pack_cached_result(result, prompt_version):
+    """Wrap a result with its prompt version; unversioned results keep the original file format."""
+    if prompt_version == LEGACY_PROMPT_VERSION:
+        return result
+    return {"prompt_version": prompt_version, "result": result}
+
+
+def unpack_cached_result(cached):
+    """Return (prompt_version, result) of a cached JSON document."""
+    if isinstance(cached, dict) and set(cached) == {"prompt_version", "result"}:
+        return cached["prompt_version"], cached["result"]
+    return LEGACY_PROMPT_VERSION, cached
+
+
+def open_cache_store(cache_dir, backend='json'):
+    """
+    Open the cache store of a cache directory, reusing it for the lifetime of the current process.
+
+    Args:
+        cache_dir (str): Directory holding the cache
+        backend (str): 'json' for one file per result, 'sqlite' for a single SQLite file
+
+    Returns:
+        JsonDirCacheStore or SqliteCacheStore
+    """
+    # SQLite connections must not cross a fork, so stores are kept per process
+    key = (os.getpid(), os.path.abspath(cache_dir), backend)
+    if key not in _OPEN_STORES:
+        if backend == 'json':
+            _OPEN_STORES[key] = JsonDirCacheStore(cache_dir)
+        elif backend == 'sqlite':
+            os.makedirs(cache_dir, exist_ok=True)
+            _OPEN_STORES[key] = SqliteCacheStore(os.path.join(cache_dir, SQLITE_CACHE_FILE))
+        else:
+            raise ValueError(f"Unknown cache backend: {backend}")
+    return _OPEN_STORES[key]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import or export the SQLite classifier cache')
+    parser.add_argument('command', choices=['import', 'export'],
+                        help='import: copy the JSON cache files into SQLite; export: dump SQLite as JSON lines')
+    parser.add_argument('--cache-dir', type=str, default="cache",
+                        help='Cache directory holding the JSON files and the SQLite file (cache. for YouTube)')
+    parser.add_argument('--output', type=str, default="cache_export.jsonl",
+                        help='Output file for export')
+    args = parser.parse_args()
+
+    store = open_cache_store(args.cache_dir, 'sqlite')
+    if args.command == 'import':
+        count = store.import_json_dir(args.cache_dir)
+        print(f"Imported {count} cached results into {store.db_path}")
+    else:
+        count = store.export_jsonl(args.output)
+        print(f"Exported {count} cached results to {args.output}")
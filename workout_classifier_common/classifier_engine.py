@@ -0,0 +1,660 @@
+"""
+Classifier execution shared by the workout pipelines.
+
+A pipeline describes its workouts through a source adapter (ClassifierSource): how to fetch the
+metadata of a workout, format it for the prompts and lay out the combined analysis. The engine
+then runs the classifiers the same way for every pipeline:
+1. the rules of the source answer or prefill classifiers (see rule_engine.py)
+2. cached results are reused (see cache_store.py)
+3. pre-classifiers answer classifiers they are confident about (see vibe_preclassifier.py)
+4. the remaining classifiers go to OpenAI, one after the other or concurrently (enable_async),
+   or all in one request with a combined schema (combined, see below)
+
+Every OpenAI request follows one retry policy. Rate limit errors wait on the shared limiter
+(rate_limiter.py) for the time the API suggests; timeouts, connection errors, server errors and
+unparsable JSON are retried with exponential backoff. The OpenAI client itself does not retry,
+so no request is retried twice. Calls, retries, cache hits and tokens are counted in METRICS.
+
+In combined mode the uncached classifiers of a workout are answered by a single request. Its
+system prompt holds the instructions of every enabled classifier and is the same for all workouts
+of a run, so the provider can cache it as a prompt prefix. The user message puts the workout
+metadata first and then names the classifiers to answer. The response has one sub-object per
+classifier (the schema of that classifier), which is split and cached per classifier like
+separate results. Both modes reuse the results the other one cached (see cache_versions), so
+switching modes or combining with batch mode does not classify the catalogue again.
+
+Usage:
+    engine = ClassifierEngine(HydrowSource(), classifiers, cache_store, openai_api_key)
+    combined_analysis = engine.analyze(workout_json)
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+
+from openai import (OpenAI, AsyncOpenAI, OpenAIError, RateLimitError, APITimeoutError,
+                    APIConnectionError, APIStatusError)
+
+from .rate_limiter import (acquire_rate_limit, acquire_rate_limit_async,
+                           wait_after_rate_limit_error, wait_after_rate_limit_error_async)
+from .rule_engine import RuleEngine
+from .cache_store import classifier_fingerprint
+
+# Model used by all classifiers, part of the fingerprint of cached results
+CLASSIFIER_MODEL = "gpt-4o"
+
+# Seconds before a request is abandoned and retried
+REQUEST_TIMEOUT = 120
+# Attempts per request for timeouts, connection and server errors and unparsable JSON
+MAX_ATTEMPTS = 3
+# Waits per request after rate limit errors
+MAX_RATE_LIMIT_RETRIES = 5
+# Base of the exponential backoff in seconds
+RETRY_DELAY = 2
+
+# Combined mode: instructions in front of the classifier sections of the system prompt
+COMBINED_PROMPT = """You are a specialized AI fitness analyst. You classify one workout along several dimensions in a single answer.
+Each section below holds the instructions for one dimension. Answer with one JSON object that has a sub-object per requested dimension, named like its section and following the instructions of that section and its part of the schema. Judge every dimension on its own, as if it were the only one asked."""
+
+# Combined mode: user prompt after the workout metadata, followed by the requested classifier names
+COMBINED_USER_PROMPT = "Analyze the workout metadata above and classify it according to the schema for these dimensions:"
+
+# Error kinds worth another attempt; rate limit errors have their own budget
+RETRYABLE_ERRORS = ("timeout_error", "connection_error", "server_error", "json_parsing_error")
+
+# Counters of this process: OpenAI calls, retries, rate limit waits, errors, cache hits,
+# rule decisions, pre-classifier answers and tokens. ClassifierEngine.analyze reports the part of one workout
+METRICS = Counter()
+
+# OpenAI clients of this process, keyed by (pid, api_key, base_url)
+_OPENAI_CLIENTS = {}
+
+
+def get_openai_client(openai_api_key, openai_base_url=None):
+    """
+    OpenAI client of the current process, created on first use, so connections are kept alive
+    between workouts.
+
+    Args:
+        openai_api_key (str): OpenAI API key
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+
+    Returns:
+        OpenAI: The client; it does not retry on its own, see run_classifier
+    """
+    key = (os.getpid(), openai_api_key, openai_base_url)
+    if key not in _OPENAI_CLIENTS:
+        _OPENAI_CLIENTS[key] = OpenAI(api_key=openai_api_key, base_url=openai_base_url,
+                                      timeout=REQUEST_TIMEOUT, max_retries=0)
+    return _OPENAI_CLIENTS[key]
+
+
+def build_classifier_messages(meta, system_prompt, user_prompt, metadata_first=False):
+    """
+    Build the chat messages of a classifier request, with the poster image if meta has one.
+
+    Args:
+        meta: dictionary with 'text' and optional 'image' (url), or the text itself
+        system_prompt: System prompt for the classifier
+        user_prompt: User prompt for the classifier
+        metadata_first (bool): Put the metadata before the user prompt instead of after it
+
+    Returns:
+        list: Chat messages
+    """
+    if not isinstance(meta, dict):
+        meta = {"text": meta}
+    text = f"{meta['text']}\n\n{user_prompt}" if metadata_first else f"{user_prompt}\n\n{meta['text']}"
+
+    messages = [
+        {"role": "system", "content": system_prompt}
+    ]
+    if meta.get("image"):
+        messages.append({
+            "role": "user",
+            "content": [
+                {"type": "text", "text": text},
+                {"type": "image_url", "image_url": {"url": f"{meta.get('image')}"}}
+            ]
+        })
+    else:
+        messages.append({
+            "role": "user",
+            "content": text
+        })
+    return messages
+
+
+def build_combined_classifier(classifiers, heads):
+    """
+    Classifier configuration that answers several classifiers in one request.
+
+    Args:
+        classifiers (list): Classifier configurations whose instructions make up the system prompt;
+            the same list for every workout keeps the prompt prefix cacheable
+        heads (list): Names of the classifiers the request answers, a subset of classifiers
+
+    Returns:
+        dict: Configuration with system_prompt, user_prompt and a response_format with a
+        sub-object per head, to be sent with metadata_first=True
+    """
+    sections = [f"## {classifier['name']}\n{classifier['system_prompt']}\n{classifier['user_prompt']}"
+                for classifier in classifiers]
+    schemas = {classifier["name"]: classifier["response_format"]["json_schema"]["schema"]
+               for classifier in classifiers}
+    return {
+        "name": "combined",
+        "system_prompt": "\n\n".join([COMBINED_PROMPT] + sections),
+        "user_prompt": f"{COMBINED_USER_PROMPT} {', '.join(heads)}",
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "WorkoutCombinedAnalysis",
+                "schema": {
+                    "type": "object",
+                    "properties": {name: schemas[name] for name in heads},
+                    "required": list(heads),
+                    "additionalProperties": False
+                }
+            }
+        }
+    }
+
+
+def combined_prompt_version(classifier):
+    """Fingerprint of a classifier's results in combined mode, which differ from its separate results."""
+    return classifier_fingerprint(
+        COMBINED_PROMPT + classifier["system_prompt"],
+        COMBINED_USER_PROMPT + classifier["user_prompt"],
+        classifier["response_format"],
+        CLASSIFIER_MODEL
+    )
+
+
+def cache_versions(classifier, combined=False):
+    """
+    Fingerprints a classifier's cached results are read under, the current mode's first.
+
+    Separate and combined results both come from the current prompts, so either mode (and the
+    batch runner, which caches separate results) reuses what the other one cached.
+    """
+    versions = [classifier["prompt_version"], combined_prompt_version(classifier)]
+    return versions[::-1] if combined else versions
+
+
+def read_cached_result(cache_store, video_id, classifier, combined=False):
+    """Cached result of a classifier under any of its cache_versions, or None."""
+    for prompt_version in cache_versions(classifier, combined):
+        analysis = cache_store.get(video_id, classifier["name"], prompt_version)
+        if analysis is not None:
+            return analysis
+    return None
+
+
+def merge_request_meta(meta, request_metas):
+    """
+    Metadata of a combined request: meta with the hints that rules added for single classifiers.
+
+    Args:
+        meta: Metadata of the workout, a dictionary with 'text' or the text itself
+        request_metas (list): Metadata prepared per classifier (see RuleEngine.apply)
+
+    Returns:
+        Metadata in the form of meta
+    """
+    text = meta["text"] if isinstance(meta, dict) else meta
+    merged = text
+    for request_meta in request_metas:
+        request_text = request_meta["text"] if isinstance(request_meta, dict) else request_meta
+        if request_text.startswith(text) and request_text[len(text):] not in merged:
+            merged += request_text[len(text):]
+    return {**meta, "text": merged} if isinstance(meta, dict) else merged
+
+
+def get_rate_limit_wait_time(error_str, retry_attempt, retry_delay=RETRY_DELAY):
+    """
+    Work out how long to wait after a rate limit error.
+    Uses the wait time suggested by the API when present, exponential backoff with jitter otherwise.
+    """
+    wait_time_match = re.search(r'try again in (\d+(?:\.\d+)?)(ms|s)', error_str)
+    if wait_time_match:
+        wait_time = float(wait_time_match.group(1))
+        if wait_time_match.group(2) == "ms":
+            wait_time /= 1000
+        # Add a small buffer to ensure we're past the rate limit window
+        return wait_time + 0.5
+
+    return retry_delay * (2 ** retry_attempt) + random.uniform(0, 1)
+
+
+def get_error_kind(error):
+    """
+    Kind of a failed request, also used as review_comment of the error result.
+
+    Returns:
+        str: 'rate_limit_error', 'quota_error', 'timeout_error', 'connection_error', 'server_error',
+        'json_parsing_error' or 'processing_error'
+    """
+    if isinstance(error, json.JSONDecodeError):
+        return "json_parsing_error"
+    error_str = str(error)
+    if "insufficient_quota" in error_str:
+        # Waiting does not bring the budget back
+        return "quota_error"
+    if (isinstance(error, RateLimitError)
+            or "rate_limit_exceeded" in error_str or "Rate limit reached" in error_str):
+        return "rate_limit_error"
+    if isinstance(error, APITimeoutError) or "timed out" in error_str.lower():
+        return "timeout_error"
+    if isinstance(error, APIConnectionError):
+        return "connection_error"
+    if isinstance(error, APIStatusError) and error.status_code >= 500:
+        return "server_error"
+    return "processing_error"
+
+
+def plan_retry(error, retries):
+    """
+    Decide how to go on after a failed request.
+
+    Args:
+        error (Exception): The error of the last attempt
+        retries (Counter): Retries of the request so far per error kind, updated in place
+
+    Returns:
+        tuple: ('rate_limit', wait_time) to pause the shared limiter, ('retry', wait_time) to back off
+        and try again, or ('fail', error result) when the request is given up
+    """
+    kind = get_error_kind(error)
+    if kind == "rate_limit_error":
+        if retries[kind] < MAX_RATE_LIMIT_RETRIES:
+            wait_time = get_rate_limit_wait_time(str(error), retries[kind])
+            retries[kind] += 1
+            METRICS["rate_limit_waits"] += 1
+            print(f"Rate limit reached. Waiting for {wait_time:.2f} seconds before retry "
+                  f"({retries[kind]}/{MAX_RATE_LIMIT_RETRIES})...")
+            return "rate_limit", wait_time
+        message = f"Rate limit error after {MAX_RATE_LIMIT_RETRIES} retries: {str(error)}"
+    elif kind in RETRYABLE_ERRORS:
+        attempts = sum(retries[k] for k in RETRYABLE_ERRORS) + 1
+        if attempts < MAX_ATTEMPTS:
+            retries[kind] += 1
+            METRICS["retries"] += 1
+            print(f"Classifier request failed with {kind} (attempt {attempts}/{MAX_ATTEMPTS}): {str(error)}. Retrying...")
+            return "retry", RETRY_DELAY * (2 ** (attempts - 1)) + random.uniform(0, 1)
+        message = f"{kind} after {MAX_ATTEMPTS} attempts: {str(error)}"
+    elif isinstance(error, OpenAIError):
+        message = f"OpenAI API error: {str(error)}"
+    else:
+        message = f"Error with classifier: {str(error)}"
+
+    METRICS["errors"] += 1
+    return "fail", {"error": message, "review_comment": kind}
+
+
+def record_response(response):
+    """Count the tokens of a response in METRICS, if the server reported them."""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        METRICS["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        METRICS["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+    return json.loads(response.choices[0].message.content)
+
+
+def run_classifier(oai_client, meta, system_prompt, user_prompt, response_format, metadata_first=False):
+    """
+    Run a classifier through the OpenAI API, with the retry policy of this module.
+
+    Args:
+        oai_client: OpenAI client
+        meta: dictionary with 'text' and optional 'image' (url), or the text itself
+        system_prompt: System prompt for the classifier
+        user_prompt: User prompt for the classifier
+        response_format: Expected response format
+        metadata_first (bool): Put the metadata before the user prompt, see build_classifier_messages
+
+    Returns:
+        dict: Classification results, or 'error' and 'review_comment' if the request failed
+    """
+    messages = build_classifier_messages(meta, system_prompt, user_prompt, metadata_first)
+    retries = Counter()
+    while True:
+        try:
+            # Reserve request and token budget shared with the other worker processes
+            acquire_rate_limit(messages)
+            METRICS["openai_calls"] += 1
+            return record_response(oai_client.chat.completions.create(
+                model=CLASSIFIER_MODEL,
+                response_format=response_format,
+                messages=messages
+            ))
+        except Exception as e:
+            action, value = plan_retry(e, retries)
+            if action == "fail":
+                return value
+            if action == "rate_limit":
+                wait_after_rate_limit_error(value)
+            else:
+                time.sleep(value)
+
+
+async def run_classifier_async(oai_client, meta, system_prompt, user_prompt, response_format):
+    """
+    Async counterpart of run_classifier with the same retry and error handling.
+    Waits use asyncio.sleep, so other classifiers keep running meanwhile.
+    """
+    messages = build_classifier_messages(meta, system_prompt, user_prompt)
+    retries = Counter()
+    while True:
+        try:
+            await acquire_rate_limit_async(messages)
+            METRICS["openai_calls"] += 1
+            return record_response(await oai_client.chat.completions.create(
+                model=CLASSIFIER_MODEL,
+                response_format=response_format,
+                messages=messages
+            ))
+        except Exception as e:
+            action, value = plan_retry(e, retries)
+            if action == "fail":
+                return value
+            if action == "rate_limit":
+                await wait_after_rate_limit_error_async(value)
+            else:
+                await asyncio.sleep(value)
+
+
+async def run_classifiers_async(openai_api_key, requests, max_concurrency=5, openai_base_url=None):
+    """
+    Run several classifier requests of the same workout concurrently.
+
+    Args:
+        openai_api_key: OpenAI API key
+        requests: List of (classifier configuration, meta to send) pairs
+        max_concurrency: Maximum number of requests in flight at the same time
+        openai_base_url (str, optional): OpenAI-compatible API base URL
+
+    Returns:
+        list: Classification results (or error information) in request order
+    """
+    oai_client = AsyncOpenAI(api_key=openai_api_key, base_url=openai_base_url,
+                             timeout=REQUEST_TIMEOUT, max_retries=0)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run_limited(classifier, meta):
+        async with semaphore:
+            return await run_classifier_async(
+                oai_client,
+                meta,
+                classifier["system_prompt"],
+                classifier["user_prompt"],
+                classifier["response_format"]
+            )
+
+    try:
+        return await asyncio.gather(*(run_limited(classifier, meta) for classifier, meta in requests))
+    finally:
+        await oai_client.close()
+
+
+class ClassifierSource:
+    """
+    How a pipeline fetches and formats its workouts for the engine.
+    Subclasses implement item_id, format and describe, and usually error_analysis.
+    """
+
+    # Rules applied before the cache and OpenAI, see rule_engine.py
+    rules = RuleEngine([])
+    # Whether the 'image' of the formatted metadata is sent to OpenAI
+    include_image = True
+
+    def fetch(self, item):
+        """
+        Metadata of a workout, the fields the rules read from.
+
+        Args:
+            item: What the pipeline is given per workout (a URL, a workout json, ...)
+
+        Raises:
+            ValueError: If the item does not identify a workout
+        """
+        return item
+
+    def item_id(self, data):
+        """Id the classifier results of the workout are cached under."""
+        raise NotImplementedError
+
+    def format(self, data):
+        """Metadata sent to OpenAI: a dictionary with 'text' and optional 'image' (url), or the text itself."""
+        raise NotImplementedError
+
+    def describe(self, data, meta):
+        """Fields of the combined analysis besides the classifier results."""
+        raise NotImplementedError
+
+    def prepare(self, classifier, data, meta, analyses):
+        """
+        Apply the rules around one classifier.
+
+        Returns:
+            tuple: (analysis, request_meta, postprocess, decision), see RuleEngine.apply
+        """
+        return self.rules.apply(classifier["name"], data, meta, analyses)
+
+    def error_analysis(self, error_message, data):
+        """Combined analysis returned when a workout could not be analysed."""
+        return {"error": error_message, "reviewable": False, "review_comment": "processing_error"}
+
+
+class ClassifierEngine:
+    """Runs the classifiers of a pipeline over its workouts: rules, cache, then OpenAI."""
+
+    def __init__(self, source, classifiers, cache_store, openai_api_key, openai_base_url=None,
+                 force_refresh=False, enable_async=False, max_concurrency=5, combined=False,
+                 preclassifiers=None):
+        """
+        Args:
+            source (ClassifierSource): Source adapter of the pipeline
+            classifiers (list): Classifier configurations with name, enabled flag, prompts, response
+                format and prompt_version, in the order they are run. A 'rule_only' classifier has no
+                prompt and is only answered by the rules of the source, after the other classifiers
+            cache_store: Cache store of the classifier results
+            openai_api_key (str): OpenAI API key
+            openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+            force_refresh (bool): Whether to ignore cached results
+            enable_async (bool): Whether to send the uncached classifier requests of a workout concurrently
+            max_concurrency (int): Maximum number of in-flight OpenAI requests in async mode
+            combined (bool): Whether to answer the uncached classifiers of a workout in one request
+            preclassifiers (dict, optional): Classifier name -> pre-classifier whose classify(video_id, meta)
+                returns the analysis, or None to ask OpenAI. Asked after the cache; their answers are not cached
+        """
+        self.source = source
+        self.classifiers = classifiers
+        self.cache_store = cache_store
+        self.openai_api_key = openai_api_key
+        self.openai_base_url = openai_base_url
+        self.force_refresh = force_refresh
+        self.enable_async = enable_async
+        self.max_concurrency = max_concurrency
+        self.combined = combined
+        self.preclassifiers = preclassifiers or {}
+        self.oai_client = get_openai_client(openai_api_key, openai_base_url)
+
+    def analyze(self, item):
+        """
+        Analyse one workout.
+
+        Args:
+            item: What the pipeline is given per workout, passed to the source's fetch
+
+        Returns:
+            dict: Combined analysis with a result per enabled classifier, 'rule_decisions'
+            and 'execution_metrics' (the METRICS counted for this workout)
+        """
+        metrics_before = METRICS.copy()
+        start_time = time.monotonic()
+        try:
+            data = self.source.fetch(item)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        try:
+            meta = self.source.format(data)
+            combined_analysis = self.source.describe(data, meta)
+            if isinstance(meta, dict) and not self.source.include_image:
+                meta.pop("image", None)
+
+            analyses, rule_decisions = self.run(self.source.item_id(data), data, meta)
+        except Exception as e:
+            return self.source.error_analysis(f"Failed to perform combined analysis: {str(e)}", data)
+
+        review_comments = []
+        for name, analysis in analyses.items():
+            if "error" in analysis:
+                review_comments.append(f"Error in {name} classifier: {analysis.get('error')}")
+                if "review_comment" in analysis and analysis["review_comment"] not in review_comments:
+                    review_comments.append(analysis["review_comment"])
+            combined_analysis[name] = analysis
+        combined_analysis["rule_decisions"] = rule_decisions
+
+        if review_comments:
+            combined_analysis["reviewable"] = False
+            combined_analysis["review_comment"] = "; ".join(review_comments)
+
+        execution_metrics = dict(METRICS - metrics_before)
+        execution_metrics["seconds"] = round(time.monotonic() - start_time, 3)
+        combined_analysis["execution_metrics"] = execution_metrics
+        return combined_analysis
+
+    def run(self, video_id, data, meta):
+        """
+        Run the enabled classifiers of one workout.
+
+        Args:
+            video_id: Id the results are cached under
+            data (dict): Workout metadata the rules read from
+            meta: Metadata sent to OpenAI
+
+        Returns:
+            tuple: (analyses, rule_decisions) - results keyed by classifier name in classifier order,
+            and 'resolved' or 'prefilled' per classifier a rule was applied to
+        """
+        analyses = {}
+        rule_decisions = {}
+        pending = []
+        for classifier in self.llm_classifiers():
+            name = classifier["name"]
+
+            # Rules first: they answer some classifiers outright and prefill others
+            analysis, request_meta, postprocess, decision = self.source.prepare(classifier, data, meta, analyses)
+            if decision:
+                rule_decisions[name] = decision
+                METRICS[f"rule_{decision}"] += 1
+
+            if analysis is None and not self.force_refresh:
+                analysis = read_cached_result(self.cache_store, video_id, classifier, self.combined)
+                if analysis is not None:
+                    METRICS["cache_hits"] += 1
+
+            if analysis is None and name in self.preclassifiers:
+                analysis = self.preclassifiers[name].classify(video_id, meta)
+                if analysis is not None:
+                    analysis = postprocess(analysis)
+
+            if analysis is not None:
+                analyses[name] = analysis
+            elif self.enable_async or self.combined:
+                pending.append((classifier, request_meta, postprocess))
+            else:
+                analyses[name] = self._store(video_id, classifier, postprocess(run_classifier(
+                    self.oai_client,
+                    request_meta,
+                    classifier["system_prompt"],
+                    classifier["user_prompt"],
+                    classifier["response_format"]
+                )))
+
+        if pending and self.combined:
+            for (classifier, _, postprocess), analysis in zip(pending, self._run_combined(pending, meta)):
+                analyses[classifier["name"]] = self._store(video_id, classifier, postprocess(analysis))
+        elif pending:
+            fresh_analyses = asyncio.run(run_classifiers_async(
+                self.openai_api_key,
+                [(classifier, request_meta) for classifier, request_meta, _ in pending],
+                max_concurrency=self.max_concurrency,
+                openai_base_url=self.openai_base_url
+            ))
+            for (classifier, _, postprocess), analysis in zip(pending, fresh_analyses):
+                analyses[classifier["name"]] = self._store(video_id, classifier, postprocess(analysis))
+
+        # Classifiers answered only by rules may need the results of all the others
+        for classifier in self.classifiers:
+            if classifier["enabled"] and classifier.get("rule_only"):
+                analysis, _, _, _ = self.source.prepare(classifier, data, meta, analyses)
+                if analysis is not None:
+                    analyses[classifier["name"]] = analysis
+
+        ordered = {classifier["name"]: analyses[classifier["name"]]
+                   for classifier in self.classifiers if classifier["name"] in analyses}
+        return ordered, rule_decisions
+
+    def llm_classifiers(self):
+        """Enabled classifiers that have a prompt, in classifier order."""
+        return [classifier for classifier in self.classifiers
+                if classifier["enabled"] and not classifier.get("rule_only")]
+
+    def prompt_version(self, classifier):
+        """Fingerprint the results of a classifier are cached under."""
+        if self.combined:
+            return combined_prompt_version(classifier)
+        return classifier["prompt_version"]
+
+    def _run_combined(self, pending, meta):
+        """
+        Answer the pending classifiers of a workout with one request.
+
+        Returns:
+            list: Result (or error information) per pending classifier, in order
+        """
+        heads = [classifier["name"] for classifier, _, _ in pending]
+        combined_classifier = build_combined_classifier(self.llm_classifiers(), heads)
+        result = run_classifier(
+            self.oai_client,
+            merge_request_meta(meta, [request_meta for _, request_meta, _ in pending]),
+            combined_classifier["system_prompt"],
+            combined_classifier["user_prompt"],
+            combined_classifier["response_format"],
+            metadata_first=True
+        )
+        if "error" in result:
+            return [result for _ in heads]
+        return [result[name] if isinstance(result.get(name), dict) else
+                {"error": f"Combined response has no {name} analysis", "review_comment": "json_parsing_error"}
+                for name in heads]
+
+    def _store(self, video_id, classifier, analysis):
+        """Cache a fresh result; failed requests are not cached, so the next run retries them."""
+        if "error" not in analysis:
+            self.cache_store.put(video_id, classifier["name"], analysis, self.prompt_version(classifier))
+        return analysis
+
+
+def summarize_execution_metrics(metrics):
+    """
+    Print the execution metrics of a run.
+
+    Args:
+        metrics (dict): METRICS counters summed over the workouts
+    """
+    print(f"OpenAI calls: {metrics.get('openai_calls', 0)} "
+          f"({metrics.get('prompt_tokens', 0)} prompt + {metrics.get('completion_tokens', 0)} completion tokens)")
+    print(f"Cached classifier results reused: {metrics.get('cache_hits', 0)}")
+    print(f"Retried requests: {metrics.get('retries', 0)}, rate limit waits: {metrics.get('rate_limit_waits', 0)}, "
+          f"failed requests: {metrics.get('errors', 0)}")
+    if metrics.get('preclassified', 0) or metrics.get('preclassifier_escalations', 0):
+        print(f"Answered by pre-classifiers: {metrics.get('preclassified', 0)}, "
+              f"escalated to OpenAI: {metrics.get('preclassifier_escalations', 0)} "
+              f"({metrics.get('embedding_calls', 0)} embedding requests)")
@@ -0,0 +1,119 @@
+"""
+Binary storage for workout embeddings.
+
+JSON float lists take about 82 KB per 3072-dim embedding and must be parsed number by number.
+This module stores them as NumPy arrays instead:
+- an embedding matrix (.npy, float32 or float16, one row per workout) plus a video_id index
+  file (.ids.json, row i belongs to video_ids[i]), loadable memory-mapped without copying
+- per-workout cache entries as {video_id}.npy next to a {video_id}.json that only keeps the
+  video_id and the description the embedding was generated from
+
+Usage:
+    save_embedding_matrix("workouts.npy", video_ids, embeddings)
+    matrix, video_ids = load_embedding_matrix("workouts.npy")  # memory-mapped, read-only
+"""
+import json
+import os
+
+import numpy as np
+
+EMBEDDING_DTYPES = ("float32", "float16")
+
+
+def embedding_index_path(matrix_path):
+    """Path of the video_id index file that belongs to an embedding matrix."""
+    return os.path.splitext(matrix_path)[0] + ".ids.json"
+
+
+def save_embedding_matrix(matrix_path, video_ids, embeddings, dtype="float32"):
+    """
+    Write embeddings as one .npy matrix plus its video_id index file.
+
+    Args:
+        matrix_path (str): Destination .npy file
+        video_ids (list): Video id of every row
+        embeddings (list): Embedding (list of floats) of every row
+        dtype (str): 'float32' or 'float16'
+    """
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    matrix = np.asarray(embeddings, dtype=dtype)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(video_ids), -1) if len(video_ids) else matrix.reshape(0, 0)
+    np.save(matrix_path, matrix)
+
+    with open(embedding_index_path(matrix_path), 'w', encoding='utf-8') as f:
+        json.dump([str(video_id) for video_id in video_ids], f)
+
+
+def load_embedding_matrix(matrix_path, mmap=True):
+    """
+    Load an embedding matrix and its video_id index.
+
+    Args:
+        matrix_path (str): .npy file written by save_embedding_matrix
+        mmap (bool): Whether to memory-map the matrix read-only instead of reading it into memory
+
+    Returns:
+        tuple: (matrix, video_ids)
+    """
+    matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+    with open(embedding_index_path(matrix_path), 'r', encoding='utf-8') as f:
+        video_ids = json.load(f)
+
+    if len(video_ids) != matrix.shape[0]:
+        raise ValueError(f"{matrix_path} has {matrix.shape[0]} rows but its index has {len(video_ids)} ids")
+    return matrix, video_ids
+
+
+def write_embedding_cache(cache_dir, video_id, description, embedding, cache_format="json", dtype="float32"):
+    """
+    Cache the embedding of one workout.
+
+    Args:
+        cache_dir (Path): Cache directory
+        video_id (str): Video id of the workout
+        description (str): Text the embedding was generated from
+        embedding (list): Embedding
+        cache_format (str): 'json' keeps the embedding in {video_id}.json,
+                            'npy' stores it in {video_id}.npy next to a description-only JSON file
+        dtype (str): Dtype of the .npy file
+    """
+    cache_data = {
+        "video_id": video_id,
+        "description": description
+    }
+    if cache_format == "npy":
+        np.save(os.path.join(cache_dir, f"{video_id}.npy"), np.asarray(embedding, dtype=dtype))
+    else:
+        cache_data["embedding"] = embedding
+
+    with open(os.path.join(cache_dir, f"{video_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(cache_data, f, ensure_ascii=False, indent=2)
+
+
+def read_embedding_cache(cache_dir, video_id):
+    """
+    Load the cached embedding of one workout, in either cache format.
+
+    Returns:
+        dict or None: Cache data with 'description' and 'embedding' (list of floats), or None if missing
+
+    Raises:
+        json.JSONDecodeError: If the cache file is corrupted
+    """
+    json_path = os.path.join(cache_dir, f"{video_id}.json")
+    if not os.path.exists(json_path):
+        return None
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        cache_data = json.load(f)
+
+    if 'embedding' not in cache_data:
+        npy_path = os.path.join(cache_dir, f"{video_id}.npy")
+        if not os.path.exists(npy_path):
+            return None
+        cache_data['embedding'] = np.load(npy_path).tolist()
+
+    return cache_data
@@ -0,0 +1,193 @@
+"""
+Requests-per-minute and tokens-per-minute limiter shared by all worker processes.
+
+The limiter keeps two token buckets (requests and tokens) in shared memory, so every
+multiprocessing.Pool worker draws from the same budget. Each OpenAI call reserves one
+request and its estimated prompt + completion tokens before it is sent. When the API
+still answers with a rate limit error, the worker pauses the shared limiter, so all
+workers back off together instead of each sleeping on its own schedule.
+
+Usage:
+    limiter = SharedRateLimiter(requests_per_minute=500, tokens_per_minute=30000)
+    Pool(processes=8, initializer=init_worker_rate_limiter, initargs=(limiter,))
+"""
+import asyncio
+import json
+import multiprocessing
+import time
+
+# Rough number of characters per token for English prompts
+CHARS_PER_TOKEN = 4
+# Tokens counted for every message on top of its content
+TOKENS_PER_MESSAGE = 4
+# Tokens counted for an image input (high detail poster)
+TOKENS_PER_IMAGE = 765
+# Completion tokens reserved for every request (the API counts them against the limit too)
+DEFAULT_COMPLETION_TOKENS = 1000
+
+# Limiter used by the current process, installed by init_worker_rate_limiter
+RATE_LIMITER = None
+
+# Indices into the shared state array
+_REQUESTS, _TOKENS, _LAST_REFILL, _BLOCKED_UNTIL = range(4)
+
+
+class SharedRateLimiter:
+    """
+    Token bucket limiter for requests and tokens per minute, shared between processes.
+    A limit of None disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Buckets start full, so the first requests go out immediately
+        self._state = multiprocessing.Array('d', [
+            float(requests_per_minute or 0),
+            float(tokens_per_minute or 0),
+            time.time(),
+            0.0
+        ])
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._state[_LAST_REFILL])
+        if self.requests_per_minute:
+            self._state[_REQUESTS] = min(
+                self.requests_per_minute,
+                self._state[_REQUESTS] + elapsed * self.requests_per_minute / 60
+            )
+        if self.tokens_per_minute:
+            self._state[_TOKENS] = min(
+                self.tokens_per_minute,
+                self._state[_TOKENS] + elapsed * self.tokens_per_minute / 60
+            )
+        self._state[_LAST_REFILL] = now
+
+    def try_acquire(self, tokens=0):
+        """
+        Reserve one request and the given number of tokens if the budget allows it.
+
+        Args:
+            tokens (int): Estimated tokens of the request
+
+        Returns:
+            float: 0 if the reservation was made, otherwise the number of seconds to wait before retrying
+        """
+        # A single request can never need more than a full bucket
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        with self._state.get_lock():
+            now = time.time()
+            if self._state[_BLOCKED_UNTIL] > now:
+                return self._state[_BLOCKED_UNTIL] - now
+
+            self._refill(now)
+
+            wait_time = 0.0
+            if self.requests_per_minute and self._state[_REQUESTS] < 1:
+                wait_time = max(wait_time, (1 - self._state[_REQUESTS]) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute and self._state[_TOKENS] < tokens:
+                wait_time = max(wait_time, (tokens - self._state[_TOKENS]) * 60 / self.tokens_per_minute)
+            if wait_time > 0:
+                return wait_time
+
+            if self.requests_per_minute:
+                self._state[_REQUESTS] -= 1
+            if self.tokens_per_minute:
+                self._state[_TOKENS] -= tokens
+            return 0.0
+
+    def acquire(self, tokens=0):
+        """Block until one request and the given number of tokens are reserved."""
+        while True:
+            wait_time = self.try_acquire(tokens)
+            if wait_time <= 0:
+                return
+            time.sleep(wait_time)
+
+    async def acquire_async(self, tokens=0):
+        """Async counterpart of acquire, waits with asyncio.sleep."""
+        while True:
+            wait_time = self.try_acquire(tokens)
+            if wait_time <= 0:
+                return
+            await asyncio.sleep(wait_time)
+
+    def pause(self, seconds):
+        """Stop all processes from sending requests for the given number of seconds."""
+        with self._state.get_lock():
+            self._state[_BLOCKED_UNTIL] = max(self._state[_BLOCKED_UNTIL], time.time() + seconds)
+            # The API says the budget is spent: start refilling only once the pause is over
+            self._state[_REQUESTS] = 0.0
+            self._state[_TOKENS] = 0.0
+            self._state[_LAST_REFILL] = self._state[_BLOCKED_UNTIL]
+
+
+def init_worker_rate_limiter(limiter):
+    """Pool initializer that installs the shared limiter in a worker process."""
+    global RATE_LIMITER
+    RATE_LIMITER = limiter
+
+
+def estimate_message_tokens(messages, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+    """
+    Estimate the tokens a chat completion request counts against the tokens-per-minute limit.
+
+    Args:
+        messages (list): Chat messages, with string or multi-part content
+        completion_tokens (int): Completion tokens to reserve on top of the prompt
+
+    Returns:
+        int: Estimated prompt + completion tokens
+    """
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+        else:
+            chars += len(json.dumps(content))
+
+    return (chars // CHARS_PER_TOKEN
+            + TOKENS_PER_MESSAGE * len(messages)
+            + TOKENS_PER_IMAGE * images
+            + completion_tokens)
+
+
+def acquire_rate_limit(messages):
+    """Reserve budget for a chat completion request, if a shared limiter is installed."""
+    if RATE_LIMITER is not None:
+        RATE_LIMITER.acquire(estimate_message_tokens(messages))
+
+
+async def acquire_rate_limit_async(messages):
+    """Async counterpart of acquire_rate_limit."""
+    if RATE_LIMITER is not None:
+        await RATE_LIMITER.acquire_async(estimate_message_tokens(messages))
+
+
+def wait_after_rate_limit_error(wait_time):
+    """
+    Back off after the API reported a rate limit error.
+    With a shared limiter all workers pause together; the next acquire waits out the pause.
+    """
+    if RATE_LIMITER is not None:
+        RATE_LIMITER.pause(wait_time)
+    else:
+        time.sleep(wait_time)
+
+
+async def wait_after_rate_limit_error_async(wait_time):
+    """Async counterpart of wait_after_rate_limit_error."""
+    if RATE_LIMITER is not None:
+        RATE_LIMITER.pause(wait_time)
+    else:
+        await asyncio.sleep(wait_time)
@@ -0,0 +1,177 @@
+"""
+Append-only writer for the analysis output CSV.
+
+Results are written as soon as they come back from the pool instead of being collected
+until the end of the run, so memory stays flat and a crash keeps everything written so far.
+Rows are deduplicated by video_id and flushed to disk every few rows.
+
+With resume, the video_ids already in the output are kept and skipped: a row cut off by a
+crash is dropped, as are error rows (see return_error_analysis in the pipelines) so their workouts are retried,
+and the run continues appending after the remaining rows.
+
+Usage:
+    with ResultWriter("workouts_analyzed.csv", fieldnames, resume=True) as writer:
+        workouts = iter_workout_jsons(input_csv_path, skip_ids=writer.video_ids)
+        for result in pool.imap_unordered(analyze_workout, make_tasks(workouts)):
+            writer.write(result)
+"""
+import csv
+import os
+import time
+
+# Rows written between two flushes to disk
+FLUSH_EVERY_ROWS = 25
+# Seconds after which pending rows are flushed anyway
+FLUSH_INTERVAL = 30
+
+
+def read_complete_rows(output_csv_path, fieldnames):
+    """
+    Read the complete rows of an output CSV written by ResultWriter.
+
+    Args:
+        output_csv_path (str): Output CSV file
+        fieldnames (list): Expected columns
+
+    Returns:
+        tuple: (rows, clean) with rows as a list of dicts and clean False when rows were cut off or malformed
+
+    Raises:
+        ValueError: If the file has other columns, e.g. it is the output of another pipeline
+    """
+    with open(output_csv_path, 'r', newline='', encoding='utf-8') as f:
+        content = f.read()
+    if not content:
+        return [], True
+
+    reader = csv.DictReader(content.splitlines(keepends=True))
+    if reader.fieldnames != list(fieldnames):
+        raise ValueError(f"{output_csv_path} has other columns than the analysis output, cannot resume it")
+
+    rows = []
+    clean = True
+    last_rejected = False
+    for row in reader:
+        last_rejected = None in row or None in row.values() or not row.get('video_id')
+        if last_rejected:
+            clean = False
+            continue
+        rows.append(row)
+
+    # The writer ends every row with a line break and closes every quote; without them, the last
+    # row was cut off (unless it was already dropped above for missing columns)
+    cut_off = not content.endswith('\n') or content.count('"') % 2 == 1
+    if cut_off and rows and not last_rejected:
+        rows.pop()
+        clean = False
+    return rows, clean
+
+
+def is_error_row(row):
+    """True for rows written from return_error_analysis, which are retried on resume."""
+    return (row.get('review_comment') or '').startswith('processing_error')
+
+
+class ResultWriter:
+    """Writes analysis results to the output CSV one row per video_id, as they arrive."""
+
+    def __init__(self, output_csv_path, fieldnames, resume=False,
+                 flush_every=FLUSH_EVERY_ROWS, flush_interval=FLUSH_INTERVAL):
+        """
+        Args:
+            output_csv_path (str): Output CSV file
+            fieldnames (list): Output columns; other result keys are ignored
+            resume (bool): Keep the rows of an existing output and append to it
+            flush_every (int): Rows written between two flushes
+            flush_interval (float): Seconds after which pending rows are flushed anyway
+        """
+        self.output_csv_path = output_csv_path
+        self.fieldnames = list(fieldnames)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        # video_ids (as text) in the output, including those of a resumed run
+        self.video_ids = set()
+        self.resumed = 0
+        self.written = 0
+        self.duplicates = 0
+        self.reviewable = 0
+
+        if resume and os.path.exists(output_csv_path):
+            rows, clean = read_complete_rows(output_csv_path, self.fieldnames)
+            retried = [row for row in rows if is_error_row(row)]
+            if retried:
+                rows = [row for row in rows if not is_error_row(row)]
+                print(f"Retrying {len(retried)} workouts that failed in {output_csv_path}")
+            if not clean or retried:
+                self._rewrite(rows)
+            self.video_ids.update(row['video_id'] for row in rows)
+            self.resumed = len(self.video_ids)
+            self._file = open(output_csv_path, 'a', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+            if not rows and os.path.getsize(output_csv_path) == 0:
+                self._writer.writeheader()
+        else:
+            self._file = open(output_csv_path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+            self._writer.writeheader()
+        self.flush()
+
+    def _rewrite(self, rows):
+        """Replace the output by its complete rows, atomically."""
+        tmp_path = self.output_csv_path + ".tmp"
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.output_csv_path)
+        print(f"Dropped incomplete or failed rows from {self.output_csv_path}, kept {len(rows)} rows")
+
+    def write(self, result):
+        """
+        Append a result unless it is empty or its video_id is already in the output.
+
+        Returns:
+            bool: True if a row was written
+        """
+        if not result:
+            return False
+        # The CSV holds ids as text, numeric workout ids must match their resumed rows
+        video_id = str(result.get('video_id') or '')
+        if not video_id:
+            return False
+        if video_id in self.video_ids:
+            self.duplicates += 1
+            return False
+
+        self._writer.writerow(result)
+        self.video_ids.add(video_id)
+        self.written += 1
+        if result.get('reviewable', False):
+            self.reviewable += 1
+
+        self._pending += 1
+        if self._pending >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return True
+
+    def flush(self):
+        """Push the written rows to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
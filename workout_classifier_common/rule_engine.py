@@ -0,0 +1,200 @@
+"""
+Declarative rules that answer classifiers from workout metadata before OpenAI is called.
+
+A rule belongs to one classifier and matches on metadata fields:
+    {
+        "name": "journey_vibe",
+        "classifier": "vibe",
+        "when": {"category.name": {"contains": "journey"}},
+        "resolve": lambda data, meta, analyses: hardcoded_journey_vibe()
+    }
+
+- "when" maps dotted field paths ("workoutTypes.0", "category.name", "duration") to a condition:
+  a plain value (equality) or a dict of operators: equals, in, contains, any_of, exists, min, max.
+  Strings are compared case-insensitively, min and max are inclusive. All conditions must hold.
+- "requires" lists classifiers whose error-free analyses the rule needs; they are passed as analyses.
+- "resolve"(data, meta, analyses) returns the complete analysis, so no OpenAI call is made.
+- "prefill"(data, meta, analyses) returns (fields, keys_to_override, hint): the hint is appended to
+  the metadata text sent to OpenAI and keys_to_override of the answer are replaced by fields.
+
+The first matching rule of a classifier wins; classifiers without one go to OpenAI unchanged.
+"""
+
+# Rule outcomes reported per classifier
+RULE_DECISIONS = ("resolved", "prefilled")
+
+
+def get_field(data, path):
+    """
+    Value at a dotted path of nested dicts and lists, e.g. 'workoutTypes.0' or 'category.name'.
+
+    Returns:
+        The value, or None if any part of the path is missing
+    """
+    value = data
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return None
+        if value is None:
+            return None
+    return value
+
+
+def _normalize(value):
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def check_condition(value, condition):
+    """
+    Check a field value against a rule condition.
+
+    Args:
+        value: Field value (None when the field is missing)
+        condition: Plain value for equality, or a dict of operators
+
+    Returns:
+        bool: True if every operator holds
+    """
+    if not isinstance(condition, dict):
+        condition = {"equals": condition}
+
+    for operator, expected in condition.items():
+        if operator == "exists":
+            holds = (value is not None) == bool(expected)
+        elif value is None:
+            return False
+        elif operator == "equals":
+            holds = _normalize(value) == _normalize(expected)
+        elif operator == "in":
+            holds = _normalize(value) in [_normalize(e) for e in expected]
+        elif operator == "contains":
+            if isinstance(value, str):
+                holds = _normalize(expected) in _normalize(value)
+            else:
+                holds = _normalize(expected) in [_normalize(v) for v in value]
+        elif operator == "any_of":
+            values = value if isinstance(value, list) else [value]
+            holds = any(_normalize(v) in [_normalize(e) for e in expected] for v in values)
+        elif operator == "min":
+            holds = value >= expected
+        elif operator == "max":
+            holds = value <= expected
+        else:
+            raise ValueError(f"Unknown rule operator: {operator}")
+        if not holds:
+            return False
+    return True
+
+
+def with_hint(meta, hint):
+    """Copy of meta (a dict with 'text', or the text itself) with hint appended to the text."""
+    if not hint:
+        return meta
+    if isinstance(meta, dict):
+        return {**meta, "text": meta["text"] + "\n" + hint}
+    return meta + "\n" + hint
+
+
+def enforce_prefilled_fields(gpt_result, prefilled, keys_to_override):
+    """
+    Replace selected fields in GPT output with the prefilled values.
+
+    Args:
+        gpt_result: Full GPT response (dictionary)
+        prefilled: Prefilled fields (dictionary)
+        keys_to_override: List of keys to force from prefill
+
+    Returns:
+        A merged schema dictionary
+    """
+    final = gpt_result.copy()
+    for key in keys_to_override:
+        if key in prefilled:
+            final[key] = prefilled[key]
+    return final
+
+
+class RuleEngine:
+    """Rules of one pipeline, looked up per classifier."""
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules (list): Rule dicts with name, classifier, optional when/requires, and resolve or prefill
+        """
+        self.rules = {}
+        for rule in rules:
+            if ("resolve" in rule) == ("prefill" in rule):
+                raise ValueError(f"Rule {rule.get('name')} needs exactly one of 'resolve' and 'prefill'")
+            self.rules.setdefault(rule["classifier"], []).append(rule)
+
+    def match(self, classifier_name, data, analyses=None):
+        """
+        First rule of a classifier that matches the metadata.
+
+        Args:
+            classifier_name (str): Classifier name
+            data (dict): Workout metadata the rule fields are read from
+            analyses (dict, optional): Analyses of the classifiers run so far
+
+        Returns:
+            dict or None: The rule
+        """
+        analyses = analyses or {}
+        for rule in self.rules.get(classifier_name, []):
+            if any(name not in analyses or "error" in analyses[name] for name in rule.get("requires", [])):
+                continue
+            if all(check_condition(get_field(data, path), condition)
+                   for path, condition in rule.get("when", {}).items()):
+                return rule
+        return None
+
+    def apply(self, classifier_name, data, meta, analyses=None):
+        """
+        Run the matching rule of a classifier.
+
+        Args:
+            classifier_name (str): Classifier name
+            data (dict): Workout metadata the rule fields are read from
+            meta: Metadata sent to OpenAI, a dict with 'text' or the text itself
+            analyses (dict, optional): Analyses of the classifiers run so far
+
+        Returns:
+            tuple: (analysis, request_meta, postprocess, decision). analysis is set when the rule resolved
+            the classifier; otherwise request_meta is the meta to send to OpenAI and postprocess turns its
+            answer into the final analysis. decision is 'resolved', 'prefilled' or None (no rule matched).
+        """
+        rule = self.match(classifier_name, data, analyses)
+        if rule is None:
+            return None, meta, lambda analysis: analysis, None
+
+        if "resolve" in rule:
+            return rule["resolve"](data, meta, analyses or {}), None, None, "resolved"
+
+        fields, keys_to_override, hint = rule["prefill"](data, meta, analyses or {})
+
+        def postprocess(analysis):
+            if "error" in analysis:
+                return analysis
+            return enforce_prefilled_fields(analysis, fields, keys_to_override)
+
+        return None, with_hint(meta, hint), postprocess, "prefilled"
+
+
+def summarize_rule_decisions(decision_counts):
+    """
+    Print how many classifier calls the rules answered, per classifier.
+
+    Args:
+        decision_counts (dict): (classifier name, decision) -> count, summed over the workouts
+    """
+    resolved = sum(count for (_, decision), count in decision_counts.items() if decision == "resolved")
+    prefilled = sum(count for (_, decision), count in decision_counts.items() if decision == "prefilled")
+    print(f"OpenAI calls avoided by rules: {resolved}")
+    print(f"OpenAI calls prefilled by rules: {prefilled}")
+    for (name, decision), count in sorted(decision_counts.items()):
+        print(f"  {name}: {count} {decision}")
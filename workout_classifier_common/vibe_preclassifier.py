@@ -0,0 +1,205 @@
+"""
+Embedding pre-classifier for the vibe classifier.
+
+The vibe prompt is one of the largest, yet many workouts clearly belong to one vibe. This module
+embeds every vibe definition of the pipeline's vibes_info.csv once (a prototype per vibe), then scores the
+metadata embedding of a workout against all prototypes as one matrix product:
+- if the best vibe beats the second best by at least `margin` cosine similarity, the vibe analysis
+  is answered from the similarities and no chat completion is made
+- otherwise (or if the embedding request fails) the workout escalates to the LLM vibe classifier
+
+The prototype matrix is cached per embedding model and vibe definitions in
+{cache_dir}/vibe_prototypes, workout embeddings per video id in {cache_dir}/vibe_embeddings
+(see embedding_store.py), so reruns make no embedding requests.
+
+Usage:
+    preclassifier = get_vibe_preclassifier(openai_api_key, "vibes_info.csv", cache_dir="cache", margin=0.05)
+    analysis = preclassifier.classify(video_id, meta)  # None: ask the LLM
+"""
+import csv
+import hashlib
+import os
+
+import numpy as np
+
+from .classifier_engine import METRICS, get_openai_client
+from .embedding_store import save_embedding_matrix, load_embedding_matrix, write_embedding_cache, read_embedding_cache
+
+# Embedding model of the prototypes and the workouts, as in workout_embeddings_generator.py
+VIBE_EMBEDDING_MODEL = "text-embedding-3-large"
+# Softmax temperature turning cosine similarities into vibe scores
+SCORE_TEMPERATURE = 0.02
+# Vibes reported per workout (the vibe schema allows 1 to 3)
+MAX_VIBES = 3
+# Characters of workout metadata embedded (the model accepts about 8k tokens)
+MAX_EMBEDDING_CHARS = 24000
+
+# Pre-classifiers of this process, keyed by (pid, vibes_info_path, api_key, base_url, cache_dir, margin)
+_PRECLASSIFIERS = {}
+
+
+def load_vibe_prototypes(csv_path):
+    """
+    Load the vibe definitions to embed from a vibes_info.csv.
+
+    Returns:
+        tuple: (vibe names as in the vibe schema, prototype texts)
+    """
+    names = []
+    texts = []
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            name = (row.get('Workout Vibe') or '').strip()
+            if not name:
+                continue
+            # The schema enum uses straight apostrophes
+            names.append(name.replace('’', "'"))
+            texts.append(
+                f"Workout Vibe: {name}. "
+                f"Description: {row.get('Vibe Description', '')}. "
+                f"Example Workouts: {row.get('Example Workouts', '')}. "
+                f"Best For: {row.get('Best For', '')}"
+            )
+    return names, texts
+
+
+def normalize_rows(matrix):
+    """Scale every row to unit length, so dot products are cosine similarities."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class VibePreclassifier:
+    """Answers the vibe classifier from embedding similarities when the best vibe is clear."""
+
+    def __init__(self, oai_client, cache_dir, margin, csv_path, model=VIBE_EMBEDDING_MODEL):
+        """
+        Args:
+            oai_client: OpenAI client for the embedding requests
+            cache_dir (str): Classifier cache directory
+            margin (float): Minimum top-1/top-2 cosine similarity margin to answer without the LLM
+            csv_path (str): Vibe definitions (vibes_info.csv)
+            model (str): Embedding model
+        """
+        self.oai_client = oai_client
+        self.margin = margin
+        self.model = model
+        self.embedding_dir = os.path.join(cache_dir, "vibe_embeddings")
+        os.makedirs(self.embedding_dir, exist_ok=True)
+
+        self.names, texts = load_vibe_prototypes(csv_path)
+        self.prototypes = normalize_rows(self._load_prototypes(cache_dir, texts))
+
+    def _load_prototypes(self, cache_dir, texts):
+        """Prototype matrix of the vibe texts, embedded on first use and cached afterwards."""
+        fingerprint = hashlib.sha256("\n".join([self.model] + texts).encode('utf-8')).hexdigest()[:16]
+        prototype_dir = os.path.join(cache_dir, "vibe_prototypes")
+        matrix_path = os.path.join(prototype_dir, f"{fingerprint}.npy")
+        if os.path.exists(matrix_path):
+            matrix, _ = load_embedding_matrix(matrix_path, mmap=False)
+            return matrix
+
+        print(f"Embedding {len(texts)} vibe prototypes with {self.model}")
+        embeddings = self._embed(texts)
+        os.makedirs(prototype_dir, exist_ok=True)
+        save_embedding_matrix(matrix_path, self.names, embeddings)
+        return embeddings
+
+    def _embed(self, texts):
+        response = self.oai_client.embeddings.create(model=self.model, input=texts)
+        METRICS["embedding_calls"] += 1
+        if response.usage is not None:
+            METRICS["embedding_tokens"] += response.usage.prompt_tokens
+        embeddings = [None] * len(texts)
+        for item in response.data:
+            embeddings[item.index] = item.embedding
+        return embeddings
+
+    def embed_workout(self, video_id, text):
+        """
+        Metadata embedding of a workout, from the cache when the metadata is unchanged.
+
+        Returns:
+            np.ndarray: Unit-length embedding
+        """
+        text = text[:MAX_EMBEDDING_CHARS]
+        cache_id = str(video_id)
+        cached = read_embedding_cache(self.embedding_dir, cache_id) if video_id is not None else None
+        if cached is not None and cached.get("description") == text:
+            return normalize_rows(cached["embedding"])
+
+        embedding = self._embed([text])[0]
+        if video_id is not None:
+            write_embedding_cache(self.embedding_dir, cache_id, text, embedding, cache_format="npy")
+        return normalize_rows(embedding)
+
+    def score(self, video_id, text):
+        """
+        Cosine similarity of a workout to every vibe prototype.
+
+        Returns:
+            np.ndarray: One similarity per vibe, in the order of self.names
+        """
+        return self.prototypes @ self.embed_workout(video_id, text)
+
+    def classify(self, video_id, meta):
+        """
+        Vibe analysis of a workout if the best vibe is clear enough.
+
+        Args:
+            video_id: Id the workout embedding is cached under
+            meta: Workout metadata, a dict with 'text' or the text itself
+
+        Returns:
+            dict or None: Analysis in the vibe schema, or None to escalate to the LLM
+        """
+        text = meta["text"] if isinstance(meta, dict) else meta
+        try:
+            similarities = self.score(video_id, text)
+        except Exception as e:
+            print(f"Vibe embedding failed for {video_id}, asking the LLM: {str(e)}")
+            METRICS["preclassifier_escalations"] += 1
+            return None
+
+        order = np.argsort(similarities)[::-1]
+        top_margin = float(similarities[order[0]] - similarities[order[1]])
+        if top_margin < self.margin:
+            METRICS["preclassifier_escalations"] += 1
+            return None
+
+        scores = np.exp((similarities - similarities[order[0]]) / SCORE_TEMPERATURE)
+        scores /= scores.sum()
+        vibes = [{"name": self.names[i], "score": round(float(scores[i]), 2)} for i in order[:MAX_VIBES]]
+        vibes = [vibe for vibe in vibes if vibe["score"] > 0] or vibes[:1]
+        METRICS["preclassified"] += 1
+        return {
+            "vibes": vibes,
+            "vibesConfidence": round(float(scores[order[0]]), 2),
+            "vibesExplanation": (
+                f"Embedding pre-classifier: cosine similarity {similarities[order[0]]:.3f} to "
+                f"{self.names[order[0]]}, {top_margin:.3f} above {self.names[order[1]]}."
+            )
+        }
+
+
+def get_vibe_preclassifier(openai_api_key, vibes_info_path, openai_base_url=None, cache_dir='cache', margin=0.05):
+    """
+    Vibe pre-classifier of the current process, created on first use, so the prototypes are
+    loaded once per worker.
+
+    Args:
+        openai_api_key (str): OpenAI API key
+        vibes_info_path (str): Vibe definitions of the pipeline (vibes_info.csv)
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+        cache_dir (str): Classifier cache directory
+        margin (float): Minimum top-1/top-2 cosine similarity margin to answer without the LLM
+
+    Returns:
+        VibePreclassifier: The pre-classifier
+    """
+    key = (os.getpid(), vibes_info_path, openai_api_key, openai_base_url, str(cache_dir), margin)
+    if key not in _PRECLASSIFIERS:
+        _PRECLASSIFIERS[key] = VibePreclassifier(get_openai_client(openai_api_key, openai_base_url),
+                                                 cache_dir, margin, vibes_info_path)
+    return _PRECLASSIFIERS[key]
@@ -0,0 +1,200 @@
+"""
+Local stand-in for the OpenAI Files and Batch API used by batch mode.
+
+Implements the endpoints batch_runner.py calls:
+- POST /v1/files uploads a JSONL request file (multipart form)
+- POST /v1/batches creates a batch for an uploaded file
+- GET /v1/batches/{id} reports "in_progress" until --delay seconds have passed, then "completed"
+- GET /v1/files/{id}/content returns an uploaded file or the output file of a batch
+Every request of a batch is answered with a canned chat completion whose content is built from
+the request's JSON schema (first enum value, minimum item count), so runs need no network:
+    python batch_mock_server.py --port 8767 --delay 2
+    python csv_processor_mp.py --batch-mode --batch-poll-interval 1 --openai-base-url http://127.0.0.1:8767/v1
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def schema_example(schema, index=0):
+    """Smallest value that satisfies a JSON schema; index picks the enum value for list items."""
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = next((t for t in schema_type if t != "null"), "null")
+    if "enum" in schema:
+        return schema["enum"][index % len(schema["enum"])]
+    if schema_type == "object":
+        return {name: schema_example(prop) for name, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [schema_example(schema.get("items", {}), i) for i in range(max(schema.get("minItems", 1), 1))]
+    if schema_type in ("number", "integer"):
+        return schema.get("maximum", schema.get("minimum", 1))
+    if schema_type == "boolean":
+        return False
+    if schema_type == "string":
+        return "Mock batch response"
+    return None
+
+
+def canned_output_line(request):
+    """Batch output line answering one JSONL request line."""
+    body = request.get("body", {})
+    schema = body.get("response_format", {}).get("json_schema", {}).get("schema", {})
+    completion = {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": json.dumps(schema_example(schema))}
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    }
+    return json.dumps({
+        "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+        "custom_id": request.get("custom_id"),
+        "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": completion},
+        "error": None
+    })
+
+
+def make_handler(delay):
+    files = {}
+    batches = {}
+    lock = threading.Lock()
+
+    def new_file(content, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        files[file_id] = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "content": content
+        }
+        return files[file_id]
+
+    def batch_state(batch):
+        """Batch object as returned by the API, completing it once the delay has passed."""
+        if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= delay:
+            lines = [line for line in files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+                     if line.strip()]
+            output = "\n".join(canned_output_line(json.loads(line)) for line in lines) + "\n"
+            batch["output_file_id"] = new_file(output.encode("utf-8"), f"{batch['id']}_output.jsonl",
+                                               "batch_output")["id"]
+            batch["status"] = "completed"
+            batch["completed_at"] = int(time.time())
+            batch["request_counts"] = {"total": len(lines), "completed": len(lines), "failed": 0}
+        return batch
+
+    class BatchMockHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            path = self.path.rstrip("/")
+            with lock:
+                if path.endswith("/files"):
+                    # Multipart form with the fields "purpose" and "file"
+                    message = BytesParser(policy=default_policy).parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+                    )
+                    fields = {}
+                    filename = "upload.jsonl"
+                    for part in message.iter_parts():
+                        name = part.get_param("name", header="content-disposition")
+                        fields[name] = part.get_payload(decode=True)
+                        if name == "file":
+                            filename = part.get_filename() or filename
+                    file = new_file(fields.get("file", b""), filename, fields.get("purpose", b"batch").decode("utf-8"))
+                    self._send_json({key: value for key, value in file.items() if key != "content"})
+                elif path.endswith("/batches"):
+                    request = json.loads(body)
+                    if request.get("input_file_id") not in files:
+                        self._send_json({"error": {"message": "No such file"}}, 404)
+                        return
+                    batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+                    batches[batch_id] = {
+                        "id": batch_id,
+                        "object": "batch",
+                        "endpoint": request.get("endpoint"),
+                        "input_file_id": request["input_file_id"],
+                        "completion_window": request.get("completion_window", "24h"),
+                        "status": "in_progress",
+                        "created_at": int(time.time()),
+                        "output_file_id": None,
+                        "error_file_id": None,
+                        "request_counts": {"total": 0, "completed": 0, "failed": 0}
+                    }
+                    self._send_json(batch_state(batches[batch_id]))
+                else:
+                    self._send_json({"error": {"message": f"Unknown endpoint {self.path}"}}, 404)
+
+        def do_GET(self):
+            parts = self.path.rstrip("/").split("/")
+            with lock:
+                if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in batches:
+                    self._send_json(batch_state(batches[parts[-1]]))
+                elif len(parts) >= 3 and parts[-1] == "content" and parts[-2] in files:
+                    data = files[parts[-2]]["content"]
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/octet-stream")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self._send_json({"error": {"message": f"Not found: {self.path}"}}, 404)
+
+        def _send_json(self, payload, status=200):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return BatchMockHandler
+
+
+def start_mock_server(port=0, delay=0.0):
+    """
+    Start the mock server in a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 for any free port
+        delay (float): Seconds before a batch completes
+
+    Returns:
+        tuple: (server, base_url); stop the server with server.shutdown()
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the OpenAI Files and Batch API')
+    parser.add_argument('--port', type=int, default=8767,
+                        help='Port to listen on')
+    parser.add_argument('--delay', type=float, default=2.0,
+                        help='Seconds before a batch completes')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.delay))
+    print(f"Serving batch mock on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
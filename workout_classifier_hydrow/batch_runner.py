@@ -0,0 +1,268 @@
+"""
+Classify workouts through the OpenAI Batch API instead of one synchronous call per classifier.
+
+Batch requests cost half as much as synchronous ones and do not count against the
+per-minute rate limits, at the price of completing within 24 hours instead of seconds.
+The batch run only fills the classifier cache:
+1. every uncached (workout, classifier) prompt is written to a JSONL batch request file
+2. the file is uploaded, the batch is created and polled until it finishes
+3. the results go through the same Hydrow rules as synchronous results and are cached
+   under the classifier fingerprint
+The normal csv_processor_mp path then finds every result in the cache and only runs
+transform_to_db_structure. Requests that failed in the batch are retried synchronously there.
+
+Any OpenAI-compatible server implementing /v1/files and /v1/batches can stand in for the
+API by passing its base URL (see --openai-base-url in csv_processor_mp.py), e.g. batch_mock_server.py.
+"""
+import json
+import os
+import sys
+import time
+
+from openai import OpenAI
+
+# Modules shared by the pipelines live in workout_classifier_common at the repository root
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from workout_classifier_common.cache_store import open_cache_store
+from workout_classifier_common.classifier_engine import CLASSIFIER_MODEL, build_classifier_messages, read_cached_result
+from unified_workout_classifier import build_hydrow_classifiers, prepare_hydrow_classifier, extract_hydrow_meta_from_json
+
+# Maximum number of requests the Batch API accepts in one input file
+BATCH_MAX_REQUESTS = 50000
+# Input files are limited to 200 MB; image URLs can make requests large, so keep a margin
+BATCH_MAX_BYTES = 190 * 1024 * 1024
+
+# Batch statuses after which the batch does not change anymore
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def collect_batch_requests(workout_jsons, enabled_features, cache_store, force_refresh=False):
+    """
+    Build a Batch API request for every enabled classifier whose result is not cached.
+
+    Args:
+        workout_jsons (list): Hydrow workout jsons (dicts)
+        enabled_features (dict): Enabled classifiers and 'image' flag, as in csv_processor_mp
+        cache_store: Cache store the results will be written to
+        force_refresh (bool): Whether to request results that are already cached
+
+    Returns:
+        tuple: (requests, pending) - JSONL request lines and, per custom_id, the
+        (video_id, classifier name, prompt_version, postprocess) needed to cache the result
+    """
+    classifiers = build_hydrow_classifiers(
+        enable_category=enabled_features['category'],
+        enable_fitness_level=enabled_features['fitness_level'],
+        enable_vibe=enabled_features['vibe'],
+        enable_spirit=enabled_features['spirit'],
+        enable_equipment=enabled_features['equipment']
+    )
+
+    requests = []
+    pending = {}
+    for workout_json in workout_jsons:
+        video_id = workout_json.get("id")
+        meta = extract_hydrow_meta_from_json(workout_json)
+        if not enabled_features['image']:
+            del meta['image']
+
+        # Classifiers are prepared in the same order as in analyse_hydrow_workout,
+        # since the fitness level rules extend meta for the classifiers after it
+        for classifier in classifiers:
+            if not classifier["enabled"]:
+                continue
+
+            name = classifier["name"]
+            analysis, request_meta, postprocess, _ = prepare_hydrow_classifier(classifier, workout_json, meta)
+            if analysis is not None:
+                # Classifiers resolved by rules need no OpenAI call
+                continue
+
+            if not force_refresh and read_cached_result(cache_store, video_id, classifier) is not None:
+                continue
+
+            custom_id = f"{video_id}:{name}"
+            requests.append({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": CLASSIFIER_MODEL,
+                    "response_format": classifier["response_format"],
+                    "messages": build_classifier_messages(
+                        request_meta,
+                        classifier["system_prompt"],
+                        classifier["user_prompt"]
+                    )
+                }
+            })
+            pending[custom_id] = (video_id, name, classifier["prompt_version"], postprocess)
+
+    return requests, pending
+
+
+def batch_line(request):
+    """JSONL line of a batch request, as written to the input file."""
+    return json.dumps(request, ensure_ascii=False) + "\n"
+
+
+def chunk_batch_requests(requests, max_requests=BATCH_MAX_REQUESTS, max_bytes=BATCH_MAX_BYTES):
+    """
+    Split batch requests into input files within the request and size limits.
+
+    Returns:
+        list: Lists of requests, one per batch
+    """
+    chunks = []
+    chunk = []
+    chunk_bytes = 0
+    for request in requests:
+        size = len(batch_line(request).encode('utf-8'))
+        if chunk and (len(chunk) >= max_requests or chunk_bytes + size > max_bytes):
+            chunks.append(chunk)
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(request)
+        chunk_bytes += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def write_batch_file(requests, batch_path):
+    """Write batch requests as JSON lines."""
+    with open(batch_path, 'w', encoding='utf-8') as f:
+        for request in requests:
+            f.write(batch_line(request))
+
+
+def submit_batch(oai_client, batch_path):
+    """
+    Upload a JSONL request file and create a batch for it.
+
+    Returns:
+        Batch: The created batch
+    """
+    with open(batch_path, 'rb') as f:
+        batch_file = oai_client.files.create(file=f, purpose="batch")
+
+    return oai_client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+
+
+def wait_for_batch(oai_client, batch_id, poll_interval=60):
+    """
+    Poll a batch until it reaches a final status.
+
+    Returns:
+        Batch: The finished batch
+    """
+    while True:
+        batch = oai_client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            print(f"Batch {batch_id}: {batch.status} "
+                  f"({counts.completed}/{counts.total} completed, {counts.failed} failed)")
+        else:
+            print(f"Batch {batch_id}: {batch.status}")
+
+        if batch.status in BATCH_FINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def read_batch_output(oai_client, batch):
+    """
+    Download the output file of a finished batch.
+
+    Returns:
+        dict: Parsed classifier result (or error information) keyed by custom_id
+    """
+    results = {}
+    if not batch.output_file_id:
+        return results
+
+    content = oai_client.files.content(batch.output_file_id).text
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        custom_id = entry.get("custom_id")
+        response = entry.get("response") or {}
+
+        if entry.get("error") or response.get("status_code") != 200:
+            results[custom_id] = {"error": f"Batch request failed: {entry.get('error') or response.get('body')}"}
+            continue
+
+        try:
+            content_str = response["body"]["choices"][0]["message"]["content"]
+            results[custom_id] = json.loads(content_str)
+        except Exception as e:
+            results[custom_id] = {"error": f"Error parsing batch response: {str(e)}"}
+
+    return results
+
+
+def run_batch_classification(workout_jsons, openai_api_key, cache_dir, enabled_features,
+                             cache_backend='json', force_refresh=False, openai_base_url=None,
+                             poll_interval=60, max_requests_per_batch=BATCH_MAX_REQUESTS,
+                             max_bytes_per_batch=BATCH_MAX_BYTES):
+    """
+    Classify all uncached (workout, classifier) pairs through the Batch API and cache the results.
+
+    Args:
+        workout_jsons (list): Hydrow workout jsons (dicts)
+        openai_api_key (str): OpenAI API key
+        cache_dir (str): Cache directory, also holds the batch request files
+        enabled_features (dict): Enabled classifiers and 'image' flag, as in csv_processor_mp
+        cache_backend (str): 'json' or 'sqlite'
+        force_refresh (bool): Whether to request results that are already cached
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+        poll_interval (float): Seconds between batch status checks
+        max_requests_per_batch (int): Requests per batch input file
+        max_bytes_per_batch (int): Size of a batch input file in bytes
+
+    Returns:
+        dict: Number of 'requested', 'cached' and 'failed' classifier results
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_store = open_cache_store(cache_dir, cache_backend)
+    requests, pending = collect_batch_requests(workout_jsons, enabled_features, cache_store, force_refresh)
+    stats = {"requested": len(requests), "cached": 0, "failed": 0}
+    print(f"Batch mode: {len(requests)} classifier requests are not cached")
+    if not requests:
+        return stats
+
+    oai_client = OpenAI(api_key=openai_api_key, base_url=openai_base_url)
+    batch_dir = os.path.join(cache_dir, "batches")
+    os.makedirs(batch_dir, exist_ok=True)
+
+    for number, chunk in enumerate(chunk_batch_requests(requests, max_requests_per_batch, max_bytes_per_batch)):
+        batch_path = os.path.join(batch_dir, f"batch_requests_{int(time.time())}_{number}.jsonl")
+        write_batch_file(chunk, batch_path)
+
+        batch = submit_batch(oai_client, batch_path)
+        print(f"Submitted batch {batch.id} with {len(chunk)} requests ({batch_path})")
+        batch = wait_for_batch(oai_client, batch.id, poll_interval)
+
+        results = read_batch_output(oai_client, batch)
+        for request in chunk:
+            custom_id = request["custom_id"]
+            video_id, name, prompt_version, postprocess = pending[custom_id]
+            analysis = results.get(custom_id, {"error": f"Batch {batch.id} returned no result ({batch.status})"})
+            if "error" in analysis:
+                # Left uncached, so the synchronous path retries it
+                print(f"Batch request {custom_id} failed: {analysis['error']}")
+                stats["failed"] += 1
+                continue
+            cache_store.put(video_id, name, postprocess(analysis), prompt_version)
+            stats["cached"] += 1
+
+    print(f"Batch mode: cached {stats['cached']} results, {stats['failed']} failed")
+    return stats
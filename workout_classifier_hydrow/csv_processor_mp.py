@@ -1,45 +1,139 @@
-import pandas as pd
 import csv
 import json
 import os
 import re
+import sys
 import argparse
 from tqdm import tqdm
 from multiprocessing import Pool
+from threading import BoundedSemaphore
+from collections import Counter
 import time 
 
 from env_utils import load_api_keys
-from unified_workout_classifier import analyse_hydrow_workout, extract_video_id, return_error_analysis
+
+# Modules shared by the pipelines live in workout_classifier_common at the repository root
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from workout_classifier_common.rate_limiter import SharedRateLimiter, init_worker_rate_limiter
+from workout_classifier_common.cache_store import SqliteCacheStore, SQLITE_CACHE_FILE
+from workout_classifier_common.result_writer import ResultWriter
+from workout_classifier_common.rule_engine import summarize_rule_decisions
+from workout_classifier_common.classifier_engine import summarize_execution_metrics
+from unified_workout_classifier import analyse_hydrow_workout, return_error_analysis
+from batch_runner import run_batch_classification
 from json_stats_collection import flatten_json
 from db_transformer import transform_to_db_structure
 
 
-def is_hydrow_meta(value):
+# Workouts read ahead of the pool; bounds the parsed JSONs held in memory
+MAX_QUEUED_WORKOUTS = 64
+
+
+def parse_hydrow_meta(value):
     """
-    Check if a value is a valid Hydrow workout JSON (real or stringified).
+    Parse a Hydrow workout JSON (real or stringified).
     It must contain an image.bucket field starting with 'hydrow'.
 
     Args:
         value (str or dict): Potential JSON input
 
     Returns:
-        bool: True if valid Hydrow workout metadata
+        dict or None: The workout JSON, or None if the value is not Hydrow workout metadata
     """
     if isinstance(value, str):
+        # Cheap check first, most cells are not JSON objects at all
+        if not value.lstrip().startswith("{"):
+            return None
         try:
             value = json.loads(value)
         except json.JSONDecodeError:
-            return False
+            return None
 
     if not isinstance(value, dict):
-        return False
+        return None
 
     image = value.get("image")
     if not isinstance(image, dict):
-        return False
+        return None
 
     bucket = image.get("bucket")
-    return isinstance(bucket, str) and bucket.startswith("hydrow")
+    return value if isinstance(bucket, str) and bucket.startswith("hydrow") else None
+
+
+def is_hydrow_meta(value):
+    """Check if a value is a valid Hydrow workout JSON (real or stringified)."""
+    return parse_hydrow_meta(value) is not None
+
+
+def iter_workout_jsons(input_csv_path, max_workouts=None, stats=None, skip_ids=None):
+    """
+    Stream the unique Hydrow workout JSONs of a CSV file, row by row.
+
+    The first Hydrow JSON cell of every row is parsed once; workouts without an id get
+    'manual_<n>' as id. Workouts whose id was seen before are skipped.
+
+    Args:
+        input_csv_path (str): CSV file with Hydrow JSONs in any column
+        max_workouts (int, optional): Stop after this many unique workouts
+        stats (dict, optional): Receives the 'rows', 'found', 'unique' and 'skipped' counts
+        skip_ids (set, optional): Ids (as text) to skip, e.g. those already in a resumed output
+
+    Yields:
+        dict: Workout JSON
+    """
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, found=0, unique=0, skipped=0)
+    seen = set()
+    skip_ids = skip_ids or set()
+    csv.field_size_limit(sys.maxsize)
+    with open(input_csv_path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header
+        for row in reader:
+            stats['rows'] += 1
+            schema = None
+            for cell in row:
+                schema = parse_hydrow_meta(cell)
+                if schema is not None:
+                    break
+            if schema is None:
+                continue
+
+            stats['found'] += 1
+            video_id = schema.get("id")
+            if not video_id:
+                video_id = f"manual_{stats['found'] - 1}"
+                schema['id'] = video_id
+            if video_id in seen:
+                continue
+            seen.add(video_id)
+            if str(video_id) in skip_ids:
+                stats['skipped'] += 1
+                continue
+
+            stats['unique'] += 1
+            yield schema
+            if max_workouts and stats['unique'] >= max_workouts:
+                return
+
+
+def bounded_tasks(tasks, semaphore):
+    """Yield tasks, waiting for a free slot of semaphore before each one; release a slot per finished task."""
+    for task in tasks:
+        semaphore.acquire()
+        yield task
+
+
+def is_classifiable(schema):
+    """
+    Check if a Hydrow workout has enough metadata to be classified:
+    it needs a musicGenre, unless it is a Journey workout.
+    """
+    flat_schema = flatten_json(schema)
+    return any(k.endswith("musicGenre") for k in flat_schema) or "Journey" in flat_schema['category.name']
 
 
 def analyze_workout(args):
@@ -47,18 +141,12 @@ def analyze_workout(args):
     Analyze a single Hydrow workout JSON entry. Used for parallel processing.
 
     Args:
-        args (tuple): (index, raw_json, openai_api_key, enabled_features dict, include_image bool, process_id)
+        args (tuple): (schema, openai_api_key, enabled_features dict, process_id, cache_dir_path, execution_options dict)
 
     Returns:
         dict or None: Structured result dictionary or None if analysis failed
     """
-    raw_json, openai_api_key, enabled_features, process_id, cache_dir_path = args
-
-    try:
-        schema = json.loads(raw_json)
-    except Exception:
-        print(f"Process {process_id}: Failed to parse JSON")
-        return return_error_analysis("Failed to parse JSON", None)
+    schema, openai_api_key, enabled_features, process_id, cache_dir_path, execution_options = args
 
     try:
         idx = schema.get("id")
@@ -68,12 +156,9 @@ def analyze_workout(args):
         
     if idx == 7573 or idx==8310 or idx==9800 or idx==8723:
         pass
-    flat_schema = flatten_json(schema)
-    if not any(k.endswith("musicGenre") for k in flat_schema) and not "Journey" in flat_schema['category.name']:
+    if not is_classifiable(schema):
         print(f"Process {process_id}: Skipping workout #{idx} — no musicGenre")
         return return_error_analysis("No musicGenre", schema)
-    if "Journey" in flat_schema['category.name']:
-        pass
 
     video_id = idx
     
@@ -89,7 +174,13 @@ def analyze_workout(args):
             enable_vibe=enabled_features['vibe'],
             enable_spirit=enabled_features['spirit'],
             enable_equipment=enabled_features['equipment'],
-            enable_image_in_meta=enabled_features['image']
+            enable_image_in_meta=enabled_features['image'],
+            cache_backend=execution_options['cache_backend'],
+            openai_base_url=execution_options['openai_base_url'],
+            enable_async=execution_options['async'],
+            max_concurrency=execution_options['max_concurrency'],
+            enable_combined=execution_options['combined'],
+            vibe_margin=execution_options['vibe_margin']
         )
 
 
@@ -97,6 +188,8 @@ def analyze_workout(args):
             print(f"Process {process_id}: Error during analysis: {result['error']}")
             return return_error_analysis("Error during analysis.", schema)
 
+        # Counted for the run summary, not part of the stored analysis
+        execution_metrics = result.pop('execution_metrics', {})
         db_structure = transform_to_db_structure(result)
 
         output_data = {
@@ -129,6 +222,8 @@ def analyze_workout(args):
             'secondary_effort_difficulty': db_structure.get('secondary_effort_difficulty', ''),
             'tertiary_effort_difficulty': db_structure.get('tertiary_effort_difficulty', ''),
             'full_analysis_json': json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True),
+            'rule_decisions': result.get('rule_decisions', {}),
+            'execution_metrics': execution_metrics,
             'hydrow_category_name':db_structure.get('hydrow_category_name', ''),
             'instructor_name':db_structure.get('instructor_name', ''),
             'duration_seconds':db_structure.get('duration_seconds', ''),
@@ -142,53 +237,28 @@ def analyze_workout(args):
         return return_error_analysis("Unexpected error for workout.", schema)
 
 
-def write_results_to_csv(results, output_csv_path):
-    """
-    Write analysis results to CSV file.
-    Filter out duplicates based on video_id (keeping the first occurrence).
-
-    Args:
-        results (list): List of analysis results
-        output_csv_path (str): Path to output CSV file
-    """
-    valid_results = [r for r in results if r is not None]
-    if not valid_results:
-        print("No valid results to write.")
-        return
-
-    # Deduplicate results based on video_id
-    unique_results = {}
-    for result in valid_results:
-        video_id = result.get('video_id')
-        if video_id and video_id not in unique_results:
-            unique_results[video_id] = result
-
-    # Write to output CSV
-    fieldnames = [
-            'video_id', 'video_url', 'video_title', 'channel_title', 'duration', 'duration_minutes',
-            'category', 'subcategory', 'secondary_category', 'secondary_subcategory',
-            'fitness_level', 'secondary_fitness_level', 'tertiary_fitness_level',
-            'primary_equipment', 'secondary_equipment', 'tertiary_equipment',
-            'primary_spirit', 'secondary_spirit',
-            'primary_vibe', 'secondary_vibe',
-            'reviewable', 'review_comment',
-            'primary_technique_difficulty', 'secondary_technique_difficulty', 'tertiary_technique_difficulty',
-            'primary_effort_difficulty', 'secondary_effort_difficulty', 'tertiary_effort_difficulty',
-            'full_analysis_json', 'instructor_name', 'duration_seconds', 'hydrow_category_name', 'poster_uri'
-    ]
-    with open(output_csv_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writeheader()
-        for result in unique_results.values():
-            writer.writerow(result)
-
-    return unique_results
+# Columns of the output CSV; other result keys are not written
+RESULT_FIELDNAMES = [
+    'video_id', 'video_url', 'video_title', 'channel_title', 'duration', 'duration_minutes',
+    'category', 'subcategory', 'secondary_category', 'secondary_subcategory',
+    'fitness_level', 'secondary_fitness_level', 'tertiary_fitness_level',
+    'primary_equipment', 'secondary_equipment', 'tertiary_equipment',
+    'primary_spirit', 'secondary_spirit',
+    'primary_vibe', 'secondary_vibe',
+    'reviewable', 'review_comment',
+    'primary_technique_difficulty', 'secondary_technique_difficulty', 'tertiary_technique_difficulty',
+    'primary_effort_difficulty', 'secondary_effort_difficulty', 'tertiary_effort_difficulty',
+    'full_analysis_json', 'instructor_name', 'duration_seconds', 'hydrow_category_name', 'poster_uri'
+]
 
 
 def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir_path, max_workouts=None,
                              num_processes=8, enable_category=True, enable_fitness_level=True,
                              enable_vibe=True, enable_spirit=True, enable_equipment=True,
-                             include_image=False):
+                             include_image=False, requests_per_minute=None, tokens_per_minute=None,
+                             cache_backend='json', import_cache=False,
+                             batch_mode=False, openai_base_url=None, batch_poll_interval=60, resume=False,
+                             enable_async=False, max_concurrency=5, enable_combined=False, vibe_margin=None):
     """
     Process Hydrow workout JSONs from a CSV using multiprocessing.
 
@@ -203,6 +273,23 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir_path, max
         enable_spirit (bool): Whether to classify by spirit
         enable_equipment (bool): Whether to extract equipment
         include_image (bool): Whether to include image in analysis
+        requests_per_minute (int, optional): OpenAI requests per minute shared by all processes
+        tokens_per_minute (int, optional): OpenAI tokens per minute shared by all processes
+        cache_backend (str): Where classifier results are cached: 'json' (one file per result) or 'sqlite'
+        import_cache (bool): Whether to import the JSON cache files into the SQLite cache before processing
+        batch_mode (bool): Whether to classify uncached workouts through the OpenAI Batch API first
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+        batch_poll_interval (float): Seconds between batch status checks in batch mode
+        resume (bool): Whether to keep the rows of an existing output and only analyze workouts missing from it
+        enable_async (bool): Whether to run the classifiers of each workout concurrently
+        max_concurrency (int): Maximum number of concurrent OpenAI requests per workout in async mode
+        enable_combined (bool): Whether to classify each workout with one combined OpenAI request
+        vibe_margin (float, optional): Top-1/top-2 similarity margin above which the vibe is taken from
+            embeddings instead of OpenAI; None always asks OpenAI
+
+    Returns:
+        dict: Counts of the run: 'found', 'unique', 'skipped', 'processed', 'written', 'reviewable'
+              'rule_decisions' ((classifier, decision) -> count) and 'execution_metrics' (see classifier_engine.py)
     """
     start_time = time.time()
     
@@ -218,59 +305,21 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir_path, max
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-      
-    # Read the input CSV file
-    try:
-        df = pd.read_csv(input_csv_path)
-        print(f"Successfully read CSV file with {len(df)} rows")
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        return
-      
-    df.columns = df.columns.astype(str)
 
-    # Get all columns
-    columns = df.columns.tolist()
-    if len(columns) < 1:
-        print(f"CSV file has insufficient columns: {columns}")
+    # Workouts are streamed from the CSV into the pool while earlier ones are analysed
+    if not os.path.exists(input_csv_path):
+        print(f"Error reading CSV file: {input_csv_path} does not exist")
         return
 
-    all_jsons = []
-    for _, row in df.iterrows():
-        for col in df.columns:
-            cell = str(row[col])
-            if is_hydrow_meta(cell):
-                all_jsons.append(cell)
-                break
-
-    print(f"Found {len(all_jsons)} valid Hydrow JSON entries")
-
-    
-    # Deduplicate URLs based on video_id
-    unique_jsons = {}
-    for js, json_str in enumerate(all_jsons):
-        video_id = extract_video_id(json_str, js)
-        if video_id and video_id not in unique_jsons:
-            unique_jsons[video_id] = json_str
-    
-    deduplicated_jsons = list(unique_jsons.values())
-    
-    # Limit the number of workouts to process if specified
+    # Results are appended to the output as they arrive; a resumed run skips the workouts already in it
+    result_writer = ResultWriter(output_csv_path, RESULT_FIELDNAMES, resume=resume)
+    if result_writer.resumed:
+        print(f"Resuming {output_csv_path}: {result_writer.resumed} workouts already analyzed")
+    ingest_stats = {}
+    workouts = iter_workout_jsons(input_csv_path, max_workouts, ingest_stats, skip_ids=set(result_writer.video_ids))
     if max_workouts and max_workouts > 0:
-        deduplicated_jsons = deduplicated_jsons[:max_workouts]
         print(f"Limited to processing {max_workouts} JSONs")
 
-    total_jsons = len(all_jsons)
-    unique_count = len(deduplicated_jsons)
-    print(f"Found {total_jsons} total YouTube URLs in the CSV")
-    print(f"After deduplication: {unique_count} unique JSONs")
-
-    # Check if we have more processes than videos
-    actual_processes = min(num_processes, max(1, len(deduplicated_jsons)))
-    if actual_processes != num_processes:
-        print(f"Using {actual_processes} processes for {len(deduplicated_jsons)} URLs")
-
-  
     enabled_features = {
         'category': enable_category,
         'fitness_level': enable_fitness_level,
@@ -280,67 +329,109 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir_path, max
         'image': include_image
     }
 
-    # Create batches of URLs for each process
-    batch_size = len(deduplicated_jsons) // actual_processes
-    if len(deduplicated_jsons) % actual_processes != 0:
-        batch_size += 1
+    # Move existing per-workout JSON cache files into the SQLite cache
+    if cache_backend == 'sqlite' and import_cache:
+        os.makedirs(cache_dir_path, exist_ok=True)
+        cache_store = SqliteCacheStore(os.path.join(cache_dir_path, SQLITE_CACHE_FILE))
+        imported = cache_store.import_json_dir(cache_dir_path)
+        cache_store.close()
+        print(f"Imported {imported} cached analyses into the SQLite cache")
+
+    execution_options = {
+        'cache_backend': cache_backend,
+        'openai_base_url': openai_base_url,
+        'async': enable_async,
+        'max_concurrency': max_concurrency,
+        'combined': enable_combined,
+        'vibe_margin': vibe_margin
+    }
 
-    # Split URLs into batches
-    json_batches = []
-    for i in range(0, len(deduplicated_jsons), batch_size):
-        batch = deduplicated_jsons[i:i + batch_size]
-        json_batches.append(batch)
+    # Fill the cache through the Batch API, the pool below then only reads from it.
+    # The batch needs every workout up front, so the CSV is read completely here
+    if batch_mode:
+        workouts = list(workouts)
+        batch_workouts = [schema for schema in workouts if is_classifiable(schema)]
+        run_batch_classification(
+            batch_workouts,
+            openai_api_key,
+            cache_dir_path,
+            enabled_features,
+            cache_backend=cache_backend,
+            openai_base_url=openai_base_url,
+            poll_interval=batch_poll_interval
+        )
 
-    # Print batch information
-    print(f"Split {len(deduplicated_jsons)} JSONs into {len(json_batches)} batches")
+    # Tasks with a rotating process label; at most MAX_QUEUED_WORKOUTS wait for a worker at any time
+    queue_slots = BoundedSemaphore(MAX_QUEUED_WORKOUTS)
+    process_args = (
+        (schema, openai_api_key, enabled_features, i % num_processes, cache_dir_path, execution_options)
+        for i, schema in enumerate(workouts)
+    )
 
-    # Prepare arguments for each process
-    process_args = []
-    for i, batch in enumerate(json_batches):
-        # Flatten the batch into individual tasks with process ID
-        for el in batch:
-            process_args.append((el, openai_api_key, enabled_features, i, cache_dir_path))
+    # Share one OpenAI rate limit budget between all processes
+    rate_limiter = None
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = SharedRateLimiter(requests_per_minute, tokens_per_minute)
+        print(f"Rate limiting OpenAI calls to {requests_per_minute or 'unlimited'} requests/min "
+              f"and {tokens_per_minute or 'unlimited'} tokens/min")
 
     # Process URLs in parallel using a pool with progress bar
-    print(f"Starting parallel processing with {actual_processes} processes")
+    print(f"Starting parallel processing with {num_processes} processes")
 
     # Add a global progress bar for all tasks
-    with tqdm(total=len(process_args), desc="Overall Progress") as pbar:
-        with Pool(processes=actual_processes) as pool:
-            # Use imap_unordered with tqdm for progress tracking
-            results = []
-            for result in pool.imap_unordered(analyze_workout, process_args):
-                results.append(result)
+    processed = 0
+    rule_decision_counts = Counter()
+    execution_metrics = Counter()
+    with result_writer, tqdm(total=max_workouts or None, desc="Overall Progress") as pbar:
+        with Pool(processes=num_processes, initializer=init_worker_rate_limiter,
+                  initargs=(rate_limiter,)) as pool:
+            # Use imap_unordered with tqdm for progress tracking; each result is written (deduplicated) right away
+            for result in pool.imap_unordered(analyze_workout, bounded_tasks(process_args, queue_slots)):
+                queue_slots.release()
+                result_writer.write(result)
+                processed += 1
+                for name, decision in ((result or {}).get('rule_decisions') or {}).items():
+                    rule_decision_counts[(name, decision)] += 1
+                execution_metrics.update((result or {}).get('execution_metrics') or {})
                 pbar.update(1)
 
     # Calculate total duration
     end_time = time.time()
     duration = end_time - start_time
 
-    # Write results to CSV (with deduplication)
-    print(f"Processing complete. Writing results to {output_csv_path}")
-    unique_results = write_results_to_csv(results, output_csv_path)
-
     # Count successful analyses
-    successful_analyses = len(unique_results)
+    successful_analyses = result_writer.written
 
     # Count reviewable/non-reviewable
-    reviewable_count = sum(1 for result in unique_results.values() if result.get('reviewable', False))
+    reviewable_count = result_writer.reviewable
     non_reviewable_count = successful_analyses - reviewable_count
 
     print(f"\nProcessing complete!")
-    print(f"Total JSONs found: {total_jsons}")
-    print(f"Unique JSONs found: {unique_count}")
-    print(f"Processed JSONs: {len(deduplicated_jsons)}")
+    print(f"Total JSONs found: {ingest_stats['found']}")
+    print(f"Unique JSONs found: {ingest_stats['unique'] + ingest_stats['skipped']}")
+    if resume:
+        print(f"Skipped JSONs already in the output: {ingest_stats['skipped']}")
+    print(f"Processed JSONs: {processed}")
     print(f"Successful analyses: {successful_analyses}")
     print(f"Reviewable trainings: {reviewable_count}")
     print(f"Non-reviewable trainings: {non_reviewable_count}")
+    summarize_rule_decisions(rule_decision_counts)
+    summarize_execution_metrics(execution_metrics)
     print(f"Results saved to: {output_csv_path}")
     print(f"Total processing time: {duration:.2f} seconds")
-    if len(deduplicated_jsons) > 0:
-        print(f"Average time per workout: {duration / len(deduplicated_jsons):.2f} seconds")
-
-    return results  # Return results for potential further use
+    if processed > 0:
+        print(f"Average time per workout: {duration / processed:.2f} seconds")
+
+    return {
+        'found': ingest_stats['found'],
+        'unique': ingest_stats['unique'] + ingest_stats['skipped'],
+        'skipped': ingest_stats['skipped'],
+        'processed': processed,
+        'written': successful_analyses,
+        'reviewable': reviewable_count,
+        'rule_decisions': dict(rule_decision_counts),
+        'execution_metrics': dict(execution_metrics)
+    }
 
 if __name__ == "__main__":
     # Set up relative locations
@@ -374,6 +465,30 @@ if __name__ == "__main__":
                         help='To include poster image as model input')
     parser.add_argument('--processes', type=int, default=4,
                         help='Number of parallel processes to use')
+    parser.add_argument('--rpm', type=int, default=None,
+                        help='OpenAI requests per minute shared by all processes')
+    parser.add_argument('--tpm', type=int, default=None,
+                        help='OpenAI tokens per minute shared by all processes')
+    parser.add_argument('--cache-backend', type=str, choices=['json', 'sqlite'], default='json',
+                        help='Cache classifier results as one JSON file each or in a single SQLite file')
+    parser.add_argument('--import-cache', action='store_true',
+                        help='Import existing JSON cache files into the SQLite cache before processing')
+    parser.add_argument('--batch-mode', action='store_true',
+                        help='Classify uncached workouts through the OpenAI Batch API before processing')
+    parser.add_argument('--batch-poll-interval', type=float, default=60,
+                        help='Seconds between batch status checks in batch mode')
+    parser.add_argument('--openai-base-url', type=str, default=None,
+                        help='OpenAI-compatible API base URL, e.g. a local mock server')
+    parser.add_argument('--resume', action='store_true',
+                        help='Keep the rows of an existing output file and only analyze workouts missing from it')
+    parser.add_argument('--async', action='store_true', dest='enable_async',
+                        help='Send the classifier requests of each workout concurrently')
+    parser.add_argument('--max-concurrency', type=int, default=5,
+                        help='Maximum number of concurrent OpenAI requests per workout in async mode')
+    parser.add_argument('--combined', action='store_true', dest='enable_combined',
+                        help='Answer all classifiers of a workout with one OpenAI request and a combined schema')
+    parser.add_argument('--vibe-margin', type=float, default=None,
+                        help='Take the vibe from embedding similarity when the best vibe beats the second by this margin (e.g. 0.05)')
     
     
     # Set default values for boolean arguments
@@ -394,8 +509,19 @@ if __name__ == "__main__":
         enable_spirit=args.spirit,
         enable_equipment=args.equipment,
         include_image=args.image,
-        num_processes=args.processes
+        num_processes=args.processes,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        cache_backend=args.cache_backend,
+        import_cache=args.import_cache,
+        batch_mode=args.batch_mode,
+        openai_base_url=args.openai_base_url,
+        batch_poll_interval=args.batch_poll_interval,
+        resume=args.resume,
+        enable_async=args.enable_async,
+        max_concurrency=args.max_concurrency,
+        enable_combined=args.enable_combined,
+        vibe_margin=args.vibe_margin
     )
 
-    # Cannot use results directly here as they are deduplicated in write_results_to_csv function
     print(f"\nProcess completed successfully!")
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Hydrow instructor bio lookup.
+
+The athlete bio CSV is parsed once per process into a dict keyed by the normalized
+instructor name, instead of once per metadata build. Optionally the parsed dict is
+stored as a pickle next to the CSV and loaded from there while it is newer than the CSV:
+    python instructor_bios.py --csv hydrow_athletes_bio.csv
+"""
+import argparse
+import csv
+import os
+import pickle
+
+# Path of the bio CSV, relative to the repository root like the rest of the Hydrow inputs
+ATHLETES_BIO_FILE = 'workout_classifier_hydrow/hydrow_athletes_bio.csv'
+
+# Bio indexes loaded in this process, keyed by (pid, csv path)
+_LOADED_BIOS = {}
+
+
+def normalize_instructor_name(name):
+    """Key of an instructor name in the bio index."""
+    return str(name).strip().lower()
+
+
+def bio_pickle_path(csv_path):
+    """Path of the pickled bio index that belongs to a bio CSV."""
+    return os.path.splitext(csv_path)[0] + ".pkl"
+
+
+def load_instructor_bios(csv_path):
+    """
+    Parse the bio CSV (name in the first column, bio in the second).
+
+    Returns:
+        dict: Bio keyed by normalized instructor name; the first row of a name wins
+    """
+    bios = {}
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header
+        for row in reader:
+            if len(row) < 2:
+                continue
+            bios.setdefault(normalize_instructor_name(row[0]), row[1])
+    return bios
+
+
+def save_instructor_bios(csv_path, pickle_path=None):
+    """Parse the bio CSV and pickle the index; returns the pickle path."""
+    pickle_path = pickle_path or bio_pickle_path(csv_path)
+    with open(pickle_path, 'wb') as f:
+        pickle.dump(load_instructor_bios(csv_path), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return pickle_path
+
+
+def get_instructor_bios(csv_path=ATHLETES_BIO_FILE):
+    """
+    Bio index of a bio CSV, loaded once per process.
+
+    Uses the pickled index if it exists and is at least as new as the CSV.
+
+    Returns:
+        dict or None: Bio keyed by normalized instructor name, None if the CSV does not exist
+    """
+    key = (os.getpid(), os.path.abspath(csv_path))
+    if key not in _LOADED_BIOS:
+        if not os.path.exists(csv_path):
+            print(f"File not found: {csv_path}")
+            _LOADED_BIOS[key] = None
+        else:
+            pickle_path = bio_pickle_path(csv_path)
+            if os.path.exists(pickle_path) and os.path.getmtime(pickle_path) >= os.path.getmtime(csv_path):
+                with open(pickle_path, 'rb') as f:
+                    _LOADED_BIOS[key] = pickle.load(f)
+            else:
+                _LOADED_BIOS[key] = load_instructor_bios(csv_path)
+    return _LOADED_BIOS[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pickle the Hydrow instructor bio index')
+    parser.add_argument('--csv', type=str, default=ATHLETES_BIO_FILE,
+                        help='Athlete bio CSV')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Pickle file (defaults to the CSV path with a .pkl extension)')
+    args = parser.parse_args()
+
+    pickle_path = save_instructor_bios(args.csv, args.output)
+    print(f"Saved instructor bio index to {pickle_path}")
+
+
+if __name__ == "__main__":
+    main()
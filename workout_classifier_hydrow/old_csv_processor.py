@@ -7,7 +7,7 @@ import argparse
 import json
 from tqdm import tqdm  # For progress bar
 from env_utils import load_api_keys
-from unified_workout_classifier import analyse_hydrow_workout, cache_data
+from unified_workout_classifier import analyse_hydrow_workout
 from json_stats_collection import flatten_json
 from db_transformer import transform_to_db_structure
 
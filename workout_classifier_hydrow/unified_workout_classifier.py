@@ -1,9 +1,5 @@
-from openai import OpenAI, OpenAIError
-import json
 import os
-import re
-import time
-import random
+import sys
 import io
 import base64
 from urllib.parse import urlparse, parse_qs
@@ -11,7 +7,6 @@ from typing import Dict, Any
 from PIL import Image
 import requests
 from io import BytesIO
-import pandas as pd
 
 # Import classifier modules
 from category_classifier import CATEGORY_PROMPT, CATEGORY_USER_PROMPT, CATEGORY_RESPONSE_FORMAT
@@ -20,12 +15,28 @@ from vibe_classifier import VIBE_PROMPT, VIBE_USER_PROMPT, VIBE_RESPONSE_FORMAT
 from spirit_classifier import SPIRIT_PROMPT, SPIRIT_USER_PROMPT, SPIRIT_RESPONSE_FORMAT
 from equipment_classifier import EQUIPMENT_PROMPT, EQUIPMENT_USER_PROMPT, EQUIPMENT_RESPONSE_FORMAT
 from db_transformer import transform_to_db_structure
+from instructor_bios import get_instructor_bios, normalize_instructor_name
+
+# Modules shared by the pipelines live in workout_classifier_common at the repository root
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from workout_classifier_common.cache_store import open_cache_store, classifier_fingerprint
+from workout_classifier_common.rule_engine import RuleEngine
+from workout_classifier_common.classifier_engine import CLASSIFIER_MODEL, ClassifierEngine, ClassifierSource
+from workout_classifier_common.vibe_preclassifier import get_vibe_preclassifier
+
+# Vibe definitions of this pipeline, embedded by the vibe pre-classifier
+VIBES_INFO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibes_info.csv")
+
 
 def analyse_hydrow_workout(workout_json, openai_api_key,
                           cache_dir='cache', force_refresh=False, #!
                           enable_category=True, enable_fitness_level=True,
                           enable_vibe=True, enable_spirit=True, enable_equipment=True,
-                          enable_image_in_meta=False):
+                          enable_image_in_meta=False, cache_backend='json', openai_base_url=None,
+                          enable_async=False, max_concurrency=5, enable_combined=False, vibe_margin=None):
     """
     Analyzes a YouTube workout video and classifies it according to enabled dimensions:
     1. Category (e.g., Yoga, HIIT, Weight workout)
@@ -44,53 +55,101 @@ def analyse_hydrow_workout(workout_json, openai_api_key,
         enable_vibe (bool): Whether to classify workout by vibe
         enable_spirit (bool): Whether to classify workout by spirit
         enable_equipment (bool): Whether to identify required equipment
+        enable_image_in_meta (bool): Whether to send the poster image to the model
+        cache_backend (str): Where classifier results are cached: 'json' (one file per result) or 'sqlite'
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+        enable_async (bool): Whether to send all uncached classifier requests concurrently
+        max_concurrency (int): Maximum number of in-flight OpenAI requests in async mode
+        enable_combined (bool): Whether to answer all uncached classifiers with one request (see classifier_engine.py)
+        vibe_margin (float, optional): Answer the vibe classifier from embeddings when the best vibe beats the
+                                       second by this cosine similarity margin (see vibe_preclassifier.py)
 
     Returns:
         dict: Combined workout analysis across all enabled dimensions
     """
-    # API keys - use provided keys or default values
-    # Initialize clients
+    # Ensure cache directory exists
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Define classifier configurations
+    classifiers = build_hydrow_classifiers(enable_category, enable_fitness_level,
+                                           enable_vibe, enable_spirit, enable_equipment)
+
     try:
-        oai_client = OpenAI(api_key=openai_api_key)
+        preclassifiers = {}
+        if enable_vibe and vibe_margin is not None:
+            try:
+                preclassifiers["vibe"] = get_vibe_preclassifier(openai_api_key, VIBES_INFO_PATH, openai_base_url,
+                                                                cache_dir=cache_dir, margin=vibe_margin)
+            except Exception as e:
+                # Without prototypes every workout asks the LLM, as without --vibe-margin
+                print(f"Vibe pre-classifier unavailable, asking the LLM: {str(e)}")
+        engine = ClassifierEngine(
+            HydrowSource(enable_image_in_meta),
+            classifiers,
+            open_cache_store(cache_dir, cache_backend),
+            openai_api_key,
+            openai_base_url=openai_base_url,
+            force_refresh=force_refresh,
+            enable_async=enable_async,
+            max_concurrency=max_concurrency,
+            combined=enable_combined,
+            preclassifiers=preclassifiers
+        )
     except Exception as e:
         return {"error": f"Failed to initialize API clients: {str(e)}"}
 
-    # Ensure cache directory exists
-    os.makedirs(cache_dir, exist_ok=True)
+    return engine.analyze(workout_json)
 
-    # extract image and textual summary
-    meta = extract_hydrow_meta_from_json(workout_json)
-
-    # Initialize combined analysis
-    video_id = workout_json.get("id")
-    instructor_name = workout_json.get("instructors", {}).get("stroke", {}).get("name")
-    if instructor_name == "No Athlete": instructor_name = "Unknown"
-    combined_analysis = {
-        "video_id": video_id,
-        "video_url":  workout_json.get("shareUrl"),
-        "video_title": workout_json.get("name"),
-        "duration": workout_json.get("duration"),
-        'video_metadata':workout_json,
-        'video_metadata_cleaned': meta,
-        "channel_title": instructor_name,
-        "hydrow_category_name": workout_json.get("category", {}).get("name", "N/A"),
-        "instructor_name": instructor_name,
-        "duration_seconds": workout_json.get("duration"),
-        "poster_uri": meta['image']
-        }
-    # with open("cats_map.txt",mode="a") as f:
-    #     f.write(f'{workout_json.get("category", {}).get("id", "N/A")}: {workout_json.get("workoutTypes")[0].lower().strip()}')
-    #     f.write("\n")
+class HydrowSource(ClassifierSource):
+    """Hydrow workout jsons for the classifier engine."""
 
-    if not enable_image_in_meta:
-        del meta['image']
+    def __init__(self, include_image=False):
+        self.include_image = include_image
 
-    # Define classifier configurations
+    def item_id(self, workout_json):
+        return workout_json.get("id")
+
+    def format(self, workout_json):
+        # extract image and textual summary
+        return extract_hydrow_meta_from_json(workout_json)
+
+    def describe(self, workout_json, meta):
+        instructor_name = workout_json.get("instructors", {}).get("stroke", {}).get("name")
+        if instructor_name == "No Athlete": instructor_name = "Unknown"
+        return {
+            "video_id": workout_json.get("id"),
+            "video_url":  workout_json.get("shareUrl"),
+            "video_title": workout_json.get("name"),
+            "duration": workout_json.get("duration"),
+            'video_metadata':workout_json,
+            'video_metadata_cleaned': meta,
+            "channel_title": instructor_name,
+            "hydrow_category_name": workout_json.get("category", {}).get("name", "N/A"),
+            "instructor_name": instructor_name,
+            "duration_seconds": workout_json.get("duration"),
+            "poster_uri": meta['image']
+            }
+
+    def prepare(self, classifier, workout_json, meta, analyses):
+        # HYDROW_RULES, with the fitness level hint kept for the classifiers after it
+        return prepare_hydrow_classifier(classifier, workout_json, meta, analyses)
+
+    def error_analysis(self, error_message, workout_json):
+        return return_error_analysis(error_message, workout_json)
+
+# Other functions remain unchanged
+def build_hydrow_classifiers(enable_category=True, enable_fitness_level=True,
+                             enable_vibe=True, enable_spirit=True, enable_equipment=True):
+    """
+    Build the classifier configurations, in the order they are run.
+
+    Returns:
+        list: Classifier configurations with name, enabled flag, prompts, response format and prompt_version
+    """
     classifiers = [
         {
             "name": "category",
             "enabled": enable_category,
-            "cache_key": f"{video_id}_category_analysis.json",
             "system_prompt": CATEGORY_PROMPT,
             "user_prompt": CATEGORY_USER_PROMPT,
             "response_format": CATEGORY_RESPONSE_FORMAT
@@ -98,7 +157,6 @@ def analyse_hydrow_workout(workout_json, openai_api_key,
         {
             "name": "fitness_level",
             "enabled": enable_fitness_level,
-            "cache_key": f"{video_id}_fitness_level_analysis.json",
             "system_prompt": FITNESS_LEVEL_PROMPT,
             "user_prompt": FITNESS_LEVEL_USER_PROMPT,
             "response_format": FITNESS_LEVEL_RESPONSE_FORMAT
@@ -106,7 +164,6 @@ def analyse_hydrow_workout(workout_json, openai_api_key,
         {
             "name": "equipment",
             "enabled": enable_equipment,
-            "cache_key": f"{video_id}_equipment_analysis.json",
             "system_prompt": EQUIPMENT_PROMPT,
             "user_prompt": EQUIPMENT_USER_PROMPT,
             "response_format": EQUIPMENT_RESPONSE_FORMAT
@@ -114,7 +171,6 @@ def analyse_hydrow_workout(workout_json, openai_api_key,
         {
             "name": "spirit",
             "enabled": enable_spirit,
-            "cache_key": f"{video_id}_spirit_analysis.json",
             "system_prompt": SPIRIT_PROMPT,
             "user_prompt": SPIRIT_USER_PROMPT,
             "response_format": SPIRIT_RESPONSE_FORMAT
@@ -122,144 +178,58 @@ def analyse_hydrow_workout(workout_json, openai_api_key,
         {
             "name": "vibe",
             "enabled": enable_vibe,
-            "cache_key": f"{video_id}_vibe_analysis.json",
             "system_prompt": VIBE_PROMPT,
             "user_prompt": VIBE_USER_PROMPT,
             "response_format": VIBE_RESPONSE_FORMAT
         }
     ]
-    # Flag to track if any classifier had an error
-    has_errors = False
-    review_comments = []
+    for classifier in classifiers:
+        classifier["prompt_version"] = classifier_fingerprint(
+            classifier["system_prompt"],
+            classifier["user_prompt"],
+            classifier["response_format"],
+            CLASSIFIER_MODEL
+        )
+    return classifiers
 
-    # Run each enabled classifier
-    try:
-        for classifier in classifiers:
-            if not classifier["enabled"]:
-                continue
-
-            name = classifier["name"]
-            cache_path = os.path.join(cache_dir, classifier["cache_key"])
-
-            # Check for cached analysis
-            if os.path.exists(cache_path) and not force_refresh:
-                try:
-                    with open(cache_path, 'r') as f:
-                        analysis = json.load(f)
-                    print(f"Loaded {name} analysis from cache: {cache_path}")
-                except Exception as e:
-                    print(f"Error loading cached {name} analysis: {str(e)}. Running fresh analysis.")
-                    if not (classifier['name']=='fitness_level' or classifier['name']=='category') and \
-                       not (classifier['name']=='vibe' and "Journey" in workout_json.get('category',{}).get('name',None)):
-                        analysis = run_classifier(
-                            oai_client,
-                            meta,
-                            classifier["system_prompt"],
-                            classifier["user_prompt"],
-                            classifier["response_format"]
-                        )
-                        cache_data(analysis, cache_path)
-                    elif classifier['name']=='vibe' and "Journey" in workout_json.get('category',{}).get('name',None):
-                        analysis = hardcoded_journey_vibe()
-                        cache_data(analysis, cache_path)
-                    elif classifier['name']=='category':
-                        # ! we indroduce hardcoded mapping
-                        workout_type = workout_json.get('workoutTypes')[0].lower().strip()
-                        analysis = hardcoded_category_clf(workout_type=workout_type)
-                        cache_data(analysis, cache_path)
-                    else:
-                        # ! now we proceed with fintess lvl, which is partially hardcoded
-                        workout_type = workout_json.get('workoutTypes')[0].lower().strip()
-                        fitness_base_schema = prefill_fitness_schema(workout_type, meta)
-                        meta_f_lvl = meta
-                        meta_f_lvl['text'] = meta_f_lvl['text'] + f"\nUser Fitness Level Requirements are {', '.join([e['level'] for e in fitness_base_schema.get('requiredFitnessLevel')])}"
-                        analysis = run_classifier(
-                                oai_client,
-                                meta_f_lvl,
-                                classifier["system_prompt"],
-                                classifier["user_prompt"],
-                                classifier["response_format"]
-                            )
-                        if len(fitness_base_schema.get("requiredFitnessLevel")) != 3:
-                            analysis = enforce_prefilled_fields(analysis, fitness_base_schema) 
-                        else:
-                            analysis = enforce_prefilled_fields(analysis, 
-                                                                fitness_base_schema,
-                                                                keys_to_override = ["requiredFitnessLevel",
-                                                                                    "requiredFitnessLevelConfidence",
-                                                                                    "requiredFitnessLevelExplanation",
-                                                                                    "techniqueDifficulty",
-                                                                                    "techniqueDifficultyConfidence",
-                                                                                    "techniqueDifficultyExplanation"]) 
-                        cache_data(analysis, cache_path)
-            else:
-                if not (classifier['name']=='fitness_level' or classifier['name']=='category') and \
-                   not (classifier['name']=='vibe' and "Journey" in workout_json.get('category',{}).get('name',None)):
-                    analysis = run_classifier(
-                        oai_client,
-                        meta,
-                        classifier["system_prompt"],
-                        classifier["user_prompt"],
-                        classifier["response_format"]
-                    )
-                    cache_data(analysis, cache_path)
-                elif classifier['name']=='vibe' and "Journey" in workout_json.get('category',{}).get('name',None):
-                        analysis = hardcoded_journey_vibe()
-                        cache_data(analysis, cache_path) 
-                elif classifier['name']=='category':
-                    # ! we indroduce hardcoded mapping
-                    workout_type = workout_json.get('workoutTypes')[0].lower().strip()
-                    analysis = hardcoded_category_clf(workout_type=workout_type)
-                    cache_data(analysis, cache_path)
-                else:
-                    # ! now we proceed with fintess lvl, which is partially hardcoded
-                    workout_type = workout_json.get('workoutTypes')[0].lower().strip()
-                    fitness_base_schema = prefill_fitness_schema(workout_type, meta)
-                    meta_f_lvl = meta
-                    meta_f_lvl['text'] = meta_f_lvl['text'] + f"\nUser Fitness Level Requirements are {', '.join([e['level'] for e in fitness_base_schema.get('requiredFitnessLevel')])}"
-                    analysis = run_classifier(
-                            oai_client,
-                            meta_f_lvl,
-                            classifier["system_prompt"],
-                            classifier["user_prompt"],
-                            classifier["response_format"]
-                        )
-                    if len(fitness_base_schema.get("requiredFitnessLevel")) != 3:
-                        analysis = enforce_prefilled_fields(analysis, fitness_base_schema) 
-                    else:
-                        analysis = enforce_prefilled_fields(analysis, 
-                                                            fitness_base_schema,
-                                                            keys_to_override = ["requiredFitnessLevel",
-                                                                                "requiredFitnessLevelConfidence",
-                                                                                "requiredFitnessLevelExplanation",
-                                                                                "techniqueDifficulty",
-                                                                                "techniqueDifficultyConfidence",
-                                                                                "techniqueDifficultyExplanation"]) 
-                    cache_data(analysis, cache_path)                 
-            # Check for errors in the classifier result
-            if "error" in analysis:
-                has_errors = True
-                error_message = f"Error in {name} classifier: {analysis.get('error')}"
-                review_comments.append(error_message)
-
-                # Add review comment tag if present
-                if "review_comment" in analysis:
-                    if analysis["review_comment"] not in review_comments:
-                        review_comments.append(analysis["review_comment"])
-            
-            combined_analysis[name] = analysis
-        # Update reviewable status based on errors
-        if has_errors:
-            combined_analysis["reviewable"] = False
-            combined_analysis["review_comment"] = "; ".join(review_comments)
-        
-        return combined_analysis
+def prepare_hydrow_classifier(classifier, workout_json, meta, analyses=None):
+    """
+    Apply the Hydrow rules (HYDROW_RULES) around one classifier.
 
-    except Exception as e:
-        error_message = f"Failed to perform combined analysis: {str(e)}"
-        return return_error_analysis(error_message, workout_json)
+    A prefilled hint is also added to meta itself, so the classifiers after it see it too.
+
+    Args:
+        classifier: Classifier configuration (as built in build_hydrow_classifiers)
+        workout_json: Hydrow workout json
+        meta: dictionary with 'text' and optional 'image' (url)
+        analyses (dict, optional): Analyses of the classifiers run so far
+
+    Returns:
+        tuple: (analysis, request_meta, postprocess, decision), see RuleEngine.apply
+    """
+    analysis, request_meta, postprocess, decision = HYDROW_RULES.apply(
+        classifier['name'], workout_json, meta, analyses)
+    if decision == "prefilled":
+        meta['text'] = request_meta['text']
+    return analysis, request_meta, postprocess, decision
+
+def prefill_fitness_level(workout_json, meta, analyses):
+    """
+    Prefill rule of the fitness level: the level is taken from the workoutType and OpenAI only
+    completes the rest (see prefill_fitness_schema).
+
+    Returns:
+        tuple: (prefilled fields, keys to override, hint for the prompt)
+    """
+    workout_type = workout_json.get('workoutTypes')[0].lower().strip()
+    fitness_base_schema = prefill_fitness_schema(workout_type, meta)
+    hint = f"User Fitness Level Requirements are {', '.join([e['level'] for e in fitness_base_schema.get('requiredFitnessLevel')])}"
+
+    keys_to_override = ["requiredFitnessLevel", "requiredFitnessLevelConfidence", "requiredFitnessLevelExplanation"]
+    if len(fitness_base_schema.get("requiredFitnessLevel")) == 3:
+        keys_to_override += ["techniqueDifficulty", "techniqueDifficultyConfidence", "techniqueDifficultyExplanation"]
+    return fitness_base_schema, keys_to_override, hint
 
-# Other functions remain unchanged
 def prefill_fitness_schema(workout_type: str, full_meta:str) -> dict:
     """
     Pre-fills the fitness level response schema based on hardcoded rules for workoutType.
@@ -359,41 +329,6 @@ def prefill_fitness_schema(workout_type: str, full_meta:str) -> dict:
 
     return schema
 
-def enforce_prefilled_fields(gpt_result: dict, prefilled: dict, keys_to_override = ["requiredFitnessLevel","requiredFitnessLevelConfidence","requiredFitnessLevelExplanation"]) -> dict:
-    """
-    Replace selected fields in GPT output with your prefilled values.
-
-    Args:
-        gpt_result: Full GPT response (dictionary)
-        prefilled: Your prefilled fields (dictionary)
-        keys_to_override: List of keys to force from prefill
-
-    Returns:
-        A merged schema dictionary
-    """
-    final = gpt_result.copy()
-    for key in keys_to_override:
-        if key in prefilled:
-            final[key] = prefilled[key]
-    return final
-
-def cache_data(data, cache_path):
-    """Cache data to a JSON file."""
-    try:
-        with open(cache_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        print(f"Cached data to: {cache_path}")
-    except Exception as e:
-        print(f"Error caching data: {str(e)}")
-
-def extract_video_id(raw_json: str, idx:int) -> str:
-    schema = json.loads(raw_json)
-    video_id = schema.get("id")
-    if not video_id:
-        video_id = f"manual_{idx}"
-        schema['id']=video_id
-    return video_id
-               
 def format_duration(seconds):
         if not seconds:
             return "Unknown duration"
@@ -437,20 +372,15 @@ def extract_hydrow_meta_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
         if instructor_name == "No Athlete": instructor_name = "Unknown"
         
         # ! adding lookup for instructors bio
-        file_path = 'workout_classifier_hydrow/hydrow_athletes_bio.csv' #'hydrow_athletes_bio.csv'
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path)
-            # Normalize column 0 for case-insensitive comparison
-            match = df[df.iloc[:, 0].str.strip().str.lower() == instructor_name.strip().lower()]
-            if not match.empty:
-                bio = match.iloc[0, 1]
-            else:
+        bios = get_instructor_bios()
+        if bios is not None:
+            bio = bios.get(normalize_instructor_name(instructor_name))
+            if bio is None:
                 print(f"No bio found for instructor: {instructor_name}")
                 bio = ""
             return instructor_name+":\n"+bio+"\n"
 
         else:
-            print(f"File not found: {file_path}")
             return instructor_name
 
     
@@ -473,118 +403,25 @@ def extract_hydrow_meta_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
 
     return {"text": summary, "image": image_url}
 
-def run_classifier(oai_client, meta, system_prompt, user_prompt, response_format):
-    """
-    Generic function to run a classifier through OpenAI API with optional image input.
-
-    Args:
-        oai_client: OpenAI client
-        meta: dictionary with 'text' and optional 'image' (url)
-        system_prompt: System prompt for the classifier
-        user_prompt: User prompt for the classifier
-        response_format: Expected response format
-
-    Returns:
-        dict: Classification results
-    """
-    try:
-        # Base message (text-based)
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-
-        # Add image if present
-        if meta.get("image"):
-            messages.append({
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": f"{user_prompt}\n\n{meta['text']}"},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"{meta.get('image')}"
-                        }
-                    }
-                ]
-            })
-        else:
-            # Only text
-            messages.append({
-                "role": "user",
-                "content": f"{user_prompt}\n\n{meta['text']}"
-            })
-
-        return openai_call_with_retry(oai_client, "gpt-4o", messages, response_format)
-
-    except Exception as e:
-        return {"error": f"Error with classifier: {str(e)}"}
-
-def openai_call_with_retry(oai_client, model, messages, response_format):
-    """
-    Helper function to make OpenAI API calls with retry for rate limits.
-    """
-    # Maximum number of retries
-    max_retries = 5
-    # Initial retry delay in seconds
-    retry_delay = 2
-
-    for retry_attempt in range(max_retries):
-        try:
-            response = oai_client.chat.completions.create(
-                model=model,
-                response_format=response_format,
-                messages=messages
-            )
-
-            return json.loads(response.choices[0].message.content)
-
-        except OpenAIError as e:
-            # Check if it's a rate limit error
-            error_str = str(e)
-            if "rate_limit_exceeded" in error_str or "Rate limit reached" in error_str:
-                # Try to extract suggested wait time if available
-                wait_time_match = re.search(r'try again in (\d+\.\d+)s', error_str)
-
-                if wait_time_match:
-                    # Use the recommended wait time from the error message
-                    wait_time = float(wait_time_match.group(1))
-                    # Add a small buffer to ensure we're past the rate limit window
-                    wait_time += 0.5
-                else:
-                    # Use exponential backoff with jitter
-                    wait_time = retry_delay * (2 ** retry_attempt) + random.uniform(0, 1)
-
-                print(
-                    f"Rate limit reached. Waiting for {wait_time:.2f} seconds before retry ({retry_attempt + 1}/{max_retries})...")
-                time.sleep(wait_time)
-
-                # If this is the last retry attempt, raise the error
-                if retry_attempt == max_retries - 1:
-                    raise Exception(f"Error with OpenAI API after {max_retries} retries: {str(e)}")
-            else:
-                # If it's not a rate limit error, don't retry
-                raise Exception(f"Error with OpenAI API: {str(e)}")
-
-    # This should only happen if we exhaust all retries
-    raise Exception("Failed after maximum retry attempts")
+# Category of each Hydrow workoutType
+WORKOUT_TYPE_CATEGORIES = { 'cool down':'Cool-down',
+                            'strength':'Body weight',
+                            'stretching':'Stretching',
+                            'warm-up':'Warm-up',
+                            'drive':'Indoor rowing',
+                            'sweat':'Indoor rowing',
+                            'flow':'Yoga',
+                            'breathe':'Indoor rowing',
+                            'pilates':'Pilates',
+                            'restore':'Yoga',
+                            'align':'Yoga',
+                            'mobility':'Stretching',
+                            'circuit':'Calisthenics',
+                            'journey':'Indoor rowing'}
 
 def hardcoded_category_clf(workout_type):
-    mapping = { 'cool down':'Cool-down',
-                'strength':'Body weight',
-                'stretching':'Stretching',
-                'warm-up':'Warm-up',
-                'drive':'Indoor rowing',
-                'sweat':'Indoor rowing',
-                'flow':'Yoga',
-                'breathe':'Indoor rowing',
-                'pilates':'Pilates',
-                'restore':'Yoga',
-                'align':'Yoga',
-                'mobility':'Stretching',
-                'circuit':'Calisthenics',
-                'journey':'Indoor rowing'}
     try:
-        name = mapping[workout_type]
+        name = WORKOUT_TYPE_CATEGORIES[workout_type]
     except:
         raise ValueError
     
@@ -610,6 +447,29 @@ def hardcoded_journey_vibe():
         }
     return out
 
+# Classifiers answered or prefilled from the workout metadata, in place of (part of) the OpenAI call
+HYDROW_RULES = RuleEngine([
+    {
+        "name": "journey_vibe",
+        "classifier": "vibe",
+        "when": {"category.name": {"contains": "Journey"}},
+        "resolve": lambda workout_json, meta, analyses: hardcoded_journey_vibe()
+    },
+    {
+        "name": "workout_type_category",
+        "classifier": "category",
+        "when": {"workoutTypes.0": {"in": list(WORKOUT_TYPE_CATEGORIES)}},
+        "resolve": lambda workout_json, meta, analyses: hardcoded_category_clf(
+            workout_json['workoutTypes'][0].lower().strip())
+    },
+    {
+        "name": "workout_type_fitness_level",
+        "classifier": "fitness_level",
+        "when": {"workoutTypes.0": {"exists": True}},
+        "prefill": prefill_fitness_level
+    }
+])
+
 def return_error_analysis(error_message, workout_json=None):
     return {
             "error": error_message,
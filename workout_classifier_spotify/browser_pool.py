@@ -0,0 +1,167 @@
+"""
+Pool of long-lived headless Chrome drivers for web-snippet collection.
+
+Starting Chrome costs seconds, so each process keeps size drivers alive and leases them
+to search queries through a queue. Every driver gets its own profile directory and remote
+debugging port, so drivers of parallel Pool workers do not collide. Instead of fixed sleeps,
+each query waits on the DOM: for the search box to appear, then for the result snippets.
+
+Any page with a search input named "q" whose results contain <div data-result="snippet">
+elements can stand in for DuckDuckGo, e.g. the local fixture server in snippet_fixture_server.py:
+    pool = BrowserPool(4, create_driver, search_url="http://127.0.0.1:8766")
+    snippets = pool.collect(queries)
+    pool.close()
+"""
+import os
+import queue
+import shutil
+import socket
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import util
+
+from tqdm import tqdm
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support.ui import WebDriverWait
+
+SEARCH_URL = "https://duckduckgo.com"
+
+# Result snippets on the search results page
+SNIPPET_XPATH = '//div[@data-result="snippet"]'
+
+# Number of snippets joined per query
+MAX_SNIPPETS = 5
+
+# Browser pools of this process, keyed by (pid, size, search_url)
+_BROWSER_POOLS = {}
+
+
+def find_free_port():
+    """Ask the OS for a free local TCP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _visible_snippets(driver):
+    """Texts of the rendered result snippets, nudging lazy-loading pages on every poll."""
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    driver.execute_script("document.body.dispatchEvent(new Event('mousemove'));")
+    elements = driver.find_elements(By.XPATH, SNIPPET_XPATH)
+    return [el.text.strip() for el in elements[:MAX_SNIPPETS] if el.text.strip()]
+
+
+class BrowserPool:
+    """Fixed set of Chrome drivers leased to search queries."""
+
+    def __init__(self, size, driver_factory, search_url=SEARCH_URL, max_wait=10, poll_interval=0.2):
+        """
+        Args:
+            size (int): Number of drivers
+            driver_factory (callable): driver_factory(profile_dir, debugging_port) -> WebDriver
+            search_url (str): Page with the search input named "q"
+            max_wait (float): Seconds to wait for the search box and for the snippets
+            poll_interval (float): Seconds between DOM checks
+        """
+        self.size = max(1, size)
+        self.driver_factory = driver_factory
+        self.search_url = search_url
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.profile_root = tempfile.mkdtemp(prefix="browser_pool_")
+
+        self._slots = queue.Queue()
+        self._drivers = {}
+        for slot in range(self.size):
+            self._drivers[slot] = self._start_driver(slot)
+            self._slots.put(slot)
+
+    def _start_driver(self, slot):
+        profile_dir = os.path.join(self.profile_root, f"profile_{slot}")
+        os.makedirs(profile_dir, exist_ok=True)
+        return self.driver_factory(profile_dir, find_free_port())
+
+    def _restart_driver(self, slot):
+        try:
+            self._drivers[slot].quit()
+        except Exception:
+            pass
+        self._drivers[slot] = self._start_driver(slot)
+
+    @contextmanager
+    def lease(self):
+        """Borrow a driver; a driver that raised a WebDriverException is restarted before it is returned."""
+        slot = self._slots.get()
+        try:
+            yield self._drivers[slot]
+        except WebDriverException:
+            self._restart_driver(slot)
+            raise
+        finally:
+            self._slots.put(slot)
+
+    def search(self, query):
+        """
+        Run one search query.
+
+        Returns:
+            str: Up to MAX_SNIPPETS result snippets joined by spaces, '' if there were none
+        """
+        try:
+            with self.lease() as driver:
+                driver.get(self.search_url)
+                wait = WebDriverWait(driver, self.max_wait, poll_frequency=self.poll_interval)
+                search_box = wait.until(lambda d: d.find_element(By.NAME, "q"))
+                search_box.clear()
+                search_box.send_keys(query)
+                search_box.send_keys(Keys.RETURN)
+                try:
+                    snippets = wait.until(_visible_snippets)
+                except TimeoutException:
+                    print(f"[Timeout] No snippets for query after {self.max_wait}s: {query}")
+                    snippets = []
+                return " ".join(snippets)
+        except Exception as e:
+            print(f"[Error] Query failed: {query} | Error: {e}")
+            return ""
+
+    def collect(self, queries):
+        """Run queries on all drivers in parallel; results are in query order."""
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(tqdm(executor.map(self.search, queries), total=len(queries), desc="Web search:"))
+
+    def close(self):
+        """Quit all drivers and remove their profiles."""
+        for driver in self._drivers.values():
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        self._drivers = {}
+        shutil.rmtree(self.profile_root, ignore_errors=True)
+
+
+def get_browser_pool(size, driver_factory, search_url=SEARCH_URL):
+    """
+    Browser pool of the current process, started on first use and closed when the process exits.
+
+    Closing is registered as a multiprocessing finalizer rather than with atexit, since Pool
+    workers leave through os._exit; the workers must be shut down with close() and join().
+
+    Args:
+        size (int): Number of drivers
+        driver_factory (callable): driver_factory(profile_dir, debugging_port) -> WebDriver
+        search_url (str): Page with the search input named "q"
+
+    Returns:
+        BrowserPool: The pool
+    """
+    key = (os.getpid(), size, search_url)
+    if key not in _BROWSER_POOLS:
+        pool = BrowserPool(size, driver_factory, search_url)
+        _BROWSER_POOLS[key] = pool
+        util.Finalize(pool, pool.close, exitpriority=10)
+    return _BROWSER_POOLS[key]
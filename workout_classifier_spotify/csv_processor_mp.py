@@ -1,72 +1,149 @@
-import pandas as pd
 import csv
 import json
 import os
 import re
+import sys
 import numpy as np
 import argparse
 from tqdm import tqdm
 from multiprocessing import Pool
+from threading import BoundedSemaphore
+from collections import Counter
 import time 
 
 from env_utils import load_api_keys
-from unified_workout_classifier import analyse_spotify_workout, return_error_analysis, extract_video_id
+
+# Modules shared by the pipelines live in workout_classifier_common at the repository root
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from workout_classifier_common.rate_limiter import SharedRateLimiter, init_worker_rate_limiter
+from workout_classifier_common.cache_store import SqliteCacheStore, SQLITE_CACHE_FILE, open_cache_store
+from workout_classifier_common.result_writer import ResultWriter
+from workout_classifier_common.rule_engine import summarize_rule_decisions
+from workout_classifier_common.classifier_engine import summarize_execution_metrics
+from unified_workout_classifier import (analyse_spotify_workout, return_error_analysis, collect_unseen_tracks,
+                                        classify_track_batch, BROWSER_POOL_SIZE)
 from json_stats_collection import flatten_json
 from db_transformer import transform_to_db_structure
 
 
-import json
+# Playlists read ahead of the pool; bounds the parsed JSONs held in memory
+MAX_QUEUED_WORKOUTS = 64
 
-def is_spotify_meta(value):
+
+def parse_spotify_meta(value):
     """
-    Check if a value is a valid Spotify playlist JSON (real or stringified).
+    Parse a Spotify playlist JSON (real or stringified).
     It must contain a playlist.external_urls.spotify field containing a URL to Spotify.
 
     Args:
         value (str or dict): Potential JSON input
 
     Returns:
-        bool: True if valid Spotify workout metadata
+        dict or None: The playlist JSON, or None if the value is not Spotify workout metadata
     """
     if isinstance(value, str):
+        # Cheap check first, most cells are not JSON objects at all
+        if not value.lstrip().startswith("{"):
+            return None
         try:
             value = json.loads(value)
         except json.JSONDecodeError:
-            return False
+            return None
 
     if not isinstance(value, dict):
-        return False
+        return None
 
     playlist = value.get("playlist")
     if not isinstance(playlist, dict):
-        return False
+        return None
 
     external_urls = playlist.get("external_urls")
     if not isinstance(external_urls, dict):
-        return False
+        return None
 
     spotify_url = external_urls.get("spotify")
-    return isinstance(spotify_url, str) and spotify_url.startswith("https://open.spotify.com/")
+    return value if isinstance(spotify_url, str) and spotify_url.startswith("https://open.spotify.com/") else None
+
+
+def is_spotify_meta(value):
+    """Check if a value is a valid Spotify playlist JSON (real or stringified)."""
+    return parse_spotify_meta(value) is not None
+
+
+def iter_playlist_jsons(input_csv_path, max_workouts=None, stats=None, skip_ids=None):
+    """
+    Stream the unique Spotify playlist JSONs of a CSV file, row by row.
+
+    The first Spotify JSON cell of every row is parsed once; playlists without an id get
+    'manual_<n>' as id. Playlists whose id was seen before are skipped.
+
+    Args:
+        input_csv_path (str): CSV file with Spotify JSONs in any column
+        max_workouts (int, optional): Stop after this many unique playlists
+        stats (dict, optional): Receives the 'rows', 'found', 'unique' and 'skipped' counts
+        skip_ids (set, optional): Ids (as text) to skip, e.g. those already in a resumed output
+
+    Yields:
+        dict: Playlist JSON
+    """
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, found=0, unique=0, skipped=0)
+    seen = set()
+    skip_ids = skip_ids or set()
+    csv.field_size_limit(sys.maxsize)
+    with open(input_csv_path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header
+        for row in reader:
+            stats['rows'] += 1
+            schema = None
+            for cell in row:
+                schema = parse_spotify_meta(cell)
+                if schema is not None:
+                    break
+            if schema is None:
+                continue
+
+            stats['found'] += 1
+            video_id = schema["playlist"].get("id")
+            if not video_id:
+                video_id = f"manual_{stats['found'] - 1}"
+                schema["playlist"]["id"] = video_id
+            if video_id in seen:
+                continue
+            seen.add(video_id)
+            if str(video_id) in skip_ids:
+                stats['skipped'] += 1
+                continue
+
+            stats['unique'] += 1
+            yield schema
+            if max_workouts and stats['unique'] >= max_workouts:
+                return
+
+
+def bounded_tasks(tasks, semaphore):
+    """Yield tasks, waiting for a free slot of semaphore before each one; release a slot per finished task."""
+    for task in tasks:
+        semaphore.acquire()
+        yield task
 
 def analyze_workout(args):
     """
     Analyze a single Spotify playlist JSON entry. Used for parallel processing.
 
     Args:
-        args (tuple): (raw_json, openai_api_key, enabled_features dict, process_id)
+        args (tuple): (schema, openai_api_key, enabled_features dict, process_id, cache_dir_path, execution_options dict)
 
     Returns:
         dict or None: Structured result dictionary or None if analysis failed
     """
-    raw_json, openai_api_key, enabled_features, process_id, cache_dir_path = args
+    schema, openai_api_key, enabled_features, process_id, cache_dir_path, execution_options = args
 
-    try:
-        schema = json.loads(raw_json)
-    except Exception:
-        print(f"Process {process_id}: Failed to parse JSON")
-        return return_error_analysis("Failed to parse JSON", None)
- 
-    video_id, raw_json = extract_video_id(raw_json, None)
+    video_id = schema["playlist"]["id"]
     
     try:
         print(f"Process {process_id}: Analyzing workout {video_id}")
@@ -78,7 +155,17 @@ def analyze_workout(args):
             enable_vibe=enabled_features['vibe'],
             enable_spirit=enabled_features['spirit'],
             enable_web_search=enabled_features['websearch'],
-            enable_image_in_meta=enabled_features['image']
+            enable_image_in_meta=enabled_features['image'],
+            cache_backend=execution_options['cache_backend'],
+            browsers=execution_options['browsers'],
+            search_url=execution_options['search_url'],
+            snippet_provider=execution_options['snippet_provider'],
+            track_batch_size=execution_options['track_batch_size'],
+            enable_async=execution_options['async'],
+            max_concurrency=execution_options['max_concurrency'],
+            enable_combined=execution_options['combined'],
+            vibe_margin=execution_options['vibe_margin'],
+            openai_base_url=execution_options['openai_base_url']
         )
 
 
@@ -86,6 +173,8 @@ def analyze_workout(args):
             print(f"Process {process_id}: Error during analysis: {result['error']}")
             return return_error_analysis("Error during analysis.", schema)
 
+        # Counted for the run summary, not part of the stored analysis
+        execution_metrics = result.pop('execution_metrics', {})
         db_structure = transform_to_db_structure(result)
 
         output_data = {
@@ -118,6 +207,8 @@ def analyze_workout(args):
             'secondary_effort_difficulty': db_structure.get('secondary_effort_difficulty', ''),
             'tertiary_effort_difficulty': db_structure.get('tertiary_effort_difficulty', ''),
             'full_analysis_json': json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True),
+            'rule_decisions': result.get('rule_decisions', {}),
+            'execution_metrics': execution_metrics,
             'poster_uri':db_structure.get('poster_uri', ''),
         }
         print(f"Process {process_id}: Successfully analyzed workout: {video_id}")
@@ -127,52 +218,57 @@ def analyze_workout(args):
         print(f"Process {process_id}: Unexpected error for workout #{video_id}: {str(e)}")
         return return_error_analysis("Unexpected error for workout.", schema)
 
-def write_results_to_csv(results, output_csv_path):
+def classify_tracks_task(args):
     """
-    Write analysis results to CSV file.
-    Filter out duplicates based on video_id (keeping the first occurrence).
+    Classify one batch of unseen tracks before the playlists are analyzed. Used for parallel processing.
 
     Args:
-        results (list): List of analysis results
-        output_csv_path (str): Path to output CSV file
-    """
-    valid_results = [r for r in results if r is not None]
-    if not valid_results:
-        print("No valid results to write.")
-        return
+        args (tuple): (tracks, openai_api_key, enabled_features dict, cache_dir_path, execution_options dict)
 
-    # Deduplicate results based on video_id
-    unique_results = {}
-    for result in valid_results:
-        video_id = result.get('video_id')
-        if video_id and video_id not in unique_results:
-            unique_results[video_id] = result
-
-    # Write to output CSV
-    fieldnames = [
-            'video_id', 'video_url', 'video_title', 'channel_title', 'duration', 'duration_minutes',
-            'category', 'subcategory', 'secondary_category', 'secondary_subcategory',
-            'fitness_level', 'secondary_fitness_level', 'tertiary_fitness_level',
-            'primary_equipment', 'secondary_equipment', 'tertiary_equipment',
-            'primary_spirit', 'secondary_spirit',
-            'primary_vibe', 'secondary_vibe',
-            'reviewable', 'review_comment',
-            'primary_technique_difficulty', 'secondary_technique_difficulty', 'tertiary_technique_difficulty',
-            'primary_effort_difficulty', 'secondary_effort_difficulty', 'tertiary_effort_difficulty',
-            'full_analysis_json', 'poster_uri'
-    ]
-    with open(output_csv_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writeheader()
-        for result in unique_results.values():
-            writer.writerow(result)
-
-    return unique_results
+    Returns:
+        int: Number of tracks classified
+    """
+    tracks, openai_api_key, enabled_features, cache_dir_path, execution_options = args
+    try:
+        return classify_track_batch(
+            tracks,
+            openai_api_key,
+            cache_dir=cache_dir_path,
+            cache_backend=execution_options['cache_backend'],
+            enable_web_search=enabled_features['websearch'],
+            browsers=execution_options['browsers'],
+            search_url=execution_options['search_url'],
+            snippet_provider=execution_options['snippet_provider'],
+            openai_base_url=execution_options['openai_base_url']
+        )
+    except Exception as e:
+        # The tracks are classified again with their playlists
+        print(f"Unexpected error for a batch of {len(tracks)} tracks: {str(e)}")
+        return 0
+
+# Columns of the output CSV; other result keys are not written
+RESULT_FIELDNAMES = [
+    'video_id', 'video_url', 'video_title', 'channel_title', 'duration', 'duration_minutes',
+    'category', 'subcategory', 'secondary_category', 'secondary_subcategory',
+    'fitness_level', 'secondary_fitness_level', 'tertiary_fitness_level',
+    'primary_equipment', 'secondary_equipment', 'tertiary_equipment',
+    'primary_spirit', 'secondary_spirit',
+    'primary_vibe', 'secondary_vibe',
+    'reviewable', 'review_comment',
+    'primary_technique_difficulty', 'secondary_technique_difficulty', 'tertiary_technique_difficulty',
+    'primary_effort_difficulty', 'secondary_effort_difficulty', 'tertiary_effort_difficulty',
+    'full_analysis_json', 'poster_uri'
+]
 
 def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir_path,
                              num_processes=8, max_workouts=None,
                              enable_vibe=True, enable_spirit=True,
-                             include_image=False, enable_web_search=True):
+                             include_image=False, enable_web_search=True,
+                             requests_per_minute=None, tokens_per_minute=None,
+                             cache_backend='json', import_cache=False,
+                             browsers=BROWSER_POOL_SIZE, search_url=None, snippet_provider='browser',
+                             track_batch_size=1, resume=False, enable_async=False, max_concurrency=5, enable_combined=False, vibe_margin=None,
+                             openai_base_url=None):
     """
     Process Hydrow workout JSONs from a CSV using multiprocessing.
 
@@ -187,6 +283,26 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir_path,
         enable_spirit (bool): Whether to classify by spirit
         enable_equipment (bool): Whether to extract equipment
         include_image (bool): Whether to include image in analysis
+        requests_per_minute (int, optional): OpenAI requests per minute shared by all processes
+        tokens_per_minute (int, optional): OpenAI tokens per minute shared by all processes
+        cache_backend (str): Where classifier results are cached: 'json' (one file per result) or 'sqlite'
+        import_cache (bool): Whether to import the JSON cache files into the SQLite cache before processing
+        browsers (int): Chrome drivers per process used for web search
+        search_url (str, optional): Search page to use instead of DuckDuckGo, e.g. snippet_fixture_server.py
+        snippet_provider (str): How web search snippets are fetched: 'browser' (Chrome) or 'http'
+        track_batch_size (int): Tracks classified per TRACK_BATCH_PROMPT call, 1 for one TRACK_PROMPT call per track;
+                                the uncached tracks of all playlists are batched together first
+        resume (bool): Whether to keep the rows of an existing output and only analyze playlists missing from it
+        enable_async (bool): Whether to run the classifiers of each playlist concurrently
+        max_concurrency (int): Maximum number of concurrent OpenAI requests per playlist in async mode
+        enable_combined (bool): Whether to classify each playlist with one combined OpenAI request
+        vibe_margin (float, optional): Top-1/top-2 similarity margin above which the vibe is taken from
+            embeddings instead of OpenAI; None always asks OpenAI
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+
+    Returns:
+        dict: Counts of the run: 'found', 'unique', 'skipped', 'processed', 'written', 'reviewable'
+              'rule_decisions' ((classifier, decision) -> count) and 'execution_metrics' (see classifier_engine.py)
     """
     start_time = time.time()
     
@@ -202,58 +318,21 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir_path,
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-      
-    # Read the input CSV file
-    try:
-        df = pd.read_csv(input_csv_path)
-        print(f"Successfully read CSV file with {len(df)} rows")
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        return
-      
-    df.columns = df.columns.astype(str)
 
-    # Get all columns
-    columns = df.columns.tolist()
-    if len(columns) < 1:
-        print(f"CSV file has insufficient columns: {columns}")
+    # Playlists are streamed from the CSV into the pool while earlier ones are analysed
+    if not os.path.exists(input_csv_path):
+        print(f"Error reading CSV file: {input_csv_path} does not exist")
         return
 
-    all_jsons = []
-    for _, row in df.iterrows():
-        for col in df.columns:
-            cell = str(row[col])
-            if is_spotify_meta(cell):
-                all_jsons.append(cell)
-                break
-
-    print(f"Found {len(all_jsons)} valid Spotify JSON entries")
-
-    
-    # Deduplicate URLs based on video_id
-    unique_jsons = {}
-    for js, json_str in enumerate(all_jsons):
-        video_id, json_str = extract_video_id(json_str, js)
-        if video_id and video_id not in unique_jsons:
-            unique_jsons[video_id] = json_str
-    
-    deduplicated_jsons = list(unique_jsons.values())
-    
-    # Limit the number of workouts to process if specified
+    # Results are appended to the output as they arrive; a resumed run skips the playlists already in it
+    result_writer = ResultWriter(output_csv_path, RESULT_FIELDNAMES, resume=resume)
+    if result_writer.resumed:
+        print(f"Resuming {output_csv_path}: {result_writer.resumed} playlists already analyzed")
+    ingest_stats = {}
+    playlists = iter_playlist_jsons(input_csv_path, max_workouts, ingest_stats, skip_ids=set(result_writer.video_ids))
     if max_workouts and max_workouts > 0:
-        deduplicated_jsons = deduplicated_jsons[:max_workouts]
         print(f"Limited to processing {max_workouts} JSONs")
 
-    total_jsons = len(all_jsons)
-    unique_count = len(deduplicated_jsons)
-    print(f"Found {total_jsons} total samples in the CSV")
-    print(f"After deduplication: {unique_count} unique JSONs")
-
-    # Check if we have more processes than videos
-    actual_processes = min(num_processes, max(1, len(deduplicated_jsons)))
-    if actual_processes != num_processes:
-        print(f"Using {actual_processes} processes for {len(deduplicated_jsons)} URLs")
-
   
     enabled_features = {
         'vibe': enable_vibe,
@@ -261,68 +340,120 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir_path,
         'image': include_image,
         'websearch':enable_web_search
     }
+    execution_options = {
+        'cache_backend': cache_backend,
+        'browsers': browsers,
+        'search_url': search_url,
+        'snippet_provider': snippet_provider,
+        'track_batch_size': track_batch_size,
+        'async': enable_async,
+        'max_concurrency': max_concurrency,
+        'combined': enable_combined,
+        'vibe_margin': vibe_margin,
+        'openai_base_url': openai_base_url
+    }
 
-    # Create batches of URLs for each process
-    batch_size = len(deduplicated_jsons) // actual_processes
-    if len(deduplicated_jsons) % actual_processes != 0:
-        batch_size += 1
-
-    # Split URLs into batches
-    json_batches = []
-    for i in range(0, len(deduplicated_jsons), batch_size):
-        batch = deduplicated_jsons[i:i + batch_size]
-        json_batches.append(batch)
-
-    # Print batch information
-    print(f"Split {len(deduplicated_jsons)} JSONs into {len(json_batches)} batches")
+    # Move existing per-workout JSON cache files into the SQLite cache
+    if cache_backend == 'sqlite' and import_cache:
+        os.makedirs(cache_dir_path, exist_ok=True)
+        cache_store = SqliteCacheStore(os.path.join(cache_dir_path, SQLITE_CACHE_FILE))
+        imported = cache_store.import_json_dir(cache_dir_path)
+        cache_store.close()
+        print(f"Imported {imported} cached analyses into the SQLite cache")
+
+    # With track batching, the unseen tracks of all playlists are classified first, track_batch_size per
+    # call, so batches span playlists; the playlists are then read into memory, as in Hydrow batch mode
+    track_batches = []
+    if track_batch_size > 1:
+        playlists = list(playlists)
+        os.makedirs(cache_dir_path, exist_ok=True)
+        unseen_tracks = collect_unseen_tracks(playlists, open_cache_store(cache_dir_path, cache_backend), track_batch_size)
+        track_batches = [unseen_tracks[start:start + track_batch_size]
+                         for start in range(0, len(unseen_tracks), track_batch_size)]
+        print(f"Classifying {len(unseen_tracks)} unseen tracks of {len(playlists)} playlists "
+              f"in {len(track_batches)} batches")
+    track_args = ((tracks, openai_api_key, enabled_features, cache_dir_path, execution_options)
+                  for tracks in track_batches)
+
+    # Tasks with a rotating process label; at most MAX_QUEUED_WORKOUTS wait for a worker at any time
+    queue_slots = BoundedSemaphore(MAX_QUEUED_WORKOUTS)
+    process_args = (
+        (schema, openai_api_key, enabled_features, i % num_processes, cache_dir_path, execution_options)
+        for i, schema in enumerate(playlists)
+    )
 
-    # Prepare arguments for each process
-    process_args = []
-    for i, batch in enumerate(json_batches):
-        # Flatten the batch into individual tasks with process ID
-        for el in batch:
-            process_args.append((el, openai_api_key, enabled_features, i, cache_dir_path))
+    # Share one OpenAI rate limit budget between all processes
+    rate_limiter = None
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = SharedRateLimiter(requests_per_minute, tokens_per_minute)
+        print(f"Rate limiting OpenAI calls to {requests_per_minute or 'unlimited'} requests/min "
+              f"and {tokens_per_minute or 'unlimited'} tokens/min")
 
     # Process URLs in parallel using a pool with progress bar
-    print(f"Starting parallel processing with {actual_processes} processes")
+    print(f"Starting parallel processing with {num_processes} processes")
 
     # Add a global progress bar for all tasks
-    with tqdm(total=len(process_args), desc="Overall Progress") as pbar:
-        with Pool(processes=actual_processes) as pool:
-            # Use imap_unordered with tqdm for progress tracking
-            results = []
-            for result in pool.imap_unordered(analyze_workout, process_args):
-                results.append(result)
+    processed = 0
+    rule_decision_counts = Counter()
+    execution_metrics = Counter()
+    with result_writer, tqdm(total=max_workouts or None, desc="Overall Progress") as pbar:
+        with Pool(processes=num_processes, initializer=init_worker_rate_limiter,
+                  initargs=(rate_limiter,)) as pool:
+            classified_tracks = sum(pool.imap_unordered(classify_tracks_task, track_args))
+            if track_batches:
+                print(f"Classified {classified_tracks} tracks")
+
+            # Use imap_unordered with tqdm for progress tracking; each result is written (deduplicated) right away
+            for result in pool.imap_unordered(analyze_workout, bounded_tasks(process_args, queue_slots)):
+                queue_slots.release()
+                result_writer.write(result)
+                processed += 1
+                for name, decision in ((result or {}).get('rule_decisions') or {}).items():
+                    rule_decision_counts[(name, decision)] += 1
+                execution_metrics.update((result or {}).get('execution_metrics') or {})
                 pbar.update(1)
 
+            # Let the workers exit normally, so they quit their browsers
+            pool.close()
+            pool.join()
+
     # Calculate total duration
     end_time = time.time()
     duration = end_time - start_time
 
-    # Write results to CSV (with deduplication)
-    print(f"Processing complete. Writing results to {output_csv_path}")
-    unique_results = write_results_to_csv(results, output_csv_path)
-
     # Count successful analyses
-    successful_analyses = len(unique_results)
+    successful_analyses = result_writer.written
 
     # Count reviewable/non-reviewable
-    reviewable_count = sum(1 for result in unique_results.values() if result.get('reviewable', False))
+    reviewable_count = result_writer.reviewable
     non_reviewable_count = successful_analyses - reviewable_count
 
     print(f"\nProcessing complete!")
-    print(f"Total JSONs found: {total_jsons}")
-    print(f"Unique JSONs found: {unique_count}")
-    print(f"Processed JSONs: {len(deduplicated_jsons)}")
+    print(f"Total JSONs found: {ingest_stats['found']}")
+    print(f"Unique JSONs found: {ingest_stats['unique'] + ingest_stats['skipped']}")
+    if resume:
+        print(f"Skipped JSONs already in the output: {ingest_stats['skipped']}")
+    print(f"Processed JSONs: {processed}")
     print(f"Successful analyses: {successful_analyses}")
     print(f"Reviewable trainings: {reviewable_count}")
     print(f"Non-reviewable trainings: {non_reviewable_count}")
+    summarize_rule_decisions(rule_decision_counts)
+    summarize_execution_metrics(execution_metrics)
     print(f"Results saved to: {output_csv_path}")
     print(f"Total processing time: {duration:.2f} seconds")
-    if len(deduplicated_jsons) > 0:
-        print(f"Average time per workout: {duration / len(deduplicated_jsons):.2f} seconds")
-
-    return results  # Return results for potential further use
+    if processed > 0:
+        print(f"Average time per workout: {duration / processed:.2f} seconds")
+
+    return {
+        'found': ingest_stats['found'],
+        'unique': ingest_stats['unique'] + ingest_stats['skipped'],
+        'skipped': ingest_stats['skipped'],
+        'processed': processed,
+        'written': successful_analyses,
+        'reviewable': reviewable_count,
+        'rule_decisions': dict(rule_decision_counts),
+        'execution_metrics': dict(execution_metrics)
+    }
 
 if __name__ == "__main__":
     # Set up files
@@ -350,8 +481,37 @@ if __name__ == "__main__":
                         help='To include poster image as model input')
     parser.add_argument('--include-websearch', action='store_true', dest='websearch',
                         help='To include selenium websearch for tracks in playlist')
+    parser.add_argument('--browsers', type=int, default=BROWSER_POOL_SIZE,
+                        help='Chrome drivers per process used for web search')
+    parser.add_argument('--search-url', type=str, default=None,
+                        help='Search page to use instead of DuckDuckGo, e.g. a local snippet_fixture_server.py')
+    parser.add_argument('--snippet-provider', type=str, choices=['browser', 'http'], default='browser',
+                        help='Fetch web search snippets with headless Chrome or with plain HTTP requests')
+    parser.add_argument('--track-batch-size', type=int, default=1,
+                        help='Tracks classified per TRACK_BATCH_PROMPT call (1 = one TRACK_PROMPT call per track); '
+                             'the uncached tracks of all playlists are batched together before the playlists are analyzed')
+    parser.add_argument('--resume', action='store_true',
+                        help='Keep the rows of an existing output file and only analyze playlists missing from it')
+    parser.add_argument('--async', action='store_true', dest='enable_async',
+                        help='Send the classifier requests of each playlist concurrently')
+    parser.add_argument('--max-concurrency', type=int, default=5,
+                        help='Maximum number of concurrent OpenAI requests per playlist in async mode')
+    parser.add_argument('--combined', action='store_true', dest='enable_combined',
+                        help='Answer all classifiers of a playlist with one OpenAI request and a combined schema')
+    parser.add_argument('--vibe-margin', type=float, default=None,
+                        help='Take the vibe from embedding similarity when the best vibe beats the second by this margin (e.g. 0.05)')
+    parser.add_argument('--openai-base-url', type=str, default=None,
+                        help='OpenAI-compatible API base URL, e.g. a local mock server')
     parser.add_argument('--processes', type=int, default=1,
                         help='Number of parallel processes to use')
+    parser.add_argument('--rpm', type=int, default=None,
+                        help='OpenAI requests per minute shared by all processes')
+    parser.add_argument('--tpm', type=int, default=None,
+                        help='OpenAI tokens per minute shared by all processes')
+    parser.add_argument('--cache-backend', type=str, choices=['json', 'sqlite'], default='json',
+                        help='Cache classifier results as one JSON file each or in a single SQLite file')
+    parser.add_argument('--import-cache', action='store_true',
+                        help='Import existing JSON cache files into the SQLite cache before processing')
     
     # Set default values for boolean arguments
     parser.set_defaults(vibe=True, spirit=True, image=False, websearch=False)
@@ -369,8 +529,21 @@ if __name__ == "__main__":
         enable_vibe=args.vibe,
         enable_spirit=args.spirit,
         include_image=args.image,
-        num_processes=args.processes
+        num_processes=args.processes,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        cache_backend=args.cache_backend,
+        import_cache=args.import_cache,
+        browsers=args.browsers,
+        search_url=args.search_url,
+        snippet_provider=args.snippet_provider,
+        track_batch_size=args.track_batch_size,
+        resume=args.resume,
+        enable_async=args.enable_async,
+        max_concurrency=args.max_concurrency,
+        enable_combined=args.enable_combined,
+        vibe_margin=args.vibe_margin,
+        openai_base_url=args.openai_base_url
     )
 
-    # Cannot use results directly here as they are deduplicated in write_results_to_csv function
     print(f"\nProcess completed successfully!")
\ No newline at end of file
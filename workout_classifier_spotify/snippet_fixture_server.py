@@ -0,0 +1,120 @@
+"""
+Local stand-in for the web search page used by snippet collection.
+
+Serves a search page with an input named "q"; submitting it opens a results page (/results)
+that renders <div data-result="snippet"> elements after a delay, like a lazy-loading search engine.
+/html/?q=... returns the same snippets without JavaScript, like html.duckduckgo.com/html/.
+Snippets are generated from the query, so runs are reproducible and need no network:
+    python snippet_fixture_server.py --port 8766 --delay 0.5
+    python csv_processor_mp.py --include-websearch --search-url http://127.0.0.1:8766
+    python csv_processor_mp.py --include-websearch --snippet-provider http --search-url http://127.0.0.1:8766/html/
+"""
+import argparse
+import html
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SEARCH_PAGE = """<!DOCTYPE html>
+<html><body>
+<form action="/results" method="get"><input type="text" name="q"></form>
+</body></html>"""
+
+# Snippets are inserted by script after delay_ms, so clients have to wait on the DOM
+RESULTS_PAGE = """<!DOCTYPE html>
+<html><body>
+<div id="results"></div>
+<script>
+setTimeout(function () {{
+    var snippets = {snippets};
+    var results = document.getElementById("results");
+    snippets.forEach(function (text) {{
+        var div = document.createElement("div");
+        div.setAttribute("data-result", "snippet");
+        div.textContent = text;
+        results.appendChild(div);
+    }});
+}}, {delay_ms});
+</script>
+</body></html>"""
+
+STATIC_RESULTS_PAGE = """<!DOCTYPE html>
+<html><body>
+<div id="results">
+{snippets}
+</div>
+</body></html>"""
+
+
+def fixture_snippets(query, count=5):
+    """Snippets the fixture server returns for a query."""
+    return [f"Result {i + 1} for {query}: genre, bpm and mood of the track." for i in range(count)]
+
+
+def make_handler(delay, snippets_per_query):
+    class SnippetFixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query).get("q", [""])[0]
+            if url.path == "/results":
+                # "</" would end the script element early
+                snippets = json.dumps(fixture_snippets(query, snippets_per_query)).replace("</", "<\\/")
+                body = RESULTS_PAGE.format(snippets=snippets, delay_ms=int(delay * 1000))
+            elif url.path == "/html/":
+                time.sleep(delay)
+                body = STATIC_RESULTS_PAGE.format(snippets="\n".join(
+                    f'<div class="result"><a class="result__snippet">{html.escape(text)}</a></div>'
+                    for text in fixture_snippets(query, snippets_per_query)
+                ))
+            else:
+                body = SEARCH_PAGE
+
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SnippetFixtureHandler
+
+
+def start_fixture_server(port=0, delay=0.5, snippets_per_query=5):
+    """
+    Start the fixture server in a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 for any free port
+        delay (float): Seconds before the results page shows its snippets (or responds, for /html/)
+        snippets_per_query (int): Snippets on every results page
+
+    Returns:
+        tuple: (server, search_url); stop the server with server.shutdown()
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay, snippets_per_query))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local search page with result snippets')
+    parser.add_argument('--port', type=int, default=8766,
+                        help='Port to listen on')
+    parser.add_argument('--delay', type=float, default=0.5,
+                        help='Seconds before the results page shows its snippets')
+    parser.add_argument('--snippets', type=int, default=5,
+                        help='Snippets per results page')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.delay, args.snippets))
+    print(f"Serving search fixture on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
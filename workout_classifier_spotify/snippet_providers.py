@@ -0,0 +1,213 @@
+"""
+Web search snippet providers for track descriptions.
+
+A provider turns search queries into result snippets, one joined string per query:
+- 'browser': headless Chrome drivers of the browser pool (browser_pool.py), renders JavaScript
+- 'http': plain HTTP requests to a no-JavaScript results page (html.duckduckgo.com/html/ by default),
+  parsed with the standard library HTML parser. Requests run concurrently on one aiohttp session
+  per process, which keeps connections alive between playlists and caps connections per host.
+  It needs a few MB instead of a Chrome instance per driver.
+
+Usage:
+    provider = get_snippet_provider('http', search_url="http://127.0.0.1:8766/html/")
+    snippets = provider.collect(queries)
+"""
+import asyncio
+import os
+import threading
+from abc import ABC, abstractmethod
+from html.parser import HTMLParser
+from multiprocessing import util
+
+import aiohttp
+
+from browser_pool import get_browser_pool, SEARCH_URL, MAX_SNIPPETS
+
+SNIPPET_PROVIDERS = ("browser", "http")
+
+# Results page of the 'http' provider, queried with ?q=
+HTTP_SEARCH_URL = "https://html.duckduckgo.com/html/"
+
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 13_2 like Mac OS X)"}
+
+# Snippet providers of this process, keyed by (pid, name, options)
+_SNIPPET_PROVIDERS = {}
+
+# Elements without an end tag, which separate words inside a snippet
+VOID_ELEMENTS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input",
+                           "link", "meta", "source", "track", "wbr"))
+
+
+class SnippetProvider(ABC):
+    """Turns search queries into result snippets."""
+
+    @abstractmethod
+    def collect(self, queries):
+        """
+        Args:
+            queries (list): Search queries
+
+        Returns:
+            list: Snippets of every query joined by spaces, '' where none were found, in query order
+        """
+
+    def close(self):
+        pass
+
+
+class BrowserSnippetProvider(SnippetProvider):
+    """Snippets from the per-process Chrome browser pool."""
+
+    def __init__(self, driver_factory, browsers, search_url=None):
+        self.pool = get_browser_pool(browsers, driver_factory, search_url or SEARCH_URL)
+
+    def collect(self, queries):
+        return self.pool.collect(queries)
+
+
+class SnippetParser(HTMLParser):
+    """
+    Collects the text of result snippets: data-result="snippet" elements or class "result__snippet".
+
+    A snippet ends at the end tag matching the element that opened it. Only elements of the same
+    name count towards the nesting depth, so elements left open inside the snippet (<p>, <li>,
+    whose end tags are optional) do not keep it open past its end.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.snippets = []
+        self._tag = None
+        self._depth = 0
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if self._tag is not None:
+            if tag in VOID_ELEMENTS:
+                # <br> and the like separate words
+                self._text.append(" ")
+            elif tag == self._tag:
+                self._depth += 1
+            return
+        attrs = dict(attrs)
+        if tag not in VOID_ELEMENTS and (attrs.get("data-result") == "snippet"
+                                         or "result__snippet" in (attrs.get("class") or "").split()):
+            self._tag = tag
+            self._depth = 1
+            self._text = []
+
+    def handle_endtag(self, tag):
+        if tag != self._tag:
+            return
+        self._depth -= 1
+        if not self._depth:
+            self._tag = None
+            text = " ".join("".join(self._text).split())
+            if text:
+                self.snippets.append(text)
+
+    def handle_data(self, data):
+        if self._tag is not None:
+            self._text.append(data)
+
+
+def parse_snippets(page, max_snippets=MAX_SNIPPETS):
+    """Result snippets of a search results page, joined by spaces."""
+    parser = SnippetParser()
+    parser.feed(page)
+    return " ".join(parser.snippets[:max_snippets])
+
+
+class HttpSnippetProvider(SnippetProvider):
+    """Snippets from a no-JavaScript results page, fetched concurrently with aiohttp."""
+
+    def __init__(self, search_url=None, max_connections=32, max_connections_per_host=4,
+                 timeout=10, retries=2):
+        """
+        Args:
+            search_url (str, optional): Results page, queried with ?q=
+            max_connections (int): Open connections in total
+            max_connections_per_host (int): Open connections (and so requests in flight) per host
+            timeout (float): Seconds per request
+            retries (int): Retries of requests answered with 429, 202 (throttled) or a server error
+        """
+        self.search_url = search_url or HTTP_SEARCH_URL
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self._session = None
+
+        # The session lives on an event loop in a background thread, so it is reused across collect calls
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    async def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             limit_per_host=self.max_connections_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, headers=HTTP_HEADERS,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _fetch(self, session, query):
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(self.search_url, params={"q": query}) as response:
+                    if response.status == 200:
+                        return parse_snippets(await response.text())
+                    if response.status not in (202, 429) and response.status < 500:
+                        print(f"[Error] Query failed: {query} | HTTP {response.status}")
+                        return ""
+                    status = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = repr(e)
+            if attempt < self.retries:
+                await asyncio.sleep(2 ** attempt)
+        print(f"[Error] Query failed: {query} | {status}")
+        return ""
+
+    async def _collect(self, queries):
+        session = await self._get_session()
+        return await asyncio.gather(*(self._fetch(session, query) for query in queries))
+
+    def collect(self, queries):
+        return list(asyncio.run_coroutine_threadsafe(self._collect(queries), self._loop).result())
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+            self._session = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def get_snippet_provider(name="browser", browsers=1, search_url=None, driver_factory=None):
+    """
+    Snippet provider of the current process, created on first use and closed when the process exits.
+
+    Args:
+        name (str): 'browser' or 'http'
+        browsers (int): Chrome drivers of the 'browser' provider
+        search_url (str, optional): Search page ('browser') or results page ('http') to use instead of DuckDuckGo
+        driver_factory (callable): driver_factory(profile_dir, debugging_port) -> WebDriver, for 'browser'
+
+    Returns:
+        SnippetProvider: The provider
+    """
+    if name not in SNIPPET_PROVIDERS:
+        raise ValueError(f"Unknown snippet provider: {name}")
+
+    key = (os.getpid(), name, browsers, search_url)
+    if key not in _SNIPPET_PROVIDERS:
+        if name == "browser":
+            provider = BrowserSnippetProvider(driver_factory, browsers, search_url)
+        else:
+            provider = HttpSnippetProvider(search_url)
+            util.Finalize(provider, provider.close, exitpriority=10)
+        _SNIPPET_PROVIDERS[key] = provider
+    return _SNIPPET_PROVIDERS[key]
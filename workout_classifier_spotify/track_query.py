@@ -155,3 +155,48 @@ TRACK_RESPONSE_FORMAT = {
         }
     }
 }
+
+
+# Batched variant: several tracks per call, so the long system prompt is sent once for all of them
+TRACK_BATCH_PROMPT = TRACK_PROMPT + """
+BATCH MODE:
+You will receive several tracks at once, each introduced by a "Key:" line.
+Analyze every track on its own, exactly as described above, and return one entry per track.
+Copy the key of the track into "track_key". Never merge tracks or skip one.
+Your final response must be a JSON dictionary {"tracks": [...]}, with one object per track that has
+"track_key" and all fields listed in RESPONSE FORMAT.
+"""
+
+TRACK_BATCH_USER_PROMPT = "Analyze each of these audio tracks and classify it according to the schema:"
+
+_TRACK_SCHEMA = TRACK_RESPONSE_FORMAT["json_schema"]["schema"]
+
+TRACK_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "MusicTrackBatchAnalysis",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "tracks": {
+                    "type": "array",
+                    "description": "One analysis per input track.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "track_key": {
+                                "type": "string",
+                                "description": "The key of the track, copied from its 'Key:' line."
+                            },
+                            **_TRACK_SCHEMA["properties"]
+                        },
+                        "required": ["track_key"] + _TRACK_SCHEMA["required"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["tracks"],
+            "additionalProperties": False
+        }
+    }
+}
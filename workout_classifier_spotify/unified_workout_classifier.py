@@ -1,12 +1,10 @@
-from openai import OpenAI, OpenAIError
 import json
 import os
 import re
+import hashlib
+import unicodedata
 import platform
-import time
-import random
 import io
-from tqdm import tqdm
 import subprocess
 import zipfile
 import shutil
@@ -19,25 +17,49 @@ from PIL import Image
 import requests
 from io import BytesIO
 import pandas as pd
-import time
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.chrome.service import Service
 
 # Import classifier modules
 from category_classifier import CATEGORY_PROMPT, CATEGORY_USER_PROMPT, CATEGORY_RESPONSE_FORMAT
-from track_query import TRACK_PROMPT, TRACK_USER_PROMPT, TRACK_RESPONSE_FORMAT
+from track_query import (TRACK_PROMPT, TRACK_USER_PROMPT, TRACK_RESPONSE_FORMAT,
+                         TRACK_BATCH_PROMPT, TRACK_BATCH_USER_PROMPT, TRACK_BATCH_RESPONSE_FORMAT)
 from vibe_classifier import VIBE_PROMPT, VIBE_USER_PROMPT, VIBE_RESPONSE_FORMAT
 from spirit_classifier import SPIRIT_PROMPT, SPIRIT_USER_PROMPT, SPIRIT_RESPONSE_FORMAT
 from db_transformer import transform_to_db_structure
+from snippet_providers import get_snippet_provider
+
+# Modules shared by the pipelines live in workout_classifier_common at the repository root
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from workout_classifier_common.cache_store import open_cache_store, classifier_fingerprint
+from workout_classifier_common.rule_engine import RuleEngine
+from workout_classifier_common.classifier_engine import CLASSIFIER_MODEL, ClassifierEngine, ClassifierSource, get_openai_client, run_classifier
+from workout_classifier_common.vibe_preclassifier import get_vibe_preclassifier
+
+# Vibe definitions of this pipeline, embedded by the vibe pre-classifier
+VIBES_INFO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibes_info.csv")
+
+# Classifier name of the per-track entries of the global track cache, see track_cache_key
+TRACK_CACHE_CLASSIFIER = "track"
+
+# Chrome drivers per process used for web search snippets
+BROWSER_POOL_SIZE = 3
+
+# Tracks of a playlist that are analysed and described in its metadata
+TRACKS_PER_PLAYLIST = 5
 
 def analyse_spotify_workout(workout_json, openai_api_key,
                           cache_dir='cache', force_refresh=False, #!
                           enable_vibe=True, enable_spirit=True,
                           enable_web_search = True,
-                          enable_image_in_meta=False):
+                          enable_image_in_meta=False, cache_backend='json',
+                          browsers=BROWSER_POOL_SIZE, search_url=None, snippet_provider='browser',
+                          track_batch_size=1, enable_async=False, max_concurrency=5, enable_combined=False,
+                          vibe_margin=None, openai_base_url=None):
     """
     Analyzes a workout playlist and classifies it according to enabled dimensions:
     1. Vibe (e.g., Warrior Workout, Zen Flow)
@@ -50,58 +72,30 @@ def analyse_spotify_workout(workout_json, openai_api_key,
         force_refresh (bool): Whether to force fresh analysis even if cached data exists
         enable_vibe (bool): Whether to classify workout by vibe
         enable_spirit (bool): Whether to classify workout by spirit
+        cache_backend (str): Where classifier results are cached: 'json' (one file per result) or 'sqlite'
+        browsers (int): Chrome drivers per process used for web search
+        search_url (str, optional): Search page to use instead of DuckDuckGo, e.g. snippet_fixture_server.py
+        snippet_provider (str): How web search snippets are fetched: 'browser' (Chrome) or 'http'
+        track_batch_size (int): Tracks of a playlist classified per TRACK_BATCH_PROMPT call, 1 for one TRACK_PROMPT call per track
+        enable_async (bool): Whether to send all uncached classifier requests concurrently
+        max_concurrency (int): Maximum number of in-flight OpenAI requests in async mode
+        enable_combined (bool): Whether to answer all uncached classifiers with one request (see classifier_engine.py)
+        vibe_margin (float, optional): Answer the vibe classifier from embeddings when the best vibe beats the
+                                       second by this cosine similarity margin (see vibe_preclassifier.py)
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
 
     Returns:
         dict: Combined workout analysis across all enabled dimensions
     """
-    # API keys - use provided keys or default values
-    # Initialize clients
-    try:
-        oai_client = OpenAI(api_key=openai_api_key)
-    except Exception as e:
-        return {"error": f"Failed to initialize API clients: {str(e)}"}
-
     # Ensure cache directory exists
     os.makedirs(cache_dir, exist_ok=True)
-
-    # extract image and textual summary
-    video_id = workout_json.get('playlist').get('id')
-    meta = extract_spotify_playlist_summary(workout_json)
-    
-    # using gpt and optionally the web scrapper to collect more information about tracks
-    tracks_meta = tracks_descriptions(workout_json,
-                                      video_id,
-                                      enable_web_search,
-                                      oai_client,
-                                      cache_dir,
-                                      force_refresh)
-    tracks_meta_str = format_tracks_meta(tracks_meta)
-    meta['text'] += "\n\nTracks Analysis:\n" + tracks_meta_str
-
-    
-    # Initialize combined analysis
-    playlist = workout_json.get("playlist", {})
-    combined_analysis = {
-        "video_id": video_id,
-        "video_url": playlist.get('external_urls', {}).get('spotify',None),
-        "video_title": playlist.get("name"),
-        "duration": calculate_total_duration_of_tracks(workout_json),
-        'video_metadata': workout_json,
-        'video_metadata_cleaned': meta,
-        "channel_title": playlist.get('owner', {}).get('display_name',None),
-        "poster_uri": meta['image']
-        }
-
-    if not enable_image_in_meta:
-        del meta['image']
-
+    cache_store = open_cache_store(cache_dir, cache_backend)
 
     # Define classifier configurations
     classifiers = [
         {
             "name": "category",
             "enabled": True,
-            "cache_key": f"{video_id}_category_analysis.json",
             "system_prompt": CATEGORY_PROMPT,
             "user_prompt": CATEGORY_USER_PROMPT,
             "response_format": CATEGORY_RESPONSE_FORMAT
@@ -109,7 +103,6 @@ def analyse_spotify_workout(workout_json, openai_api_key,
         {
             "name": "spirit",
             "enabled": enable_spirit,
-            "cache_key": f"{video_id}_spirit_analysis.json",
             "system_prompt": SPIRIT_PROMPT,
             "user_prompt": SPIRIT_USER_PROMPT,
             "response_format": SPIRIT_RESPONSE_FORMAT
@@ -117,83 +110,55 @@ def analyse_spotify_workout(workout_json, openai_api_key,
         {
             "name": "vibe",
             "enabled": enable_vibe,
-            "cache_key": f"{video_id}_vibe_analysis.json",
             "system_prompt": VIBE_PROMPT,
             "user_prompt": VIBE_USER_PROMPT,
             "response_format": VIBE_RESPONSE_FORMAT
+        },
+        {
+            # No prompt: only answered by SPOTIFY_RULES, left out when no rule matches
+            "name": "equipment",
+            "enabled": True,
+            "rule_only": True
         }
     ]
-    # Flag to track if any classifier had an error
-    has_errors = False
-    review_comments = []
+    for classifier in classifiers:
+        if classifier.get("rule_only"):
+            continue
+        classifier["prompt_version"] = classifier_fingerprint(
+            classifier["system_prompt"],
+            classifier["user_prompt"],
+            classifier["response_format"],
+            CLASSIFIER_MODEL
+        )
 
-    # Run each enabled classifier
     try:
-        for classifier in classifiers:
-            if not classifier["enabled"]:
-                continue
-
-            name = classifier["name"]
-            cache_path = os.path.join(cache_dir, classifier["cache_key"])
-
-            # Check for cached analysis
-            if os.path.exists(cache_path) and not force_refresh:
-                try:
-                    with open(cache_path, 'r') as f:
-                        analysis = json.load(f)
-                    print(f"Loaded {name} analysis from cache: {cache_path}")
-                except Exception as e:
-                    print(f"Error loading cached {name} analysis: {str(e)}. Running fresh analysis.")
-                    analysis = run_classifier(
-                        oai_client,
-                        meta,
-                        classifier["system_prompt"],
-                        classifier["user_prompt"],
-                        classifier["response_format"]
-                    )
-                    cache_data(analysis, cache_path)
-            else:
-                analysis = run_classifier(
-                    oai_client,
-                    meta,
-                    classifier["system_prompt"],
-                    classifier["user_prompt"],
-                    classifier["response_format"]
-                )
-                cache_data(analysis, cache_path)
-            # Check for errors in the classifier result
-            if "error" in analysis:
-                has_errors = True
-                error_message = f"Error in {name} classifier: {analysis.get('error')}"
-                review_comments.append(error_message)
-
-                # Add review comment tag if present
-                if "review_comment" in analysis:
-                    if analysis["review_comment"] not in review_comments:
-                        review_comments.append(analysis["review_comment"])
-            
-            combined_analysis[name] = analysis
-        # Update reviewable status based on errors
-        if has_errors:
-            combined_analysis["reviewable"] = False
-            combined_analysis["review_comment"] = "; ".join(review_comments)
-        
-        return combined_analysis
-
+        preclassifiers = {}
+        if enable_vibe and vibe_margin is not None:
+            try:
+                preclassifiers["vibe"] = get_vibe_preclassifier(openai_api_key, VIBES_INFO_PATH, openai_base_url,
+                                                                cache_dir=cache_dir, margin=vibe_margin)
+            except Exception as e:
+                # Without prototypes every workout asks the LLM, as without --vibe-margin
+                print(f"Vibe pre-classifier unavailable, asking the LLM: {str(e)}")
+        engine = ClassifierEngine(
+            SpotifySource(get_openai_client(openai_api_key, openai_base_url), cache_store, enable_web_search, enable_image_in_meta, force_refresh,
+                          browsers, search_url, snippet_provider, track_batch_size),
+            classifiers,
+            cache_store,
+            openai_api_key,
+            openai_base_url=openai_base_url,
+            force_refresh=force_refresh,
+            enable_async=enable_async,
+            max_concurrency=max_concurrency,
+            combined=enable_combined,
+            preclassifiers=preclassifiers
+        )
     except Exception as e:
-        error_message = f"Failed to perform combined analysis: {str(e)}"
-        return return_error_analysis(error_message, workout_json)
+        return {"error": f"Failed to initialize API clients: {str(e)}"}
+
+    return engine.analyze(workout_json)
 
 # Other functions remain unchanged
-def cache_data(data, cache_path):
-    """Cache data to a JSON file."""
-    try:
-        with open(cache_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        print(f"Cached data to: {cache_path}")
-    except Exception as e:
-        print(f"Error caching data: {str(e)}")
-               
 def format_duration(seconds):
         if not seconds:
             return "Unknown duration"
@@ -331,100 +296,72 @@ def equipment_hardcoded(analysis):
         }
     return out
 
-def run_classifier(oai_client, meta, system_prompt, user_prompt, response_format):
-    """
-    Generic function to run a classifier through OpenAI API with optional image input.
-
-    Args:
-        oai_client: OpenAI client
-        meta: dictionary with 'text' and optional 'image' (url)
-        system_prompt: System prompt for the classifier
-        user_prompt: User prompt for the classifier
-        response_format: Expected response format
-
-    Returns:
-        dict: Classification results
-    """
-    try:
-        # Base message (text-based)
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-
-        # Add image if present
-        if meta.get("image"):
-            messages.append({
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": f"{user_prompt}\n\n{meta['text']}"},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"{meta.get('image')}"
-                        }
-                    }
-                ]
-            })
-        else:
-            # Only text
-            messages.append({
-                "role": "user",
-                "content": f"{user_prompt}\n\n{meta['text']}"
-            })
-
-        return openai_call_with_retry(oai_client, "gpt-4o", messages, response_format)
-
-    except Exception as e:
-        return {"error": f"Error with classifier: {str(e)}"}
+# Classifiers answered or prefilled from the playlist metadata and earlier analyses
+SPOTIFY_RULES = RuleEngine([
+    {
+        "name": "category_equipment",
+        "classifier": "equipment",
+        "requires": ["category"],
+        "resolve": lambda workout_json, meta, analyses: equipment_hardcoded(analyses["category"])
+    }
+])
 
-def openai_call_with_retry(oai_client, model, messages, response_format):
+class SpotifySource(ClassifierSource):
     """
-    Helper function to make OpenAI API calls with retry for rate limits.
+    Spotify playlist jsons for the classifier engine. The metadata text is extended with the
+    analyses of the first tracks (see tracks_descriptions), which may themselves call OpenAI.
     """
-    # Maximum number of retries
-    max_retries = 5
-    # Initial retry delay in seconds
-    retry_delay = 2
 
-    for retry_attempt in range(max_retries):
-        try:
-            response = oai_client.chat.completions.create(
-                model=model,
-                response_format=response_format,
-                messages=messages
-            )
-
-            return json.loads(response.choices[0].message.content)
-
-        except OpenAIError as e:
-            # Check if it's a rate limit error
-            error_str = str(e)
-            if "rate_limit_exceeded" in error_str or "Rate limit reached" in error_str:
-                # Try to extract suggested wait time if available
-                wait_time_match = re.search(r'try again in (\d+\.\d+)s', error_str)
-
-                if wait_time_match:
-                    # Use the recommended wait time from the error message
-                    wait_time = float(wait_time_match.group(1))
-                    # Add a small buffer to ensure we're past the rate limit window
-                    wait_time += 0.5
-                else:
-                    # Use exponential backoff with jitter
-                    wait_time = retry_delay * (2 ** retry_attempt) + random.uniform(0, 1)
-
-                print(
-                    f"Rate limit reached. Waiting for {wait_time:.2f} seconds before retry ({retry_attempt + 1}/{max_retries})...")
-                time.sleep(wait_time)
-
-                # If this is the last retry attempt, raise the error
-                if retry_attempt == max_retries - 1:
-                    raise Exception(f"Error with OpenAI API after {max_retries} retries: {str(e)}")
-            else:
-                # If it's not a rate limit error, don't retry
-                raise Exception(f"Error with OpenAI API: {str(e)}")
+    rules = SPOTIFY_RULES
+
+    def __init__(self, oai_client, cache_store, enable_web_search=True, include_image=False, force_refresh=False,
+                 browsers=BROWSER_POOL_SIZE, search_url=None, snippet_provider='browser', track_batch_size=1):
+        self.oai_client = oai_client
+        self.cache_store = cache_store
+        self.enable_web_search = enable_web_search
+        self.include_image = include_image
+        self.force_refresh = force_refresh
+        self.browsers = browsers
+        self.search_url = search_url
+        self.snippet_provider = snippet_provider
+        self.track_batch_size = track_batch_size
+
+    def item_id(self, workout_json):
+        return workout_json.get('playlist').get('id')
+
+    def format(self, workout_json):
+        # extract image and textual summary
+        meta = extract_spotify_playlist_summary(workout_json)
+
+        # using gpt and optionally the web scrapper to collect more information about tracks
+        tracks_meta = tracks_descriptions(workout_json,
+                                          self.item_id(workout_json),
+                                          self.enable_web_search,
+                                          self.oai_client,
+                                          self.cache_store,
+                                          self.force_refresh,
+                                          self.browsers,
+                                          self.search_url,
+                                          self.snippet_provider,
+                                          self.track_batch_size)
+        meta['text'] += "\n\nTracks Analysis:\n" + format_tracks_meta(tracks_meta)
+        return meta
+
+    def describe(self, workout_json, meta):
+        playlist = workout_json.get("playlist", {})
+        return {
+            "video_id": self.item_id(workout_json),
+            "video_url": playlist.get('external_urls', {}).get('spotify',None),
+            "video_title": playlist.get("name"),
+            "duration": calculate_total_duration_of_tracks(workout_json),
+            'video_metadata': workout_json,
+            'video_metadata_cleaned': meta,
+            "channel_title": playlist.get('owner', {}).get('display_name',None),
+            "poster_uri": meta['image']
+            }
 
-    # This should only happen if we exhaust all retries
-    raise Exception("Failed after maximum retry attempts")
+    def error_analysis(self, error_message, workout_json):
+        return return_error_analysis(error_message, workout_json)
 
 def return_error_analysis(error_message, workout_json=None):
     if workout_json:
@@ -451,13 +388,16 @@ def return_error_analysis(error_message, workout_json=None):
         "channel_title": channel_title
     }
 
-def create_driver():
+def create_driver(profile_dir=None, debugging_port=9222):
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--disable-gpu")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--remote-debugging-port=9222")
+    # Drivers running side by side need their own port and profile
+    options.add_argument(f"--remote-debugging-port={debugging_port}")
+    if profile_dir:
+        options.add_argument(f"--user-data-dir={profile_dir}")
     options.add_argument("user-agent=Mozilla/5.0 (iPhone; CPU iPhone OS 13_2 like Mac OS X)")
 
 
@@ -466,126 +406,265 @@ def create_driver():
     driver = webdriver.Chrome(service=service, options=options)
     return driver
 
-def collect_snippets_batch(queries: list, delay: float = 3.0, max_wait: int = 10, retry_interval: float = 1.0) -> list:
-    results = []
-    driver = create_driver()
-
-    for query in tqdm(queries, desc="Web search:"):
-        try:
-            # Step 1: Go to homepage
-            driver.get("https://duckduckgo.com")
-            time.sleep(0.5)
+def collect_snippets_batch(queries: list, browsers: int = BROWSER_POOL_SIZE, search_url: str = None,
+                           provider: str = 'browser') -> list:
+    """
+    Collect web search snippets for queries with the snippet provider of this process.
 
-            # Step 2: Enter query into input field
-            search_box = driver.find_element(By.NAME, "q")
-            search_box.clear()
-            search_box.send_keys(query)
-            search_box.send_keys(Keys.RETURN)
+    Args:
+        queries (list): Search queries
+        browsers (int): Number of Chrome drivers of the 'browser' provider, queries run on all of them in parallel
+        search_url (str, optional): Search page to use instead of DuckDuckGo, e.g. snippet_fixture_server.py
+        provider (str): 'browser' (Chrome, see browser_pool.py) or 'http' (see snippet_providers.py)
 
-            time.sleep(delay)
+    Returns:
+        list: Joined snippets per query, '' where none were found
+    """
+    return get_snippet_provider(provider, browsers, search_url, create_driver).collect(queries)
 
-            snippets = []
-            start_time = time.time()
+def track_prompt_versions():
+    """
+    Fingerprints of per-track analyses.
 
-            while True:
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(0.5)
-                driver.execute_script("document.body.dispatchEvent(new Event('mousemove'));")
-                time.sleep(0.5)
+    Returns:
+        tuple: (version of TRACK_PROMPT results, version of TRACK_BATCH_PROMPT results); batched
+        results come from another prompt and are cached under their own version
+    """
+    prompt_version = classifier_fingerprint(TRACK_PROMPT, TRACK_USER_PROMPT, TRACK_RESPONSE_FORMAT, CLASSIFIER_MODEL)
+    batch_version = classifier_fingerprint(TRACK_BATCH_PROMPT, TRACK_BATCH_USER_PROMPT, TRACK_BATCH_RESPONSE_FORMAT,
+                                           CLASSIFIER_MODEL)
+    return prompt_version, batch_version
+
+def track_versions(track_batch_size: int = 1) -> list:
+    """Versions track analyses are read under; with batching, tracks a batch left out were classified one at a time."""
+    prompt_version, batch_version = track_prompt_versions()
+    return [batch_version, prompt_version] if track_batch_size > 1 else [prompt_version]
+
+def playlist_tracks(workout_json: Dict[str, Any]) -> list:
+    """(artist, track name, year) of the first TRACKS_PER_PLAYLIST tracks of a playlist, the ones analysed."""
+    items = workout_json.get("playlist", {}).get("tracks", {}).get("items", [])
+    return [extract_track_details(item)[:3] for item in items][:TRACKS_PER_PLAYLIST]
+
+def cached_track_analysis(cache_store: Any, track_id: str, versions: list):
+    """Analysis of a track from the global track cache under the first of versions that has one, or None."""
+    for version in versions:
+        cached_track = cache_store.get(track_id, TRACK_CACHE_CLASSIFIER, version)
+        if cached_track is not None:
+            return cached_track
+    return None
+
+def enrich_tracks(tracks: list, enable_web_search: bool, browsers: int = BROWSER_POOL_SIZE, search_url: str = None,
+                  snippet_provider: str = 'browser') -> list:
+    """
+    Track metadata sent to the track classifiers, with a web search snippet per track when enabled.
 
-                elements = driver.find_elements(By.XPATH, '//div[@data-result="snippet"]')
+    Args:
+        tracks (list): (artist, track name, year) of the tracks to classify
+        enable_web_search (bool): Whether to search the web for the tracks
 
-                if elements:
-                    snippets = [el.text.strip() for el in elements[:5] if el.text.strip()]
-                    # print(snippets)
-                    break
+    Returns:
+        list: Dicts with 'key' (artist_track name), 'track_id' (see track_cache_key) and 'text'
+    """
+    snippets = [None] * len(tracks)
+    if tracks and enable_web_search:
+        try:
+            queries = [
+                f"{track_name} by {artist} {year} lyrics meaning genre bpm mood"
+                for artist, track_name, year in tracks
+            ]
+            snippets = collect_snippets_batch(queries, browsers, search_url, snippet_provider)
+        except:
+            snippets = [None] * len(tracks)
+
+    enriched_meta = []
+    for (artist, track_name, year), snippet in zip(tracks, snippets):
+        text = f"Track: '{track_name}' by {artist} ({year})"
+        if snippet is not None:
+            text += f"\nSnippet: {snippet}"
+        enriched_meta.append({
+            "key": f"{artist}_{track_name}",
+            "track_id": track_cache_key(artist, track_name, year),
+            "text": text
+        })
+    return enriched_meta
+
+def classify_tracks(oai_client: Any, cache_store: Any, enriched_meta: list, track_batch_size: int = 1) -> Dict[str, Any]:
+    """
+    Classify tracks and cache each analysis in the global track cache.
 
-                if time.time() - start_time > max_wait:
-                    print(f"[Timeout] No snippets for query after {max_wait}s: {query}")
-                    break
+    Args:
+        oai_client: OpenAI client
+        cache_store: Cache store of the track analyses
+        enriched_meta (list): Track metadata from enrich_tracks
+        track_batch_size (int): Tracks per TRACK_BATCH_PROMPT call, 1 for one TRACK_PROMPT call per track
 
-                time.sleep(retry_interval)
+    Returns:
+        dict: Analysis per track 'key'; tracks whose classification raised are left out
+    """
+    prompt_version, batch_version = track_prompt_versions()
 
-            results.append(" ".join(snippets))
+    # Up to track_batch_size tracks per call; batched results are split into the same per-track entries
+    batch_results = {}
+    if track_batch_size > 1:
+        for start in range(0, len(enriched_meta), track_batch_size):
+            batch_results.update(run_track_batch_classifier(oai_client, enriched_meta[start:start + track_batch_size]))
 
+    analysis = {}
+    for item in enriched_meta:
+        try:
+            result = batch_results.get(item["track_id"])
+            version = batch_version
+            if result is None:
+                version = prompt_version
+                # One call per track, also for tracks a batch call left out
+                result = run_classifier(oai_client, item, TRACK_PROMPT, TRACK_USER_PROMPT, TRACK_RESPONSE_FORMAT)
+            analysis[item["key"]] = result
+            if "error" not in result:
+                cache_store.put(item["track_id"], TRACK_CACHE_CLASSIFIER, result, version)
         except Exception as e:
-            print(f"[Error] Query failed: {query} | Error: {e}")
-            results.append("")
+            print(f"[Error] GPT classification failed for {item['key']}: {e}")
+    return analysis
 
-    driver.quit()
-    return results
+def collect_unseen_tracks(workout_jsons: list, cache_store: Any, track_batch_size: int = 1) -> list:
+    """
+    Tracks of the playlists that are not in the global track cache, each listed once.
+
+    Playlists whose tracks analysis is cached are skipped, since tracks_descriptions does not
+    look at their tracks again. Classifying the unseen tracks up front with classify_track_batch
+    lets batches span playlists; tracks_descriptions then finds their analyses in the cache.
+
+    Returns:
+        list: (artist, track name, year) per unseen track, in playlist order
+    """
+    versions = track_versions(track_batch_size)
+    unseen_tracks = {}
+    for workout_json in workout_jsons:
+        video_id = workout_json.get('playlist', {}).get('id')
+        if cache_store.get(video_id, "tracks", versions[0]) is not None:
+            continue
+        for artist, track_name, year in playlist_tracks(workout_json):
+            track_id = track_cache_key(artist, track_name, year)
+            if track_id not in unseen_tracks and cached_track_analysis(cache_store, track_id, versions) is None:
+                unseen_tracks[track_id] = (artist, track_name, year)
+    return list(unseen_tracks.values())
+
+def classify_track_batch(tracks: list, openai_api_key: str, cache_dir: str = 'cache', cache_backend: str = 'json',
+                         enable_web_search: bool = True, browsers: int = BROWSER_POOL_SIZE, search_url: str = None,
+                         snippet_provider: str = 'browser', openai_base_url: str = None) -> int:
+    """
+    Classify tracks, possibly of different playlists, with one TRACK_BATCH_PROMPT call and cache them.
+
+    Args:
+        tracks (list): (artist, track name, year) per track, e.g. a slice of collect_unseen_tracks
+        openai_api_key (str): OpenAI API key
+        cache_dir (str): Directory to store cached data
+        cache_backend (str): 'json' or 'sqlite'
+        enable_web_search (bool): Whether to search the web for the tracks
+        browsers (int): Chrome drivers per process used for web search
+        search_url (str, optional): Search page to use instead of DuckDuckGo
+        snippet_provider (str): 'browser' (Chrome) or 'http'
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+
+    Returns:
+        int: Number of tracks classified
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_store = open_cache_store(cache_dir, cache_backend)
+    enriched_meta = enrich_tracks(tracks, enable_web_search, browsers, search_url, snippet_provider)
+    # Even a single leftover track is cached under the batch version, as tracks_descriptions reads it first
+    return len(classify_tracks(get_openai_client(openai_api_key, openai_base_url), cache_store, enriched_meta,
+                               max(len(tracks), 2)))
 
 def tracks_descriptions(workout_json: Dict[str, Any],
                         video_id: str,
                         enable_web_search: bool,
                         oai_client: Any,
-                        cache_dir: str,
-                        force_refresh: bool) -> Dict[str, Any]:
-    classifier = {
-        "cache_key": f"{video_id}_tracks_analysis.json",
-        "system_prompt": TRACK_PROMPT,
-        "user_prompt": TRACK_USER_PROMPT,
-        "response_format": TRACK_RESPONSE_FORMAT
-    }
+                        cache_store: Any,
+                        force_refresh: bool,
+                        browsers: int = BROWSER_POOL_SIZE,
+                        search_url: str = None,
+                        snippet_provider: str = 'browser',
+                        track_batch_size: int = 1) -> Dict[str, Any]:
+    versions = track_versions(track_batch_size)
+    analysis_version = versions[0]
+
+    if not force_refresh:
+        cached_analysis = cache_store.get(video_id, "tracks", analysis_version)
+        if cached_analysis is not None:
+            return cached_analysis
+
+    # Tracks analysed for any playlist before are reused; only unseen tracks are searched and classified
+    analysis = {}
+    unseen_tracks = {}
+    for artist, track_name, year in playlist_tracks(workout_json):
+        track_id = track_cache_key(artist, track_name, year)
+        cached_track = None
+        if not force_refresh:
+            cached_track = cached_track_analysis(cache_store, track_id, versions)
+        analysis[f"{artist}_{track_name}"] = cached_track
+        if cached_track is None:
+            unseen_tracks.setdefault(track_id, (artist, track_name, year))
+
+    enriched_meta = enrich_tracks(list(unseen_tracks.values()), enable_web_search, browsers, search_url,
+                                  snippet_provider)
+    analysis.update(classify_tracks(oai_client, cache_store, enriched_meta, track_batch_size))
+
+    # Tracks whose classification failed are left out, as before
+    analysis = {key: result for key, result in analysis.items() if result is not None}
+
+    cache_store.put(video_id, "tracks", analysis, analysis_version)
+    return analysis
 
-    cache_path = os.path.join(cache_dir, classifier["cache_key"])
-    if not force_refresh and os.path.exists(cache_path):
-        with open(cache_path, "r", encoding="utf-8") as f:
-            print(f"Loaded tracks enriched meta from {cache_path}")
-            return json.load(f)
+def run_track_batch_classifier(oai_client: Any, items: list) -> Dict[str, Any]:
+    """
+    Classify several tracks in one call with TRACK_BATCH_PROMPT.
 
-    items = workout_json.get("playlist", {}).get("tracks", {}).get("items", [])
-    basic_meta = [extract_track_details(item)[:3] for item in items]
+    Args:
+        oai_client: OpenAI client
+        items (list): Enriched track metadata with 'track_id' and 'text'
 
-    if enable_web_search:
-        try:
-            queries = [
-                f"{track_name} by {artist} {year} lyrics meaning genre bpm mood"
-                for artist, track_name, year in basic_meta
-            ]
-            queries = queries[:5]
-            snippets = collect_snippets_batch(queries, delay=.5)
-
-            enriched_meta = []
-            for (artist, track_name, year), snippet in zip(basic_meta, snippets):
-                enriched_meta.append({
-                    "key": f"{artist}_{track_name}",
-                    "text": f"Track: '{track_name}' by {artist} ({year})\nSnippet: {snippet}"
-                })
-        except:
-            enriched_meta = [
-            {
-                "key": f"{artist}_{track_name}",
-                "text": f"Track: '{track_name}' by {artist} ({year})"
-            }
-            for artist, track_name, year in basic_meta
-        ][:5]
-    else:
-        enriched_meta = [
-            {
-                "key": f"{artist}_{track_name}",
-                "text": f"Track: '{track_name}' by {artist} ({year})"
-            }
-            for artist, track_name, year in basic_meta
-        ][:5]
+    Returns:
+        dict: Per-track analysis (the TRACK_RESPONSE_FORMAT fields) keyed by track_id;
+        tracks missing from the response, or all of them if the call failed, are left out
+    """
+    # Short keys are copied back more reliably than artist and track names
+    keys = {str(i + 1): item["track_id"] for i, item in enumerate(items)}
+    meta = {"text": "\n\n".join(f"Key: {key}\n{item['text']}" for key, item in zip(keys, items))}
 
-    # One call per track
-    analysis = {}
-    for item in enriched_meta:
-        try:
-            result = run_classifier(
-                oai_client,
-                item,
-                classifier["system_prompt"],
-                classifier["user_prompt"],
-                classifier["response_format"]
-            )
-            analysis[item["key"]] = result
-        except Exception as e:
-            print(f"[Error] GPT classification failed for {item['key']}: {e}")
+    try:
+        result = run_classifier(oai_client, meta, TRACK_BATCH_PROMPT, TRACK_BATCH_USER_PROMPT,
+                                TRACK_BATCH_RESPONSE_FORMAT)
+    except Exception as e:
+        print(f"[Error] Batched GPT classification failed: {e}")
+        return {}
+    if "error" in result:
+        print(f"[Error] Batched GPT classification failed: {result['error']}")
+        return {}
+
+    analyses = {}
+    for track in result.get("tracks", []):
+        track_id = keys.get(str(track.pop("track_key", "")).strip())
+        if track_id is not None and track_id not in analyses:
+            analyses[track_id] = track
+    if len(analyses) < len(items):
+        print(f"[Warning] Batched GPT classification returned {len(analyses)} of {len(items)} tracks")
+    return analyses
+
+def track_cache_key(artist: str, track_name: str, year: str) -> str:
+    """
+    Key of a track in the global track cache, shared by all playlists.
 
-    cache_data(analysis, cache_path)
-    return analysis
+    Artist, track name and year are normalized (Unicode form, case, whitespace and
+    featured-artist suffixes), so the same recording listed slightly differently by
+    different playlists maps to one entry. The key is a hash, safe for cache file names.
+    """
+    def normalize(value):
+        value = unicodedata.normalize("NFKC", str(value)).casefold()
+        value = re.sub(r"[\(\[]\s*(feat|ft|featuring)\.?\s[^\)\]]*[\)\]]", " ", value)
+        return " ".join(value.split())
+
+    normalized = "|".join(normalize(value) for value in (artist, track_name, year))
+    return "track-" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:24]
 
 def format_tracks_meta(tracks_meta: Dict[str, Dict[str, Any]]) -> str:
     """
@@ -1,17 +1,30 @@
 import re
 
-import pandas as pd
 import csv
 import json
 import os
+import sys
 import argparse
 import time
 from tqdm import tqdm
 from multiprocessing import Pool
+from threading import BoundedSemaphore
+from collections import Counter
 from unified_workout_classifier import analyze_youtube_workout, extract_video_id, fetch_video_metadata
 from db_transformer import transform_to_db_structure
 from env_utils import load_api_keys
 
+# Modules shared by the pipelines live in workout_classifier_common at the repository root
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from workout_classifier_common.rate_limiter import SharedRateLimiter, init_worker_rate_limiter
+from workout_classifier_common.cache_store import SqliteCacheStore, SQLITE_CACHE_FILE
+from workout_classifier_common.result_writer import ResultWriter
+from workout_classifier_common.rule_engine import summarize_rule_decisions
+from workout_classifier_common.classifier_engine import summarize_execution_metrics
+
 
 def is_youtube_url(url):
     """Check if a URL is a YouTube video URL (not a playlist)."""
@@ -29,26 +42,73 @@ def is_youtube_url(url):
     return True
 
 
+# URLs read ahead of the pool; bounds the tasks held in memory
+MAX_QUEUED_WORKOUTS = 64
+
+
+def iter_workout_urls(input_csv_path, max_workouts=None, stats=None, skip_ids=None):
+    """
+    Stream the unique YouTube video URLs of a CSV file, row by row.
+
+    Every cell holding a YouTube video URL counts; URLs whose video ID was seen before are skipped.
+
+    Args:
+        input_csv_path (str): CSV file with YouTube URLs in any column
+        max_workouts (int, optional): Stop after this many unique URLs
+        stats (dict, optional): Receives the 'rows', 'found', 'unique' and 'skipped' counts
+        skip_ids (set, optional): Video IDs to skip, e.g. those already in a resumed output
+
+    Yields:
+        tuple: (video_id, url)
+    """
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, found=0, unique=0, skipped=0)
+    seen = set()
+    skip_ids = skip_ids or set()
+    csv.field_size_limit(sys.maxsize)
+    with open(input_csv_path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Header
+        for row in reader:
+            stats['rows'] += 1
+            for url in row:
+                if not is_youtube_url(url):
+                    continue
+                stats['found'] += 1
+                video_id = extract_video_id(url)
+                if not video_id or video_id in seen:
+                    continue
+                seen.add(video_id)
+                if video_id in skip_ids:
+                    stats['skipped'] += 1
+                    continue
+
+                stats['unique'] += 1
+                yield video_id, url
+                if max_workouts and stats['unique'] >= max_workouts:
+                    return
+
+
+def bounded_tasks(tasks, semaphore):
+    """Yield tasks, waiting for a free slot of semaphore before each one; release a slot per finished task."""
+    for task in tasks:
+        semaphore.acquire()
+        yield task
+
+
 def analyze_workout(args):
     """
     Process a single workout video URL - for multiprocessing pool.
 
     Args:
-        args (tuple): Contains (url, youtube_api_key, openai_api_key, enabled_features, process_id)
+        args (tuple): Contains (video_id, url, youtube_api_key, openai_api_key, cache_dir, enabled_features,
+                      process_id, execution_options)
 
     Returns:
         dict or None: Analysis results or None if failed
     """
-    url, youtube_api_key, openai_api_key, cache_dir, enabled_features, process_id = args
-
-    if not is_youtube_url(url):
-        print(f"Process {process_id}: Skipping invalid URL: {url}")
-        return None
-
-    video_id = extract_video_id(url)
-    if not video_id:
-        print(f"Process {process_id}: Could not extract video ID from URL: {url}")
-        return None
+    (video_id, url, youtube_api_key, openai_api_key, cache_dir, enabled_features, process_id,
+     execution_options) = args
 
     try:
         # Import YouTube API client to fetch metadata
@@ -75,7 +135,13 @@ def analyze_workout(args):
             enable_fitness_level=enabled_features['fitness_level'],
             enable_vibe=enabled_features['vibe'],
             enable_spirit=enabled_features['spirit'],
-            enable_equipment=enabled_features['equipment']
+            enable_equipment=enabled_features['equipment'],
+            enable_async=execution_options['async'],
+            max_concurrency=execution_options['max_concurrency'],
+            enable_combined=execution_options['combined'],
+            vibe_margin=execution_options['vibe_margin'],
+            cache_backend=execution_options['cache_backend'],
+            openai_base_url=execution_options['openai_base_url']
         )
 
         # Check if analysis was successful
@@ -85,6 +151,8 @@ def analyze_workout(args):
 
         # Add video_metadata to the result
         result['video_metadata'] = video_metadata
+        # Counted for the run summary, not part of the stored analysis
+        execution_metrics = result.pop('execution_metrics', {})
 
         # Transform to database structure
         db_structure = transform_to_db_structure(result)
@@ -119,7 +187,9 @@ def analyze_workout(args):
             'primary_effort_difficulty': db_structure.get('primary_effort_difficulty', ''),
             'secondary_effort_difficulty': db_structure.get('secondary_effort_difficulty', ''),
             'tertiary_effort_difficulty': db_structure.get('tertiary_effort_difficulty', ''),
-            'full_analysis_json': json.dumps(result, sort_keys=True, indent=2)
+            'full_analysis_json': json.dumps(result, sort_keys=True, indent=2),
+            'rule_decisions': result.get('rule_decisions', {}),
+            'execution_metrics': execution_metrics
         }
 
         print(f"Process {process_id}: Successfully analyzed workout: {video_id}")
@@ -130,55 +200,28 @@ def analyze_workout(args):
         return None
 
 
-def write_results_to_csv(results, output_csv_path):
-    """
-    Write analysis results to CSV file.
-    Filter out duplicates based on video_id (keeping the first occurrence).
-
-    Args:
-        results (list): List of analysis results
-        output_csv_path (str): Path to output CSV file
-    """
-    # Filter out None results (failed analyses)
-    valid_results = [r for r in results if r is not None]
-
-    # Deduplicate results based on video_id
-    unique_results = {}
-    for result in valid_results:
-        video_id = result.get('video_id')
-        if video_id and video_id not in unique_results:
-            unique_results[video_id] = result
-
-    # Write to output CSV
-    with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-        # Define field names for the CSV header
-        fieldnames = [
-            'video_id', 'video_url', 'video_title', 'channel_title', 'duration', 'duration_minutes',
-            'category', 'subcategory', 'secondary_category', 'secondary_subcategory',
-            'fitness_level', 'secondary_fitness_level', 'tertiary_fitness_level',
-            'primary_equipment', 'secondary_equipment', 'tertiary_equipment',
-            'primary_spirit', 'secondary_spirit',
-            'primary_vibe', 'secondary_vibe',
-            'reviewable', 'review_comment',
-            'primary_technique_difficulty', 'secondary_technique_difficulty', 'tertiary_technique_difficulty',
-            'primary_effort_difficulty', 'secondary_effort_difficulty', 'tertiary_effort_difficulty',
-            'full_analysis_json'
-        ]
-
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        # Write data rows
-        for result in unique_results.values():
-            writer.writerow(result)
-
-    return unique_results
+# Columns of the output CSV
+RESULT_FIELDNAMES = [
+    'video_id', 'video_url', 'video_title', 'channel_title', 'duration', 'duration_minutes',
+    'category', 'subcategory', 'secondary_category', 'secondary_subcategory',
+    'fitness_level', 'secondary_fitness_level', 'tertiary_fitness_level',
+    'primary_equipment', 'secondary_equipment', 'tertiary_equipment',
+    'primary_spirit', 'secondary_spirit',
+    'primary_vibe', 'secondary_vibe',
+    'reviewable', 'review_comment',
+    'primary_technique_difficulty', 'secondary_technique_difficulty', 'tertiary_technique_difficulty',
+    'primary_effort_difficulty', 'secondary_effort_difficulty', 'tertiary_effort_difficulty',
+    'full_analysis_json'
+]
 
 
 def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir,
                             max_workouts=None, num_processes=10,
                             enable_category=True, enable_fitness_level=True,
-                            enable_vibe=True, enable_spirit=True, enable_equipment=True):
+                            enable_vibe=True, enable_spirit=True, enable_equipment=True,
+                            enable_async=False, max_concurrency=5, enable_combined=False, vibe_margin=None,
+                            requests_per_minute=None, tokens_per_minute=None,
+                            cache_backend='json', import_cache=False, resume=False, openai_base_url=None):
     """
     Process YouTube workout URLs from a CSV file using multiprocessing.
 
@@ -192,6 +235,21 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir,
         enable_vibe (bool): Whether to analyze workout vibes
         enable_spirit (bool): Whether to analyze workout spirits
         enable_equipment (bool): Whether to analyze required equipment
+        enable_async (bool): Whether to run the classifiers of each video concurrently
+        max_concurrency (int): Maximum number of concurrent OpenAI requests per video in async mode
+        enable_combined (bool): Whether to classify each video with one combined OpenAI request
+        vibe_margin (float, optional): Top-1/top-2 similarity margin above which the vibe is taken from
+            embeddings instead of OpenAI; None always asks OpenAI
+        requests_per_minute (int, optional): OpenAI requests per minute shared by all processes
+        tokens_per_minute (int, optional): OpenAI tokens per minute shared by all processes
+        cache_backend (str): Where classifier results are cached: 'json' (one file per result) or 'sqlite'
+        import_cache (bool): Whether to import the JSON cache files into the SQLite cache before processing
+        resume (bool): Whether to keep the rows of an existing output and only analyze videos missing from it
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
+
+    Returns:
+        dict: Counts of the run: 'found', 'unique', 'skipped', 'processed', 'written', 'reviewable'
+              'rule_decisions' ((classifier, decision) -> count) and 'execution_metrics' (see classifier_engine.py)
     """
     start_time = time.time()
 
@@ -216,54 +274,20 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir,
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # Read the input CSV file
-    try:
-        df = pd.read_csv(input_csv_path)
-        print(f"Successfully read CSV file with {len(df)} rows")
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        return
-
-    # Convert column names to strings
-    df.columns = df.columns.astype(str)
-
-    # Get all columns
-    columns = df.columns.tolist()
-    if len(columns) < 1:
-        print(f"CSV file has insufficient columns: {columns}")
+    # URLs are streamed from the CSV into the pool while earlier ones are analysed
+    if not os.path.exists(input_csv_path):
+        print(f"Error reading CSV file: {input_csv_path} does not exist")
         return
 
-    # Collect YouTube URLs from all columns
-    all_urls = []
-    for _, row in df.iterrows():
-        for col in columns:
-            if is_youtube_url(str(row[col])):
-                all_urls.append(str(row[col]))
-
-    # Deduplicate URLs based on video_id
-    unique_urls = {}
-    for url in all_urls:
-        video_id = extract_video_id(url)
-        if video_id and video_id not in unique_urls:
-            unique_urls[video_id] = url
-
-    deduplicated_urls = list(unique_urls.values())
-
-    total_urls = len(all_urls)
-    unique_url_count = len(deduplicated_urls)
-    print(f"Found {total_urls} total YouTube URLs in the CSV")
-    print(f"After deduplication: {unique_url_count} unique URLs")
-
-    # Limit the number of workouts to process if specified
+    # Results are appended to the output as they arrive; a resumed run skips the videos already in it
+    result_writer = ResultWriter(output_csv_path, RESULT_FIELDNAMES, resume=resume)
+    if result_writer.resumed:
+        print(f"Resuming {output_csv_path}: {result_writer.resumed} videos already analyzed")
+    ingest_stats = {}
+    workout_urls = iter_workout_urls(input_csv_path, max_workouts, ingest_stats, skip_ids=set(result_writer.video_ids))
     if max_workouts and max_workouts > 0:
-        deduplicated_urls = deduplicated_urls[:max_workouts]
         print(f"Limited to processing {max_workouts} URLs")
 
-    # Check if we have more processes than URLs
-    actual_processes = min(num_processes, max(1, len(deduplicated_urls)))
-    if actual_processes != num_processes:
-        print(f"Using {actual_processes} processes for {len(deduplicated_urls)} URLs")
-
     # Set up enabled features dictionary
     enabled_features = {
         'category': enable_category,
@@ -273,67 +297,96 @@ def process_workouts_csv_mp(input_csv_path, output_csv_path, cache_dir,
         'equipment': enable_equipment
     }
 
-    # Create batches of URLs for each process
-    batch_size = len(deduplicated_urls) // actual_processes
-    if len(deduplicated_urls) % actual_processes != 0:
-        batch_size += 1
-
-    # Split URLs into batches
-    url_batches = []
-    for i in range(0, len(deduplicated_urls), batch_size):
-        batch = deduplicated_urls[i:i + batch_size]
-        url_batches.append(batch)
+    # Set up how classifiers are executed inside each worker
+    execution_options = {
+        'async': enable_async,
+        'max_concurrency': max_concurrency,
+        'combined': enable_combined,
+        'vibe_margin': vibe_margin,
+        'cache_backend': cache_backend,
+        'openai_base_url': openai_base_url
+    }
 
-    # Print batch information
-    print(f"Split {len(deduplicated_urls)} URLs into {len(url_batches)} batches")
+    # Move existing per-video JSON cache files into the SQLite cache
+    if cache_backend == 'sqlite' and import_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_store = SqliteCacheStore(os.path.join(cache_dir, SQLITE_CACHE_FILE))
+        imported = cache_store.import_json_dir(cache_dir)
+        cache_store.close()
+        print(f"Imported {imported} cached analyses into the SQLite cache")
+
+    # Tasks with a rotating process label; at most MAX_QUEUED_WORKOUTS wait for a worker at any time
+    queue_slots = BoundedSemaphore(MAX_QUEUED_WORKOUTS)
+    process_args = (
+        (video_id, url, youtube_api_key, openai_api_key, cache_dir, enabled_features, i % num_processes,
+         execution_options)
+        for i, (video_id, url) in enumerate(workout_urls)
+    )
 
-    # Prepare arguments for each process
-    process_args = []
-    for i, batch in enumerate(url_batches):
-        # Flatten the batch into individual tasks with process ID
-        for url in batch:
-            process_args.append((url, youtube_api_key, openai_api_key, cache_dir, enabled_features, i))
+    # Share one OpenAI rate limit budget between all processes
+    rate_limiter = None
+    if requests_per_minute or tokens_per_minute:
+        rate_limiter = SharedRateLimiter(requests_per_minute, tokens_per_minute)
+        print(f"Rate limiting OpenAI calls to {requests_per_minute or 'unlimited'} requests/min "
+              f"and {tokens_per_minute or 'unlimited'} tokens/min")
 
     # Process URLs in parallel using a pool with progress bar
-    print(f"Starting parallel processing with {actual_processes} processes")
+    print(f"Starting parallel processing with {num_processes} processes")
 
     # Add a global progress bar for all tasks
-    with tqdm(total=len(process_args), desc="Overall Progress") as pbar:
-        with Pool(processes=actual_processes) as pool:
-            # Use imap_unordered with tqdm for progress tracking
-            results = []
-            for result in pool.imap_unordered(analyze_workout, process_args):
-                results.append(result)
+    processed = 0
+    rule_decision_counts = Counter()
+    execution_metrics = Counter()
+    with result_writer, tqdm(total=max_workouts or None, desc="Overall Progress") as pbar:
+        with Pool(processes=num_processes, initializer=init_worker_rate_limiter,
+                  initargs=(rate_limiter,)) as pool:
+            # Use imap_unordered with tqdm for progress tracking; each result is written (deduplicated) right away
+            for result in pool.imap_unordered(analyze_workout, bounded_tasks(process_args, queue_slots)):
+                queue_slots.release()
+                result_writer.write(result)
+                processed += 1
+                for name, decision in ((result or {}).get('rule_decisions') or {}).items():
+                    rule_decision_counts[(name, decision)] += 1
+                execution_metrics.update((result or {}).get('execution_metrics') or {})
                 pbar.update(1)
 
     # Calculate total duration
     end_time = time.time()
     duration = end_time - start_time
 
-    # Write results to CSV (with deduplication)
-    print(f"Processing complete. Writing results to {output_csv_path}")
-    unique_results = write_results_to_csv(results, output_csv_path)
-
     # Count successful analyses
-    successful_analyses = len(unique_results)
+    successful_analyses = result_writer.written
 
     # Count reviewable/non-reviewable
-    reviewable_count = sum(1 for result in unique_results.values() if result.get('reviewable', False))
+    reviewable_count = result_writer.reviewable
     non_reviewable_count = successful_analyses - reviewable_count
 
     print(f"\nProcessing complete!")
-    print(f"Total URLs found: {total_urls}")
-    print(f"Unique URLs found: {unique_url_count}")
-    print(f"Processed URLs: {len(deduplicated_urls)}")
+    print(f"Total URLs found: {ingest_stats['found']}")
+    print(f"Unique URLs found: {ingest_stats['unique'] + ingest_stats['skipped']}")
+    if resume:
+        print(f"Skipped URLs already in the output: {ingest_stats['skipped']}")
+    print(f"Processed URLs: {processed}")
     print(f"Successful analyses: {successful_analyses}")
     print(f"Reviewable trainings: {reviewable_count}")
     print(f"Non-reviewable trainings: {non_reviewable_count}")
+    summarize_rule_decisions(rule_decision_counts)
+    summarize_execution_metrics(execution_metrics)
     print(f"Results saved to: {output_csv_path}")
     print(f"Total processing time: {duration:.2f} seconds")
-    if len(deduplicated_urls) > 0:
-        print(f"Average time per workout: {duration / len(deduplicated_urls):.2f} seconds")
-
-    return results  # Return results for potential further use
+    if processed > 0:
+        print(f"Average time per workout: {duration / processed:.2f} seconds")
+
+    return {
+        'found': ingest_stats['found'],
+        'unique': ingest_stats['unique'] + ingest_stats['skipped'],
+        'skipped': ingest_stats['skipped'],
+        'processed': processed,
+        'written': successful_analyses,
+        'reviewable': reviewable_count,
+        'rule_decisions': dict(rule_decision_counts),
+        'execution_metrics': dict(execution_metrics)
+    }
 
 
 if __name__ == "__main__":
@@ -366,6 +419,26 @@ if __name__ == "__main__":
                         help='Disable workout spirit analysis')
     parser.add_argument('--no-equipment', action='store_false', dest='equipment',
                         help='Disable required equipment analysis')
+    parser.add_argument('--async', action='store_true', dest='enable_async',
+                        help='Run the classifiers of each video concurrently')
+    parser.add_argument('--max-concurrency', type=int, default=5,
+                        help='Maximum number of concurrent OpenAI requests per video in async mode')
+    parser.add_argument('--combined', action='store_true', dest='enable_combined',
+                        help='Answer all classifiers of a video with one OpenAI request and a combined schema')
+    parser.add_argument('--vibe-margin', type=float, default=None,
+                        help='Take the vibe from embedding similarity when the best vibe beats the second by this margin (e.g. 0.05)')
+    parser.add_argument('--openai-base-url', type=str, default=None,
+                        help='OpenAI-compatible API base URL, e.g. a local mock server')
+    parser.add_argument('--rpm', type=int, default=None,
+                        help='OpenAI requests per minute shared by all processes')
+    parser.add_argument('--tpm', type=int, default=None,
+                        help='OpenAI tokens per minute shared by all processes')
+    parser.add_argument('--cache-backend', type=str, choices=['json', 'sqlite'], default='json',
+                        help='Cache classifier results as one JSON file each or in a single SQLite file')
+    parser.add_argument('--import-cache', action='store_true',
+                        help='Import existing JSON cache files into the SQLite cache before processing')
+    parser.add_argument('--resume', action='store_true',
+                        help='Keep the rows of an existing output file and only analyze videos missing from it')
 
     # Set default values for boolean arguments
     parser.set_defaults(category=True, fitness_level=True, vibe=True, spirit=True, equipment=True)
@@ -385,7 +458,16 @@ if __name__ == "__main__":
         enable_vibe=args.vibe,
         enable_spirit=args.spirit,
         enable_equipment=args.equipment,
+        enable_async=args.enable_async,
+        max_concurrency=args.max_concurrency,
+        enable_combined=args.enable_combined,
+        vibe_margin=args.vibe_margin,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        cache_backend=args.cache_backend,
+        import_cache=args.import_cache,
+        resume=args.resume,
+        openai_base_url=args.openai_base_url,
     )
 
-    # Cannot use results directly here as they are deduplicated in write_results_to_csv function
     print(f"\nProcess completed successfully!")
\ No newline at end of file
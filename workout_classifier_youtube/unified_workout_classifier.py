@@ -1,10 +1,7 @@
 from googleapiclient.discovery import build
-from openai import OpenAI, OpenAIError
 import json
 import os
-import re
-import time
-import random
+import sys
 from urllib.parse import urlparse, parse_qs
 import isodate  # For parsing ISO 8601 duration format
 
@@ -16,11 +13,30 @@ from spirit_classifier import SPIRIT_PROMPT, SPIRIT_USER_PROMPT, SPIRIT_RESPONSE
 from equipment_classifier import EQUIPMENT_PROMPT, EQUIPMENT_USER_PROMPT, EQUIPMENT_RESPONSE_FORMAT
 from db_transformer import transform_to_db_structure
 
+# Modules shared by the pipelines live in workout_classifier_common at the repository root
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from workout_classifier_common.cache_store import open_cache_store, classifier_fingerprint
+from workout_classifier_common.rule_engine import RuleEngine
+from workout_classifier_common.classifier_engine import CLASSIFIER_MODEL, ClassifierEngine, ClassifierSource
+from workout_classifier_common.vibe_preclassifier import get_vibe_preclassifier
+
+# Vibe definitions of this pipeline, embedded by the vibe pre-classifier
+VIBES_INFO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vibes_info.csv")
+
+# Classifiers answered or prefilled from the video metadata (title, tags, duration, ...), see rule_engine.py.
+# YouTube metadata carries no platform labels to map from yet, so every classifier goes to OpenAI
+YOUTUBE_RULES = RuleEngine([])
+
 
 def analyze_youtube_workout(youtube_url, youtube_api_key, openai_api_key,
                           cache_dir='cache', force_refresh=False,
                           enable_category=True, enable_fitness_level=True,
-                          enable_vibe=True, enable_spirit=True, enable_equipment=True):
+                          enable_vibe=True, enable_spirit=True, enable_equipment=True,
+                          enable_async=False, max_concurrency=5, enable_combined=False, cache_backend='json',
+                          vibe_margin=None, openai_base_url=None):
     """
     Analyzes a YouTube workout video and classifies it according to enabled dimensions:
     1. Category (e.g., Yoga, HIIT, Weight workout)
@@ -40,60 +56,25 @@ def analyze_youtube_workout(youtube_url, youtube_api_key, openai_api_key,
         enable_vibe (bool): Whether to classify workout by vibe
         enable_spirit (bool): Whether to classify workout by spirit
         enable_equipment (bool): Whether to identify required equipment
+        enable_async (bool): Whether to send all uncached classifier requests concurrently
+        max_concurrency (int): Maximum number of in-flight OpenAI requests in async mode
+        enable_combined (bool): Whether to answer all uncached classifiers with one request (see classifier_engine.py)
+        vibe_margin (float, optional): Answer the vibe classifier from embeddings when the best vibe beats the
+                                       second by this cosine similarity margin (see vibe_preclassifier.py)
+        cache_backend (str): Where classifier results are cached: 'json' (one file per result) or 'sqlite'
+        openai_base_url (str, optional): OpenAI-compatible API base URL, e.g. a local mock server
 
     Returns:
         dict: Combined workout analysis across all enabled dimensions
     """
-    # Initialize clients
-    try:
-        oai_client = OpenAI(api_key=openai_api_key)
-        youtube_client = build('youtube', 'v3', developerKey=youtube_api_key)
-    except Exception as e:
-        return {"error": f"Failed to initialize API clients: {str(e)}"}
-
-    # Extract video ID
-    video_id = extract_video_id(youtube_url)
-    if not video_id:
-        return {"error": "Invalid YouTube URL. Could not extract video ID."}
-
     # Ensure cache directory exists
     os.makedirs(cache_dir, exist_ok=True)
 
-    # Fetch or load metadata
-    metadata_cache_path = os.path.join(cache_dir, f"{video_id}_metadata.json")
-    if os.path.exists(metadata_cache_path) and not force_refresh:
-        try:
-            with open(metadata_cache_path, 'r') as f:
-                metadata = json.load(f)
-            print(f"Loaded metadata from cache: {metadata_cache_path}")
-        except Exception as e:
-            print(f"Error loading cached metadata: {str(e)}. Fetching fresh metadata.")
-            metadata = fetch_video_metadata(youtube_client, video_id)
-            cache_data(metadata, metadata_cache_path)
-    else:
-        metadata = fetch_video_metadata(youtube_client, video_id)
-        cache_data(metadata, metadata_cache_path)
-
-    # Format metadata for analysis
-    formatted_metadata = format_metadata_for_analysis(metadata)
-
-    # Initialize combined analysis
-    combined_analysis = {
-        "video_id": video_id,
-        "video_url": youtube_url,
-        "video_title": metadata.get('title', ''),
-        "channel_title": metadata.get('channelTitle', ''),
-        "duration": metadata.get('durationFormatted', ''),
-        "duration_minutes": round(metadata.get('duration', 0) / 60, 1),  # Convert seconds to minutes
-        "reviewable": True  # Default to reviewable unless errors occur
-    }
-
     # Define classifier configurations
     classifiers = [
         {
             "name": "category",
             "enabled": enable_category,
-            "cache_key": f"{video_id}_category_analysis.json",
             "system_prompt": CATEGORY_PROMPT,
             "user_prompt": CATEGORY_USER_PROMPT,
             "response_format": CATEGORY_RESPONSE_FORMAT
@@ -101,7 +82,6 @@ def analyze_youtube_workout(youtube_url, youtube_api_key, openai_api_key,
         {
             "name": "fitness_level",
             "enabled": enable_fitness_level,
-            "cache_key": f"{video_id}_fitness_level_analysis.json",
             "system_prompt": FITNESS_LEVEL_PROMPT,
             "user_prompt": FITNESS_LEVEL_USER_PROMPT,
             "response_format": FITNESS_LEVEL_RESPONSE_FORMAT
@@ -109,7 +89,6 @@ def analyze_youtube_workout(youtube_url, youtube_api_key, openai_api_key,
         {
             "name": "equipment",
             "enabled": enable_equipment,
-            "cache_key": f"{video_id}_equipment_analysis.json",
             "system_prompt": EQUIPMENT_PROMPT,
             "user_prompt": EQUIPMENT_USER_PROMPT,
             "response_format": EQUIPMENT_RESPONSE_FORMAT
@@ -117,7 +96,6 @@ def analyze_youtube_workout(youtube_url, youtube_api_key, openai_api_key,
         {
             "name": "spirit",
             "enabled": enable_spirit,
-            "cache_key": f"{video_id}_spirit_analysis.json",
             "system_prompt": SPIRIT_PROMPT,
             "user_prompt": SPIRIT_USER_PROMPT,
             "response_format": SPIRIT_RESPONSE_FORMAT
@@ -125,80 +103,105 @@ def analyze_youtube_workout(youtube_url, youtube_api_key, openai_api_key,
         {
             "name": "vibe",
             "enabled": enable_vibe,
-            "cache_key": f"{video_id}_vibe_analysis.json",
             "system_prompt": VIBE_PROMPT,
             "user_prompt": VIBE_USER_PROMPT,
             "response_format": VIBE_RESPONSE_FORMAT
         }
     ]
+    for classifier in classifiers:
+        classifier["prompt_version"] = classifier_fingerprint(
+            classifier["system_prompt"],
+            classifier["user_prompt"],
+            classifier["response_format"],
+            CLASSIFIER_MODEL
+        )
 
-    # Flag to track if any classifier had an error
-    has_errors = False
-    review_comments = []
-
-    # Run each enabled classifier
+    # Initialize clients
     try:
-        for classifier in classifiers:
-            if not classifier["enabled"]:
-                continue
-
-            name = classifier["name"]
-            cache_path = os.path.join(cache_dir, classifier["cache_key"])
-
-            # Check for cached analysis
-            if os.path.exists(cache_path) and not force_refresh:
-                try:
-                    with open(cache_path, 'r') as f:
-                        analysis = json.load(f)
-                    print(f"Loaded {name} analysis from cache: {cache_path}")
-                except Exception as e:
-                    print(f"Error loading cached {name} analysis: {str(e)}. Running fresh analysis.")
-                    analysis = run_classifier(
-                        oai_client,
-                        formatted_metadata,
-                        classifier["system_prompt"],
-                        classifier["user_prompt"],
-                        classifier["response_format"]
-                    )
-                    cache_data(analysis, cache_path)
-            else:
-                analysis = run_classifier(
-                    oai_client,
-                    formatted_metadata,
-                    classifier["system_prompt"],
-                    classifier["user_prompt"],
-                    classifier["response_format"]
-                )
-                cache_data(analysis, cache_path)
-
-            # Check for errors in the classifier result
-            if "error" in analysis:
-                has_errors = True
-                error_message = f"Error in {name} classifier: {analysis.get('error')}"
-                review_comments.append(error_message)
-
-                # Add review comment tag if present
-                if "review_comment" in analysis:
-                    if analysis["review_comment"] not in review_comments:
-                        review_comments.append(analysis["review_comment"])
-
-            combined_analysis[name] = analysis
-
-        # Update reviewable status based on errors
-        if has_errors:
-            combined_analysis["reviewable"] = False
-            combined_analysis["review_comment"] = "; ".join(review_comments)
-
-        return combined_analysis
-
+        youtube_client = build('youtube', 'v3', developerKey=youtube_api_key)
+        preclassifiers = {}
+        if enable_vibe and vibe_margin is not None:
+            try:
+                preclassifiers["vibe"] = get_vibe_preclassifier(openai_api_key, VIBES_INFO_PATH, openai_base_url,
+                                                                cache_dir=cache_dir, margin=vibe_margin)
+            except Exception as e:
+                # Without prototypes every workout asks the LLM, as without --vibe-margin
+                print(f"Vibe pre-classifier unavailable, asking the LLM: {str(e)}")
+        engine = ClassifierEngine(
+            YouTubeSource(youtube_client, cache_dir, force_refresh),
+            classifiers,
+            open_cache_store(cache_dir, cache_backend),
+            openai_api_key,
+            openai_base_url=openai_base_url,
+            force_refresh=force_refresh,
+            enable_async=enable_async,
+            max_concurrency=max_concurrency,
+            combined=enable_combined,
+            preclassifiers=preclassifiers
+        )
     except Exception as e:
-        error_message = f"Failed to perform combined analysis: {str(e)}"
+        return {"error": f"Failed to initialize API clients: {str(e)}"}
+
+    return engine.analyze(youtube_url)
+
+
+class YouTubeSource(ClassifierSource):
+    """YouTube video URLs for the classifier engine; the metadata comes from the YouTube Data API."""
+
+    rules = YOUTUBE_RULES
+
+    def __init__(self, youtube_client, cache_dir='cache', force_refresh=False):
+        self.youtube_client = youtube_client
+        self.cache_dir = cache_dir
+        self.force_refresh = force_refresh
+
+    def fetch(self, youtube_url):
+        # Extract video ID
+        video_id = extract_video_id(youtube_url)
+        if not video_id:
+            raise ValueError("Invalid YouTube URL. Could not extract video ID.")
+
+        # Fetch or load metadata
+        metadata_cache_path = os.path.join(self.cache_dir, f"{video_id}_metadata.json")
+        if os.path.exists(metadata_cache_path) and not self.force_refresh:
+            try:
+                with open(metadata_cache_path, 'r') as f:
+                    metadata = json.load(f)
+                print(f"Loaded metadata from cache: {metadata_cache_path}")
+            except Exception as e:
+                print(f"Error loading cached metadata: {str(e)}. Fetching fresh metadata.")
+                metadata = fetch_video_metadata(self.youtube_client, video_id)
+                cache_data(metadata, metadata_cache_path)
+        else:
+            metadata = fetch_video_metadata(self.youtube_client, video_id)
+            cache_data(metadata, metadata_cache_path)
+
+        return {**metadata, "video_id": video_id, "video_url": youtube_url}
+
+    def item_id(self, metadata):
+        return metadata["video_id"]
+
+    def format(self, metadata):
+        return format_metadata_for_analysis(metadata)
+
+    def describe(self, metadata, formatted_metadata):
+        return {
+            "video_id": metadata["video_id"],
+            "video_url": metadata["video_url"],
+            "video_title": metadata.get('title', ''),
+            "channel_title": metadata.get('channelTitle', ''),
+            "duration": metadata.get('durationFormatted', ''),
+            "duration_minutes": round(metadata.get('duration', 0) / 60, 1),  # Convert seconds to minutes
+            "reviewable": True  # Default to reviewable unless errors occur
+        }
+
+    def error_analysis(self, error_message, metadata):
         return {
             "error": error_message,
             "reviewable": False,
             "review_comment": "processing_error",
-            "video_id": video_id,
-            "video_url": youtube_url,
+            "video_id": metadata["video_id"],
+            "video_url": metadata["video_url"],
             "video_title": metadata.get('title', ''),
             "channel_title": metadata.get('channelTitle', ''),
             "duration": metadata.get('durationFormatted', '')
@@ -365,160 +368,3 @@ def format_metadata_for_analysis(metadata):
             sections.append(f"{i}. {comment}")
 
     return "\n".join(sections)
-
-
-def run_classifier(oai_client, formatted_metadata, system_prompt, user_prompt, response_format, max_retries=3):
-    """
-    Generic function to run a classifier through OpenAI API with improved error handling.
-
-    Args:
-        oai_client: OpenAI client
-        formatted_metadata: Formatted video metadata
-        system_prompt: System prompt for the classifier
-        user_prompt: User prompt for the classifier
-        response_format: Expected response format
-        max_retries: Maximum number of retry attempts for API and parsing issues
-
-    Returns:
-        dict: Classification results or error information
-    """
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"{user_prompt}\n\n{formatted_metadata}"}
-    ]
-
-    # JSON parsing retries counter
-    parsing_retries = 0
-    # Timeout retries counter
-    timeout_retry_count = 0
-
-    while parsing_retries < max_retries:
-        try:
-            # Try to get response from OpenAI with rate limit handling
-            api_response = openai_call_with_retry(oai_client, "gpt-4o", messages, response_format)
-
-            # If we got here, the API call was successful
-            return api_response
-
-        except json.JSONDecodeError as json_error:
-            # Handle JSON parsing errors specifically
-            parsing_retries += 1
-            print(f"JSON parsing error (attempt {parsing_retries}/{max_retries}): {str(json_error)}")
-
-            # If we've reached max retries, return an error
-            if parsing_retries >= max_retries:
-                return {
-                    "error": f"JSON parsing error after {max_retries} attempts: {str(json_error)}",
-                    "review_comment": "json_parsing_error"
-                }
-
-            # Wait a short time before retrying
-            time.sleep(1)
-
-        except OpenAIError as api_error:
-            error_str = str(api_error)
-
-            # Check if it's a timeout error
-            if "timed out" in error_str.lower():
-                timeout_retry_count += 1
-                if timeout_retry_count <= max_retries:
-                    print(f"Request timed out. Retrying ({timeout_retry_count}/{max_retries})...")
-                    # Exponential backoff for timeouts
-                    time.sleep(2 ** timeout_retry_count)
-                    continue
-                else:
-                    return {
-                        "error": f"OpenAI API error: Request timed out after {max_retries} retries.",
-                        "review_comment": "timeout_error"
-                    }
-
-            # Check if it's a rate limit error
-            elif "rate_limit_exceeded" in error_str or "Rate limit reached" in error_str:
-                return {
-                    "error": f"Rate limit error: {str(api_error)}",
-                    "review_comment": "rate_limit_error"
-                }
-            else:
-                # For other OpenAI errors, don't retry
-                return {
-                    "error": f"OpenAI API error: {str(api_error)}",
-                    "review_comment": "processing_error"
-                }
-
-        except Exception as e:
-            # For any other exceptions
-            return {
-                "error": f"Error with classifier: {str(e)}",
-                "review_comment": "processing_error"
-            }
-
-    # This should not be reached but just in case
-    return {
-        "error": "Unexpected error in classifier",
-        "review_comment": "processing_error"
-    }
-
-
-def openai_call_with_retry(oai_client, model, messages, response_format):
-    """
-    Helper function to make OpenAI API calls with retry for rate limits.
-    Now properly propagates JSON parsing errors and timeout errors to the calling function.
-    """
-    # Maximum number of retries for rate limits
-    max_retries = 5
-    # Initial retry delay in seconds
-    retry_delay = 2
-
-    for retry_attempt in range(max_retries):
-        try:
-            response = oai_client.chat.completions.create(
-                model=model,
-                response_format=response_format,
-                messages=messages
-            )
-
-            # Get the response content
-            response_content = response.choices[0].message.content
-
-            # Let JSON parsing errors propagate to caller for handling
-            parsed_response = json.loads(response_content)
-            return parsed_response
-
-        except json.JSONDecodeError as json_error:
-            # Propagate JSON parsing errors to caller
-            raise json_error
-
-        except OpenAIError as e:
-            error_str = str(e)
-
-            # Check if it's a timeout error, propagate it to caller for dedicated retry logic
-            if "timed out" in error_str.lower():
-                raise e
-
-            # Check if it's a rate limit error
-            elif "rate_limit_exceeded" in error_str or "Rate limit reached" in error_str:
-                # Try to extract suggested wait time if available
-                wait_time_match = re.search(r'try again in (\d+\.\d+)s', error_str)
-
-                if wait_time_match:
-                    # Use the recommended wait time from the error message
-                    wait_time = float(wait_time_match.group(1))
-                    # Add a small buffer to ensure we're past the rate limit window
-                    wait_time += 0.5
-                else:
-                    # Use exponential backoff with jitter
-                    wait_time = retry_delay * (2 ** retry_attempt) + random.uniform(0, 1)
-
-                print(
-                    f"Rate limit reached. Waiting for {wait_time:.2f} seconds before retry ({retry_attempt + 1}/{max_retries})...")
-                time.sleep(wait_time)
-
-                # If this is the last retry attempt, raise the error
-                if retry_attempt == max_retries - 1:
-                    raise OpenAIError(f"Rate limit error after {max_retries} retries: {str(e)}")
-            else:
-                # If it's not a rate limit error, don't retry
-                raise OpenAIError(f"OpenAI API error: {str(e)}")
-
-    # This should only happen if we exhaust all retries
-    raise Exception("Failed after maximum retry attempts")
\ No newline at end of file
@@ -1,11 +1,33 @@
 import json
+import os
+import sys
 import csv
 import time
+import random
 import argparse
 from pathlib import Path
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, APIStatusError
 from env_utils import load_api_keys
-import os
+
+# Modules shared by the pipelines live in workout_classifier_common at the repository root
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from workout_classifier_common.embedding_store import save_embedding_matrix, write_embedding_cache, read_embedding_cache, EMBEDDING_DTYPES
+from workout_classifier_common.classifier_engine import (get_error_kind, get_rate_limit_wait_time, RETRYABLE_ERRORS,
+                                                         MAX_ATTEMPTS, MAX_RATE_LIMIT_RETRIES, RETRY_DELAY)
+from workout_classifier_common.vibe_preclassifier import MAX_EMBEDDING_CHARS
+
+# Embedding model used for all workouts
+EMBEDDING_MODEL = "text-embedding-3-large"
+# Inputs per embeddings request (the API accepts up to 2048)
+EMBEDDING_BATCH_SIZE = 256
+# Estimated tokens per embeddings request (the API accepts up to 300k)
+EMBEDDING_BATCH_TOKENS = 100000
+# Embeddings requests in flight at the same time
+EMBEDDING_CONCURRENCY = 4
 
 
 def load_vibes_info(csv_path='src/vibes_info.csv'):
@@ -120,15 +142,113 @@ def create_workout_description(workout, vibes_info):
 
 def generate_embedding(client, text):
     """Generate an embedding for the given text using OpenAI's API."""
-    try:
-        response = client.embeddings.create(
-            model="text-embedding-3-large",  # Using a more powerful embedding model
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Error generating embedding: {str(e)}")
-        return None
+    return generate_embeddings(client, [text])[0]
+
+
+def generate_embeddings(client, texts, max_retries=MAX_RATE_LIMIT_RETRIES, retry_delay=RETRY_DELAY):
+    """
+    Generate embeddings for several texts with one API request.
+
+    Errors are handled like classifier requests (see classifier_engine.plan_retry): rate limits
+    wait and retry, timeouts, connection and server errors are retried with backoff. A request
+    the API rejects (4xx) is split in halves, so only the inputs it rejects come back as None.
+    Texts longer than MAX_EMBEDDING_CHARS are truncated to fit the model's input limit.
+
+    Returns:
+        list: One embedding per text, in input order; None where the text could not be embedded
+    """
+    texts = [text[:MAX_EMBEDDING_CHARS] for text in texts]
+    rate_limit_waits = 0
+    attempts = 1
+    while True:
+        try:
+            response = client.embeddings.create(
+                model=EMBEDDING_MODEL,  # Using a more powerful embedding model
+                input=texts
+            )
+            # The API returns one item per input, tagged with its index
+            embeddings = [None] * len(texts)
+            for item in response.data:
+                embeddings[item.index] = item.embedding
+            return embeddings
+        except Exception as e:
+            error_str = str(e)
+            kind = get_error_kind(e)
+            if kind == "rate_limit_error" and rate_limit_waits < max_retries:
+                wait_time = get_rate_limit_wait_time(error_str, rate_limit_waits, retry_delay)
+                rate_limit_waits += 1
+                print(f"Rate limit reached. Waiting for {wait_time:.2f} seconds before retry "
+                      f"({rate_limit_waits}/{max_retries})...")
+                time.sleep(wait_time)
+                continue
+            if kind in RETRYABLE_ERRORS and attempts < MAX_ATTEMPTS:
+                wait_time = retry_delay * (2 ** (attempts - 1)) + random.uniform(0, 1)
+                print(f"Embeddings request failed with {kind} (attempt {attempts}/{MAX_ATTEMPTS}): {error_str}. "
+                      f"Retrying in {wait_time:.2f} seconds...")
+                attempts += 1
+                time.sleep(wait_time)
+                continue
+            if (isinstance(e, APIStatusError) and 400 <= e.status_code < 500 and e.status_code != 429
+                    and len(texts) > 1):
+                # One bad input rejects the whole request; bisect to embed the others
+                middle = len(texts) // 2
+                print(f"Embeddings request of {len(texts)} texts rejected ({e.status_code}), splitting it")
+                return (generate_embeddings(client, texts[:middle], max_retries, retry_delay)
+                        + generate_embeddings(client, texts[middle:], max_retries, retry_delay))
+            print(f"Error generating embeddings: {error_str}")
+            return [None] * len(texts)
+
+
+def estimate_tokens(text):
+    """Rough token count of a text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def make_embedding_batches(texts, max_inputs=EMBEDDING_BATCH_SIZE, max_tokens=EMBEDDING_BATCH_TOKENS):
+    """
+    Split texts into batches bounded by number of inputs and estimated tokens.
+
+    Returns:
+        list: Batches as lists of indices into texts
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text[:MAX_EMBEDDING_CHARS])
+        if batch and (len(batch) >= max_inputs or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def embed_texts(client, texts, max_inputs=EMBEDDING_BATCH_SIZE, max_tokens=EMBEDDING_BATCH_TOKENS,
+                concurrency=EMBEDDING_CONCURRENCY):
+    """
+    Embed many texts with batched requests, running up to `concurrency` requests at a time.
+
+    Returns:
+        list: One embedding per text, in input order; None where the request failed
+    """
+    embeddings = [None] * len(texts)
+    batches = make_embedding_batches(texts, max_inputs, max_tokens)
+    print(f"Generating {len(texts)} embeddings in {len(batches)} batches")
+
+    def run_batch(batch):
+        return batch, generate_embeddings(client, [texts[i] for i in batch])
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for done, (batch, batch_embeddings) in enumerate(executor.map(run_batch, batches), start=1):
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+            print(f"Embedded batch {done}/{len(batches)} ({len(batch)} texts)")
+
+    return embeddings
 
 
 def is_cache_valid(cache_data, workout, vibes_info):
@@ -174,6 +294,20 @@ def main():
                         help='Path to CSV file with vibes information')
     parser.add_argument('--cache-dir', type=str, default=cache_dir,
                         help='Directory for caching embeddings')
+    parser.add_argument('--batch-size', type=int, default=EMBEDDING_BATCH_SIZE,
+                        help='Maximum number of workouts per embeddings request')
+    parser.add_argument('--batch-tokens', type=int, default=EMBEDDING_BATCH_TOKENS,
+                        help='Maximum estimated tokens per embeddings request')
+    parser.add_argument('--concurrency', type=int, default=EMBEDDING_CONCURRENCY,
+                        help='Number of embeddings requests sent at the same time')
+    parser.add_argument('--embeddings-npy', type=str, default=None,
+                        help='Path to the .npy embedding matrix (default: output path with .npy extension)')
+    parser.add_argument('--embeddings-dtype', type=str, choices=EMBEDDING_DTYPES, default='float32',
+                        help='Dtype of the .npy embedding matrix and cache files')
+    parser.add_argument('--cache-format', type=str, choices=['json', 'npy'], default='json',
+                        help='Cache embeddings as JSON float lists or as .npy files')
+    parser.add_argument('--no-csv-embedding', action='store_false', dest='csv_embedding',
+                        help='Do not write the embedding column to the output CSV, only the .npy matrix')
     args = parser.parse_args()
 
     # Load API keys
@@ -199,8 +333,10 @@ def main():
         # Preserve all column names from the input CSV
         fieldnames = reader.fieldnames.copy() if reader.fieldnames else []
         # Add embedding column if it doesn't exist
-        if 'embedding' not in fieldnames:
+        if 'embedding' not in fieldnames and args.csv_embedding:
             fieldnames.append('embedding')
+        elif 'embedding' in fieldnames and not args.csv_embedding:
+            fieldnames.remove('embedding')
         if 'embedding_source' not in fieldnames:
             fieldnames.append('embedding_source') 
         workouts = list(reader)
@@ -212,23 +348,25 @@ def main():
     cached_embeddings = 0
     failed_embeddings = 0
 
+    # Embedding of every row, for the .npy matrix
+    row_embeddings = {}
+
+    # Use cached embeddings where valid and collect the cache misses
+    pending = []
     for i, workout in enumerate(workouts):
         video_id = workout.get('video_id')
         if not video_id:
             continue
 
-        # Check if cache file exists
-        cache_file = cache_dir / f"{video_id}.json"
         cache_data = None
         # Create description with vibes info
         description = create_workout_description(workout, vibes_info)
 
 
         # Load cache if it exists
-        if cache_file.exists() and not args.force_refresh:
+        if not args.force_refresh:
             try:
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
+                cache_data = read_embedding_cache(cache_dir, video_id)
             except json.JSONDecodeError:
                 print(f"Cache file for {video_id} is corrupted, will regenerate.")
                 cache_data = None
@@ -236,35 +374,38 @@ def main():
         # Check if cache is valid
         if cache_data and is_cache_valid(cache_data, workout, vibes_info) and not args.force_refresh:
             print(f"Processing workout {i + 1}/{len(workouts)}: {video_id} (using cached embedding)")
-            embedding = cache_data.get('embedding')
             cached_embeddings += 1
+
+            # Add embedding to workout data
+            row_embeddings[i] = cache_data.get('embedding')
+            if args.csv_embedding:
+                workout['embedding'] = json.dumps(cache_data.get('embedding'))
+            workout['embedding_source'] = description
         else:
-            # Generate new embedding
-            print(f"Processing workout {i + 1}/{len(workouts)}: {video_id} (generating new embedding)")
-
-            # Generate embedding
-            embedding = generate_embedding(client, description)
-            if not embedding:
-                print(f"Skipping workout {video_id} due to embedding error.")
-                failed_embeddings += 1
-                continue
+            pending.append((i, workout, description))
 
-            # Save to cache
-            cache_data = {
-                "video_id": video_id,
-                "description": description,
-                "embedding": embedding
-            }
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+    # Generate the missing embeddings in batches
+    embeddings = embed_texts(client, [description for _, _, description in pending],
+                             max_inputs=args.batch_size, max_tokens=args.batch_tokens,
+                             concurrency=args.concurrency) if pending else []
 
-            new_embeddings += 1
+    for (i, workout, description), embedding in zip(pending, embeddings):
+        video_id = workout.get('video_id')
+        if not embedding:
+            print(f"Skipping workout {video_id} due to embedding error.")
+            failed_embeddings += 1
+            continue
 
-            # Sleep briefly to avoid rate limits
-            time.sleep(0.1)
+        # Save to cache
+        write_embedding_cache(cache_dir, video_id, description, embedding,
+                              cache_format=args.cache_format, dtype=args.embeddings_dtype)
+
+        new_embeddings += 1
 
         # Add embedding to workout data
-        workout['embedding'] = json.dumps(embedding)
+        row_embeddings[i] = embedding
+        if args.csv_embedding:
+            workout['embedding'] = json.dumps(embedding)
         workout['embedding_source'] = description
 
     # Create output directory if it doesn't exist
@@ -273,15 +414,24 @@ def main():
 
     # Save workouts with embeddings to CSV
     with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
         writer.writeheader()
         writer.writerows(workouts)
 
+    # Save embeddings as one matrix, rows in CSV order
+    embeddings_npy = args.embeddings_npy or str(output_path.with_suffix('.npy'))
+    embedded_rows = sorted(row_embeddings)
+    save_embedding_matrix(embeddings_npy,
+                          [workouts[i].get('video_id') for i in embedded_rows],
+                          [row_embeddings[i] for i in embedded_rows],
+                          dtype=args.embeddings_dtype)
+
     print(f"Successfully processed {len(workouts) - failed_embeddings} workouts.")
     print(f"  - {new_embeddings} new embeddings generated")
     print(f"  - {cached_embeddings} embeddings loaded from cache")
     print(f"  - {failed_embeddings} embeddings failed")
     print(f"Workouts with embeddings saved to {args.output}")
+    print(f"Embedding matrix saved to {embeddings_npy}")
 
 
 if __name__ == "__main__":